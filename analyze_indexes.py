@@ -0,0 +1,261 @@
+"""Check the query plans of the app's real SQL workload
+
+Builds a throwaway database (removed afterwards) with generate_dataset.py:
+several tutors, hundreds of students each, two closed months of attendance
+plus the current one and homework. It then requests every page and JSON
+endpoint as the largest tutor and one of their students (the workload of
+benchmark_routes.py), recording each SQL
+statement the blueprints and utils run (with the file and line it came from).
+Every distinct statement is explained with EXPLAIN QUERY PLAN and flagged when
+SQLite has to
+
+- SCAN a table (read every row) instead of searching an index, or
+- USE TEMP B-TREE (sort or de-duplicate rows after reading them).
+
+The workload runs twice: with the indexes the app shipped before
+database.INDEXES (LEGACY_INDEXES below) and with database.add_indexes(). The
+report lists the statements still flagged, then side by side the flag counts,
+the time of each read statement whose plan changed (re-run on its own, so
+template rendering does not hide it) and the request times.
+
+Usage:
+    python3 analyze_indexes.py
+    python3 analyze_indexes.py --students 500 --repeat 10 --all
+"""
+import argparse
+import contextlib
+import io
+import os
+import re
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# add_indexes() before the workload-driven set
+LEGACY_INDEXES = {
+    'idx_students_user_id': 'students(user_id)',
+    'idx_students_batch_id': 'students(batch_id)',
+    'idx_students_phone': 'students(phone)',
+    'idx_attendance_user_id': 'attendance(user_id)',
+    'idx_attendance_student_id': 'attendance(student_id)',
+    'idx_attendance_date': 'attendance(date)',
+    'idx_attendance_user_date': 'attendance(user_id, date)',
+    'idx_batches_user_id': 'batches(user_id)',
+    'idx_homework_user_id': 'homework(user_id)',
+    'idx_homework_batch_id': 'homework(batch_id)',
+    'idx_homework_student_id': 'homework(student_id)',
+    'idx_homework_submission_date': 'homework(submission_date)',
+    'idx_homework_file_path': 'homework(file_path)',
+    'idx_users_mobile': 'users(mobile)',
+}
+
+
+class StatementLog:
+    """Records statements run on connections from database.get_db_connection() with their caller"""
+
+    def __init__(self):
+        self.statements = {}  # normalized SQL -> {'sql', 'sources', 'count'}
+        self.recording = False
+
+    def __call__(self, sql):
+        if not self.recording or sql.startswith('--') or sql.lstrip().upper().startswith(('PRAGMA', 'BEGIN',
+                                                                                            'COMMIT')):
+            return
+        key = normalize(sql)
+        entry = self.statements.setdefault(key, {'sql': sql, 'sources': set(), 'count': 0})
+        entry['count'] += 1
+        entry['sources'].add(caller())
+
+    def install(self, database_module):
+        connect = sqlite3.connect
+
+        def tracing_connect(*args, **kwargs):
+            conn = connect(*args, **kwargs)
+            conn.set_trace_callback(self)
+            return conn
+
+        # database.py sees sqlite3 with only connect() replaced
+        proxy = types.SimpleNamespace(**{name: getattr(sqlite3, name) for name in dir(sqlite3)
+                                         if not name.startswith('__')})
+        proxy.connect = tracing_connect
+        database_module.sqlite3 = proxy
+
+
+def caller():
+    """'path:line' of the innermost app frame (outside database.py) that ran the statement"""
+    frame = sys._getframe(2)
+    while frame:
+        path = frame.f_code.co_filename
+        if path.startswith(ROOT) and not path.endswith(('database.py', 'analyze_indexes.py')):
+            return f'{os.path.relpath(path, ROOT)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return '?'
+
+
+def normalize(sql):
+    """Statement shape with literals replaced, so the same query with other values is counted once"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\(\s*\?(\s*,\s*\?)+\s*\)', '(?...)', sql)
+    return ' '.join(sql.split())
+
+
+def explain(cursor, sql):
+    """(plan lines, flags) for a statement; no flags for statements without a plan"""
+    try:
+        plan = [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()]
+    except sqlite3.Error as e:
+        return [f'(not explained: {e})'], []
+    flags = []
+    for line in plan:
+        if line.startswith('SCAN ') and not line.startswith('SCAN CONSTANT ROW'):
+            flags.append(line)
+        elif 'TEMP B-TREE' in line:
+            flags.append(line)
+    return plan, flags
+
+
+def time_statement(cursor, sql, repeat):
+    """Fastest of ``repeat`` runs of a read statement in ms; None for writes"""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    best = float('inf')
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        cursor.execute(sql).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run(app, get_db_connection, log, repeat):
+    """Run the largest tenant's workload (see benchmark_routes.py); returns {label: median ms}"""
+    from benchmark_routes import login_clients, pick_tenants, route_requests
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    tutor, student, requests = route_requests(app, cursor, pick_tenants(cursor, 1)[0])
+    conn.close()
+    clients = login_clients(app, tutor, student)
+
+    timings = {}
+    for label, kind, method, url, body in requests:
+        samples = []
+        for attempt in range(repeat + 1):
+            log.recording = attempt == 0
+            start = time.perf_counter()
+            response = clients[kind].open(url, method=method, json=body)
+            samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 500:
+                print(f"   Warning: {method} {url} returned {response.status_code}")
+        log.recording = False
+        timings[label] = statistics.median(samples[1:]) if repeat else samples[0]
+    return timings
+
+
+def set_indexes(conn, legacy):
+    """Switch the database between the legacy index set and database.add_indexes()"""
+    import database
+
+    cursor = conn.cursor()
+    if legacy:
+        for name in database.INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+        for name, target in LEGACY_INDEXES.items():
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+        conn.commit()
+    else:
+        database.add_indexes()
+    cursor.execute('ANALYZE')
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Explain the query plans of the app workload')
+    parser.add_argument('--tutors', type=int, default=10, help='Tutors in the dataset')
+    parser.add_argument('--students', type=int, default=300, help='Average students per tutor')
+    parser.add_argument('--months', type=int, default=2, help='Closed months of attendance')
+    parser.add_argument('--homework', type=int, default=200, help='Homework per tutor')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed requests per workload entry')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the dataset')
+    parser.add_argument('--all', action='store_true', help='Print every statement, not just flagged ones')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='tuitiontrack-indexes-')
+    os.environ['DATABASE'] = os.path.join(tmp_dir, 'workload.db')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(tmp_dir, 'uploads')
+    os.environ['FRAGMENT_CACHE_ENABLED'] = 'false'
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import database
+        from app import app
+    from generate_dataset import generate
+
+    conn = database.get_db_connection()
+    generate(conn, args.tutors, args.students, args.months, args.homework, attachments=5, seed=args.seed)
+
+    log = StatementLog()
+    log.install(database)
+    results = {}
+    for phase, legacy in (('before', True), ('after', False)):
+        set_indexes(conn, legacy)
+        log.statements = {}
+        timings = run(app, database.get_db_connection, log, args.repeat)
+        cursor = conn.cursor()
+        statements = {key: dict(entry, plan=explain(cursor, entry['sql']),
+                                ms=time_statement(cursor, entry['sql'], args.repeat))
+                      for key, entry in log.statements.items()}
+        results[phase] = (timings, statements)
+    conn.close()
+
+    before_timings, before_statements = results['before']
+    after_timings, after_statements = results['after']
+    print("=" * 78)
+    print("Query Plan Analysis")
+    print("=" * 78)
+    print(f"{args.tutors} tutors x ~{args.students} students, {args.months} closed months of attendance, "
+          f"{args.homework} homework each; {len(after_statements)} distinct statements")
+
+    flagged_before = {key for key, entry in before_statements.items() if entry['plan'][1]}
+    for key, entry in sorted(after_statements.items(), key=lambda item: sorted(item[1]['sources'])):
+        plan, flags = entry['plan']
+        if not flags and not args.all:
+            continue
+        marker = 'FLAGGED' if flags else ('fixed' if key in flagged_before else 'ok')
+        print(f"\n[{marker}] {', '.join(sorted(entry['sources']))}  (x{entry['count']})")
+        print(f"   {key[:300]}")
+        for line in plan:
+            print(f"     {'!' if line in flags else '-'} {line}")
+
+    print(f"\n   {'':<46} {'before':>10} {'after':>10}")
+    print(f"   {'Statements with a full scan or temp b-tree':<46} {len(flagged_before):>10} "
+          f"{sum(1 for entry in after_statements.values() if entry['plan'][1]):>10}")
+    changed = [(key, entry) for key, entry in after_statements.items()
+               if key in before_statements and entry['plan'][0] != before_statements[key]['plan'][0]
+               and entry['ms'] is not None]
+    print(f"\n   {'statements with a new plan (best ms)':<46} {'before':>10} {'after':>10}")
+    for key, entry in sorted(changed, key=lambda item: -before_statements[item[0]]['ms']):
+        source = sorted(entry['sources'])[0]
+        print(f"   {source[:46]:<46} {before_statements[key]['ms']:>10.3f} {entry['ms']:>10.3f}")
+    print(f"   {'Total':<46} {sum(before_statements[key]['ms'] for key, _ in changed):>10.3f} "
+          f"{sum(entry['ms'] for _, entry in changed):>10.3f}")
+
+    print(f"\n   {'request (median ms)':<46} {'before':>10} {'after':>10}")
+    for label in after_timings:
+        print(f"   {label[:46]:<46} {before_timings.get(label, 0):>10.2f} {after_timings[label]:>10.2f}")
+    print(f"   {'Total':<46} {sum(before_timings.values()):>10.2f} {sum(after_timings.values()):>10.2f}")
+
+    print("\n" + "=" * 78)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
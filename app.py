@@ -1,7 +1,16 @@
 """Main Flask application - TuitionTrack PWA"""
 from flask import Flask, jsonify
 from config import Config
-from database import init_db, migrate_db, add_indexes
+from utils.blob_store import UploadRequest
+from utils.assets import asset_url, load_manifest, static_cache_control
+from utils.compression import CompressionMiddleware
+from utils.fragment_cache import FragmentCacheExtension, cache_dir as fragment_cache_dir
+from utils.template_cache import configure_bytecode_cache
+from utils.sql_trace import init_sql_trace
+from utils.metrics import init_metrics, metrics_response
+from utils.health import readiness
+from utils.write_coordinator import init_write_coordinator
+from database import init_db, migrate_db, add_indexes, close_request_connections
 from datetime import datetime, date
 import os
 import logging
@@ -18,6 +27,8 @@ except AttributeError:
 # Initialize Flask app
 app = Flask(__name__)
 app.config.from_object(Config)
+# Stream uploaded files to disk in chunks instead of buffering them
+app.request_class = UploadRequest
 
 # Production session security (for HTTPS)
 # These settings ensure secure cookies when deployed with HTTPS
@@ -62,6 +73,51 @@ app.register_blueprint(student_bp)
 app.register_blueprint(export_bp)
 app.register_blueprint(help_bot_bp)
 
+# Close any database connection a request left open (e.g. after an exception)
+app.teardown_appcontext(close_request_connections)
+
+# Fingerprinted CSS/JS bundles (see utils/assets.py)
+app.add_template_global(asset_url)
+
+# {% cache key[, ttl] %} ... {% endcache %} for expensive fragments (see utils/fragment_cache.py)
+app.jinja_env.add_extension(FragmentCacheExtension)
+if Config.FRAGMENT_CACHE_ENABLED:
+    fragment_cache_dir()  # Reports a directory other users could write to before any page is served
+
+# Keep compiled templates on disk; gunicorn_config.py also compiles them all before forking
+configure_bytecode_cache(app)
+
+# Statement count and SQL time per request: Server-Timing header, slow-query log, query budgets
+init_sql_trace(app)
+
+# Per-route latency, SQL, lock, push and help bot metrics for /metrics
+init_metrics(app)
+
+# Background WAL checkpoints, one thread per host (see utils/write_coordinator.py)
+init_write_coordinator(app)
+
+@app.after_request
+def cache_fingerprinted_assets(response):
+    """Bundle URLs change with their content, so browsers may keep them for a year"""
+    from flask import request
+    if request.endpoint == 'static' and response.status_code in (200, 304):
+        cache_control = static_cache_control(request.view_args.get('filename', ''))
+        if cache_control:
+            response.headers['Cache-Control'] = cache_control
+    return response
+
+# Compress HTML, JSON, CSS and JS on the way out; precompressed bundles are sent as they are
+if Config.COMPRESSION_ENABLED:
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        minimum_size=Config.COMPRESSION_MIN_SIZE,
+        gzip_level=Config.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=Config.COMPRESSION_BROTLI_QUALITY,
+        static_folder=app.static_folder,
+        static_url_path=app.static_url_path,
+        static_cache_control=static_cache_control
+    )
+
 # Make VAPID_PUBLIC_KEY available to all templates
 @app.context_processor
 def inject_config():
@@ -102,6 +158,9 @@ else:
     migrate_db()
     add_indexes()
 
+# Build the asset bundles if this deploy has not run build_assets.py
+load_manifest()
+
 # Serve manifest.json at root for TWA compatibility
 @app.route('/manifest.json')
 def manifest():
@@ -113,6 +172,21 @@ def manifest():
         mimetype='application/manifest+json'
     )
 
+# Serve the service worker from the root so its scope covers every page
+@app.route('/service-worker.js')
+def service_worker():
+    """Serve the built service worker (with its precache manifest, see utils/assets.py)"""
+    from flask import send_from_directory
+    load_manifest(rebuild_if_stale=app.debug)
+    response = send_from_directory(
+        os.path.join(app.root_path, 'static', 'dist'),
+        'service-worker.js',
+        mimetype='application/javascript'
+    )
+    # Browsers must see a new deploy's worker straight away
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # Serve assetlinks.json for Android TWA verification
 @app.route('/.well-known/assetlinks.json')
 def assetlinks():
@@ -134,12 +208,40 @@ def health():
         'version': '1.0.0'
     }), 200
 
+@app.route('/health/live')
+def health_live():
+    """Liveness: the worker answers; restart it if this fails"""
+    return jsonify({'status': 'alive'}), 200
+
+@app.route('/health/ready')
+def health_ready():
+    """Readiness: database, WAL, disk, help bot index and backlog checks (see utils/health.py)"""
+    result, status_code = readiness()
+    return jsonify(result), status_code
+
+# Prometheus scrape endpoint
+@app.route('/metrics')
+def metrics():
+    """Metrics of every worker on this host (see utils/metrics.py)"""
+    return metrics_response()
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
     from flask import render_template
     return render_template('errors/404.html'), 404
 
+@app.errorhandler(413)
+def request_too_large(error):
+    """Uploads over the size limit are cut off mid-stream; send the user back to the form"""
+    from flask import request, flash, redirect, url_for
+    message = f'File size exceeds {Config.MAX_FILE_SIZE // (1024*1024)}MB limit'
+    if request.path.startswith('/api/'):
+        return jsonify({'success': False, 'error': message}), 413
+    flash(message, 'error')
+    referrer = request.referrer or ''
+    return redirect(referrer if referrer.startswith(request.host_url) else url_for('homework.homework'))
+
 @app.errorhandler(500)
 def internal_error(error):
     from flask import render_template
@@ -0,0 +1,177 @@
+"""Benchmark the student attendance calendar: one query per day vs one range read
+
+Runs against a throwaway database filled by populate_db.py (removed
+afterwards), with a few months of attendance for one student, some of them
+archived. For months of 28 to 31 days it compares
+
+- per day: the calendar as student.attendance() used to build it, one
+  SELECT per day of the month
+- range: utils/attendance_grid.month_grid(), one archive lookup plus one
+  attendance range scan
+
+counting the SQL statements each runs, then fetches the attendance page and
+the JSON month endpoint as the student and counts their statements too. The
+range read stays at the same count whatever the month length.
+
+Usage:
+    python3 benchmark_attendance_grid.py
+    python3 benchmark_attendance_grid.py --requests 200
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import types
+from calendar import monthrange
+from datetime import date, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class QueryCounter:
+    """Counts statements run on connections opened through database.get_db_connection()"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement):
+        if not statement.lstrip().upper().startswith('PRAGMA'):
+            self.count += 1
+
+    def install(self, database_module):
+        connect = sqlite3.connect
+
+        def counting_connect(*args, **kwargs):
+            conn = connect(*args, **kwargs)
+            conn.set_trace_callback(self)
+            return conn
+
+        # database.py sees sqlite3 with only connect() replaced
+        proxy = types.SimpleNamespace(**{name: getattr(sqlite3, name) for name in dir(sqlite3)
+                                         if not name.startswith('__')})
+        proxy.connect = counting_connect
+        database_module.sqlite3 = proxy
+
+
+def per_day_grid(cursor, student_id, year, month):
+    """The calendar as it was built before: one query per day"""
+    attendance_by_date = {}
+    for day in range(1, monthrange(year, month)[1] + 1):
+        date_str = date(year, month, day).isoformat()
+        cursor.execute('''
+            SELECT COALESCE(status, present, -1) as status
+            FROM attendance
+            WHERE student_id = ? AND date = ?
+        ''', (student_id, date_str))
+        result = cursor.fetchone()
+        attendance_by_date[date_str] = result['status'] if result and result['status'] is not None else -1
+    return attendance_by_date
+
+
+def measure(counter, func, repeat):
+    """(statements per call, mean ms per call)"""
+    counter.count = 0
+    func()
+    queries = counter.count
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return queries, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the attendance calendar queries')
+    parser.add_argument('--requests', type=int, default=100, help='Timed runs per measurement')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='tuitiontrack-bench-')
+    os.environ['DATABASE'] = os.path.join(tmp_dir, 'bench.db')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(tmp_dir, 'uploads')
+    os.environ['FRAGMENT_CACHE_ENABLED'] = 'false'
+
+    import database
+    from app import app
+    from populate_db import populate_database
+    from utils import get_ist_today, cleanup_old_attendance
+    from utils.attendance_grid import month_grid
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        populate_database()
+
+    today = get_ist_today()
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users WHERE mobile = '1111111111'")
+    user_id = cursor.fetchone()['id']
+    cursor.execute('SELECT id, name, phone, batch_id FROM students WHERE user_id = ? ORDER BY id LIMIT 1', (user_id,))
+    student = cursor.fetchone()
+
+    # Four months of attendance: the current one stays in attendance, the rest are archived
+    first_day = date(today.year, today.month, 1)
+    months = [(first_day.year, first_day.month)]
+    for _ in range(3):
+        first_day = (first_day - timedelta(days=1)).replace(day=1)
+        months.append((first_day.year, first_day.month))
+    day = first_day
+    while day <= today:
+        status = (1, 1, 1, 2, 0)[day.toordinal() % 5]
+        cursor.execute('INSERT OR IGNORE INTO attendance (student_id, date, present, status, user_id) '
+                       'VALUES (?, ?, ?, ?, ?)', (student['id'], day.isoformat(), 1 if status else 0, status, user_id))
+        day += timedelta(days=1)
+    conn.commit()
+    cleanup_old_attendance()
+
+    counter = QueryCounter()
+    counter.install(database)
+    conn.close()
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+
+    print("=" * 78)
+    print("Attendance Calendar Query Benchmark")
+    print("=" * 78)
+    print(f"\n   {'month':<10} {'days':>5} {'per-day queries':>16} {'per-day ms':>11} "
+          f"{'range queries':>14} {'range ms':>9}")
+    for year, month in reversed(months):
+        days = monthrange(year, month)[1]
+        label = f'{year:04d}-{month:02d}' + (' *' if (year, month) == (today.year, today.month) else '')
+        # Archived rows are gone from attendance; the per-day loop still issues a query per day
+        old_queries, old_ms = measure(counter, lambda: per_day_grid(cursor, student['id'], year, month),
+                                      args.requests)
+        new_queries, new_ms = measure(counter, lambda: month_grid(cursor, user_id, student['id'], year, month),
+                                      args.requests)
+        print(f"   {label:<10} {days:>5} {old_queries:>16} {old_ms:>11.3f} {new_queries:>14} {new_ms:>9.3f}")
+    print("   * current month (attendance table); earlier months read from attendance_archive")
+    conn.close()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = student['id']
+        sess['mobile'] = student['phone']
+        sess['role'] = 'student'
+        sess['student_name'] = student['name']
+        sess['student_id'] = student['id']
+        sess['batch_id'] = student['batch_id']
+
+    print(f"\n   {'request':<46} {'queries':>8} {'ms':>8}")
+    urls = ['/student/attendance'] + [f'/api/student/attendance/month?month={year:04d}-{month:02d}'
+                                      for year, month in reversed(months)]
+    for url in urls:
+        def fetch():
+            response = client.get(url)
+            assert response.status_code == 200, f'{url}: {response.status_code}'
+        queries, ms = measure(counter, fetch, args.requests)
+        print(f"   {url:<46} {queries:>8} {ms:>8.2f}")
+
+    print("\n" + "=" * 78)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
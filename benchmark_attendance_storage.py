@@ -0,0 +1,189 @@
+"""Benchmark row-per-day attendance against the packed monthly archive
+
+Builds a throwaway database (removed afterwards) with one tutor, --students
+students and --months closed months of attendance as one row per student per
+day, the layout the attendance table uses. A copy is then archived with
+utils/attendance_archive.archive_closed_months(), which packs every student's
+month into one 8-byte bitmap row.
+
+Reported for both layouts:
+- bytes on disk of the table plus its indexes (SQLite dbstat)
+- per-student present/late/absent counts for one month, all students
+  (the reports page): SQL GROUP BY over rows vs NumPy sums over the bitmaps
+- one student's month grid (the student report detail page)
+
+Usage:
+    python3 benchmark_attendance_storage.py
+    python3 benchmark_attendance_storage.py --students 5000 --months 12
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from calendar import monthrange
+from datetime import date, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ROW_TABLES = ('attendance', 'idx_attendance_date', 'idx_attendance_user_date_status',
+              'sqlite_autoindex_attendance_1')
+ARCHIVE_TABLES = ('attendance_archive', 'idx_attendance_archive_user_month', 'sqlite_autoindex_attendance_archive_1')
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def table_bytes(conn, names):
+    """Bytes used by tables and indexes, or None if SQLite lacks dbstat"""
+    placeholders = ','.join('?' * len(names))
+    try:
+        row = conn.execute(f'SELECT SUM(pgsize) FROM dbstat WHERE name IN ({placeholders})', names).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] or 0
+
+
+def best_time(func, repeat):
+    """Fastest of ``repeat`` runs, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def fill(conn, students, months, today, seed):
+    """One tutor, ``students`` students and ~85% of days marked for ``months`` closed months"""
+    rng = random.Random(seed)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO users (mobile, tuition_name) VALUES ('9000000000', 'Benchmark Tuition')")
+    user_id = cursor.lastrowid
+    cursor.execute("INSERT INTO batches (name, user_id) VALUES ('Benchmark Batch', ?)", (user_id,))
+    batch_id = cursor.lastrowid
+    cursor.executemany('INSERT INTO students (name, phone, batch_id, user_id) VALUES (?, ?, ?, ?)',
+                       [(f'Student {i}', f'8{i:09d}', batch_id, user_id) for i in range(students)])
+    student_ids = [row[0] for row in cursor.execute('SELECT id FROM students WHERE user_id = ?', (user_id,))]
+
+    first_of_month = date(today.year, today.month, 1)
+    start = first_of_month
+    for _ in range(months):
+        start = (start - timedelta(days=1)).replace(day=1)
+    days = [start + timedelta(days=i) for i in range((first_of_month - start).days)]
+    rows = []
+    for student_id in student_ids:
+        for day in days:
+            if rng.random() < 0.85:
+                status = rng.choices((1, 2, 0), weights=(75, 10, 15))[0]
+                rows.append((student_id, day.isoformat(), 1 if status else 0, status, user_id))
+    cursor.executemany('INSERT INTO attendance (student_id, date, present, status, user_id) VALUES (?, ?, ?, ?, ?)',
+                       rows)
+    conn.commit()
+    return user_id, student_ids, start, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark attendance storage layouts')
+    parser.add_argument('--students', type=int, default=1000, help='Students of the tutor')
+    parser.add_argument('--months', type=int, default=3, help='Closed months of attendance')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query (best is shown)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the statuses')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='tuitiontrack-bench-')
+    rows_path = os.path.join(tmp_dir, 'rows.db')
+    packed_path = os.path.join(tmp_dir, 'packed.db')
+    os.environ['DATABASE'] = rows_path
+    os.environ['UPLOAD_FOLDER'] = os.path.join(tmp_dir, 'uploads')
+
+    from database import init_db, add_indexes
+    from utils import get_ist_today
+    from utils.attendance_archive import archive_closed_months, attendance_counts, attendance_matrix
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+        add_indexes()
+
+    today = get_ist_today()
+    rows_conn = connect(rows_path)
+    user_id, student_ids, first_day, row_count = fill(rows_conn, args.students, args.months, today, args.seed)
+    rows_conn.execute('VACUUM')
+    rows_conn.close()
+
+    shutil.copyfile(rows_path, packed_path)
+    packed_conn = connect(packed_path)
+    archive_closed_months(packed_conn, today)
+    packed_conn.execute('VACUUM')
+
+    rows_conn = connect(rows_path)
+    month_start = first_day
+    month_end = date(first_day.year, first_day.month, monthrange(first_day.year, first_day.month)[1])
+    student_id = student_ids[len(student_ids) // 2]
+
+    def rows_month_counts():
+        rows_conn.execute('''
+            SELECT student_id,
+                   SUM(CASE WHEN COALESCE(status, present, 0) = 1 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(status, present, 0) = 2 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(status, present, 0) = 0 THEN 1 ELSE 0 END)
+            FROM attendance
+            WHERE user_id = ? AND date BETWEEN ? AND ?
+            GROUP BY student_id
+        ''', (user_id, month_start.isoformat(), month_end.isoformat())).fetchall()
+
+    def packed_month_counts():
+        attendance_counts(packed_conn.cursor(), user_id, month_start, month_end)
+
+    def rows_student_month():
+        rows_conn.execute('''
+            SELECT date, COALESCE(status, present, 0) FROM attendance
+            WHERE student_id = ? AND date BETWEEN ? AND ?
+        ''', (student_id, month_start.isoformat(), month_end.isoformat())).fetchall()
+
+    def packed_student_month():
+        attendance_matrix(packed_conn.cursor(), user_id, month_start, month_end, [student_id])
+
+    row_bytes = table_bytes(rows_conn, ROW_TABLES)
+    archive_bytes = table_bytes(packed_conn, ARCHIVE_TABLES)
+    archive_rows = packed_conn.execute('SELECT COUNT(*) FROM attendance_archive').fetchone()[0]
+
+    print("=" * 78)
+    print("Attendance Storage Benchmark")
+    print("=" * 78)
+    print(f"{args.students:,} students, {args.months} closed months from {first_day.isoformat()}, "
+          f"{row_count:,} attendance rows -> {archive_rows:,} archive rows")
+
+    print(f"\n   {'':<38} {'row per day':>14} {'packed month':>14}")
+    if row_bytes is None or archive_bytes is None:
+        print(f"   {'Database file (bytes)':<38} {os.path.getsize(rows_path):>14,} {os.path.getsize(packed_path):>14,}")
+        print("   Note: SQLite built without dbstat, showing whole database files")
+    else:
+        print(f"   {'Table + indexes (bytes)':<38} {row_bytes:>14,} {archive_bytes:>14,}")
+        print(f"   {'Per student-month (bytes)':<38} {row_bytes / archive_rows:>14.0f} "
+              f"{archive_bytes / archive_rows:>14.0f}")
+    timings = [
+        ('Month counts, all students', rows_month_counts, packed_month_counts),
+        ('Month grid, one student', rows_student_month, packed_student_month),
+    ]
+    for label, rows_query, packed_query in timings:
+        print(f"   {label + ' (ms)':<38} {best_time(rows_query, args.repeat) * 1000:>14.2f} "
+              f"{best_time(packed_query, args.repeat) * 1000:>14.2f}")
+
+    rows_conn.close()
+    packed_conn.close()
+    print("\n" + "=" * 78)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark bytes on the wire for the main pages with and without compression
+
+Runs the real routes in-process against a throwaway database filled by
+populate_db.py, removed afterwards. Every page and static bundle is fetched
+with Accept-Encoding identity, gzip and br, and the body sizes are compared.
+Pages are compressed per request by utils/compression.py; bundles are served
+from the .gz/.br copies build_assets.py writes.
+
+Usage:
+    python3 benchmark_compression.py
+    python3 benchmark_compression.py --requests 50
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+TUTOR_PAGES = ['/dashboard', '/students', '/batches', '/attendance', '/homework', '/reports']
+STUDENT_PAGES = ['/student/dashboard', '/student/attendance', '/student/homework']
+ENCODINGS = ['identity', 'gzip', 'br']
+
+
+def fetch(client, url, encoding):
+    """Return (body bytes on the wire, Content-Encoding, seconds) for one GET"""
+    start = time.perf_counter()
+    response = client.get(url, headers={'Accept-Encoding': encoding}, follow_redirects=True)
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, f'{url}: {response.status_code}'
+    return len(response.get_data()), response.headers.get('Content-Encoding', 'identity'), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark response compression')
+    parser.add_argument('--requests', type=int, default=20, help='Timed requests per page and encoding')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='tuitiontrack-bench-')
+    os.environ['DATABASE'] = os.path.join(tmp_dir, 'bench.db')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(tmp_dir, 'uploads')
+
+    from app import app
+    from database import get_db_connection
+    from populate_db import populate_database
+    from utils.assets import build_assets, load_manifest
+    from utils.compression import brotli
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        populate_database()
+        build_assets()
+    load_manifest()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, tuition_name FROM users WHERE mobile = '1111111111'")
+    tutor = cursor.fetchone()
+    cursor.execute('SELECT id, name, phone, batch_id FROM students WHERE user_id = ? ORDER BY id LIMIT 1',
+                   (tutor['id'],))
+    student = cursor.fetchone()
+    conn.close()
+
+    tutor_client = app.test_client()
+    with tutor_client.session_transaction() as sess:
+        sess['user_id'] = tutor['id']
+        sess['role'] = 'tutor'
+        sess['tuition_name'] = tutor['tuition_name']
+    student_client = app.test_client()
+    with student_client.session_transaction() as sess:
+        sess['user_id'] = student['id']
+        sess['mobile'] = student['phone']
+        sess['role'] = 'student'
+        sess['student_name'] = student['name']
+        sess['student_id'] = student['id']
+        sess['batch_id'] = student['batch_id']
+
+    with app.test_request_context():
+        from utils.assets import asset_url
+        bundles = [asset_url(name) for name in ('app.css', 'app.js', 'app-shell.js', 'help-bot.css', 'help-bot.js', 'tours.js')]
+
+    targets = [(tutor_client, url) for url in TUTOR_PAGES] + \
+              [(student_client, url) for url in STUDENT_PAGES] + \
+              [(tutor_client, url) for url in bundles]
+
+    print("=" * 78)
+    print("Response Compression Benchmark")
+    print("=" * 78)
+    if brotli is None:
+        print("Note: brotli not installed, br requests fall back to gzip")
+    print(f"\n   {'URL':<36} {'identity':>10} {'gzip':>10} {'br':>10} {'saved':>7}")
+
+    totals = dict.fromkeys(ENCODINGS, 0)
+    times = dict.fromkeys(ENCODINGS, 0.0)
+    for client, url in targets:
+        sizes = {}
+        for encoding in ENCODINGS:
+            size, _, _ = fetch(client, url, encoding)
+            sizes[encoding] = size
+            totals[encoding] += size
+            for _ in range(args.requests):
+                times[encoding] += fetch(client, url, encoding)[2]
+        best = min(sizes.values())
+        label = url if len(url) <= 36 else url[:33] + '...'
+        print(f"   {label:<36} {sizes['identity']:>10,} {sizes['gzip']:>10,} {sizes['br']:>10,} "
+              f"{1 - best / sizes['identity']:>6.0%}")
+
+    count = len(targets) * args.requests
+    print(f"\n   {'Total':<36} {totals['identity']:>10,} {totals['gzip']:>10,} {totals['br']:>10,} "
+          f"{1 - min(totals.values()) / totals['identity']:>6.0%}")
+    print("\n   Mean time per response (server side, includes compression):")
+    for encoding in ENCODINGS:
+        print(f"     {encoding:<9} {times[encoding] / count * 1000:.2f} ms")
+
+    print("\n" + "=" * 78)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
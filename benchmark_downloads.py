@@ -0,0 +1,108 @@
+"""Benchmark homework downloads per worker for each FILE_DELIVERY_MODE
+
+Runs the real /uploads/ route in-process against a throwaway database and
+upload folder, removed afterwards. For every delivery mode it measures how
+long the worker spends producing the response and how many body bytes it has
+to push itself, then works out how long a sync worker is held when the client
+downloads at --client-mbps, and how long the last of --students simultaneous
+downloads waits with --workers workers.
+
+Usage:
+    python3 benchmark_downloads.py
+    python3 benchmark_downloads.py --size-mb 10 --students 60 --workers 3 --client-mbps 4
+"""
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark homework file delivery modes')
+    parser.add_argument('--size-mb', type=float, default=10, help='Homework file size (default: Config.MAX_FILE_SIZE)')
+    parser.add_argument('--students', type=int, default=60, help='Students downloading at the same time')
+    parser.add_argument('--workers', type=int, default=3, help='Sync gunicorn workers')
+    parser.add_argument('--client-mbps', type=float, default=4.0, help='Download speed of each student (Mbit/s)')
+    parser.add_argument('--requests', type=int, default=50, help='Timed requests per mode')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='tuitiontrack-bench-')
+    os.environ['DATABASE'] = os.path.join(tmp_dir, 'bench.db')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(tmp_dir, 'uploads')
+
+    from app import app
+    from config import Config
+    from database import get_db_connection
+
+    file_path = 'homework/bench_worksheet.pdf'
+    size = int(args.size_mb * 1024 * 1024)
+    with open(os.path.join(Config.UPLOAD_FOLDER, file_path), 'wb') as f:
+        f.write(os.urandom(size))
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO users (mobile, tuition_name, role) VALUES ('9000000000', 'Bench Tuition', 'tutor')")
+    user_id = cursor.lastrowid
+    cursor.execute("INSERT INTO homework (title, file_path, submission_date, user_id) VALUES (?, ?, '2999-01-01', ?)",
+                   ('Worksheet', file_path, user_id))
+    conn.commit()
+    conn.close()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['role'] = 'tutor'
+        sess['tuition_name'] = 'Bench Tuition'
+
+    client_bytes_per_sec = args.client_mbps * 1_000_000 / 8
+    waves = math.ceil(args.students / args.workers)
+
+    print("=" * 60)
+    print("Homework Download Benchmark")
+    print("=" * 60)
+    print(f"File: {args.size_mb:g} MB, {args.students} students at {args.client_mbps:g} Mbit/s, "
+          f"{args.workers} sync workers")
+
+    for mode in ('flask', 'x-accel', 'x-sendfile'):
+        Config.FILE_DELIVERY_MODE = mode
+        header_times = []
+        body_times = []
+        body_bytes = 0
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = client.get(f'/uploads/{file_path}', buffered=False)
+            header_times.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+
+            start = time.perf_counter()
+            body_bytes = sum(len(chunk) for chunk in response.response)
+            response.close()
+            body_times.append(time.perf_counter() - start)
+
+        handler = percentile(header_times, 50)
+        # A sync worker writes the body itself, so it is held until the client has read it
+        held = handler + percentile(body_times, 50) + body_bytes / client_bytes_per_sec
+        print(f"\n[{mode}]")
+        print(f"  access check + headers: p50 {handler * 1000:.2f} ms, p95 {percentile(header_times, 95) * 1000:.2f} ms")
+        print(f"  body bytes sent by the worker: {body_bytes:,}")
+        print(f"  worker held per download: {held:.3f} s")
+        print(f"  downloads per worker per minute: {60 / held:,.0f}")
+        print(f"  last of {args.students} students waits ~{waves * held:.1f} s for a worker")
+
+    print("\n" + "=" * 60)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
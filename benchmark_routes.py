@@ -0,0 +1,311 @@
+"""End-to-end route benchmark on a large generated dataset
+
+Requests every page and JSON GET endpoint of every blueprint through Flask's
+test client (plus a previous-month student report, a 60-day attendance export
+and an attendance save) as tutors of several sizes - the largest tenant, the
+median one and the smallest - and their students. Per route it reports
+
+- latency percentiles (p50 / p95 / p99 over all requests)
+- SQL statements per request
+- SQLite VM steps per request, in thousands: the work SQLite did, which grows
+  with the rows a statement reads (a full scan of a 100k-row table costs
+  about a million steps, an index lookup a few dozen)
+
+The database (from generate_dataset.py) is copied to a temporary directory
+first, so the attendance save does not change it; without --database a small
+dataset is generated there. --save writes the results as JSON, and a later
+run with --baseline fails (exit code 1) when a route runs more statements,
+or needs more VM steps or a slower p50 by over --max-regression percent.
+
+Usage:
+    python3 generate_dataset.py --database /tmp/large.db --tutors 1000 --students 100 --months 24
+    python3 benchmark_routes.py --database /tmp/large.db --save baseline.json
+    python3 benchmark_routes.py --database /tmp/large.db --baseline baseline.json
+    python3 benchmark_routes.py                # small generated dataset
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import types
+from collections import defaultdict
+from datetime import timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Endpoints that never touch the database
+SKIP_ENDPOINTS = {'static', 'homework.uploaded_file', 'auth.logout', 'service_worker', 'manifest', 'assetlinks'}
+VM_STEP = 100  # Progress handler granularity, in SQLite VM instructions
+MIN_SLOWDOWN_MS = 2.0  # Smaller p50 changes are noise on a shared machine
+
+
+class SqlMeter:
+    """Counts statements and VM steps on connections opened through database.get_db_connection()"""
+
+    def __init__(self):
+        self.statements = 0
+        self.steps = 0
+
+    def reset(self):
+        self.statements = 0
+        self.steps = 0
+
+    def _trace(self, sql):
+        # Statements run by triggers arrive prefixed with '--'
+        if not sql.startswith('--') and not sql.lstrip().upper().startswith('PRAGMA'):
+            self.statements += 1
+
+    def _progress(self):
+        self.steps += VM_STEP
+        return 0
+
+    def install(self, database_module):
+        connect = sqlite3.connect
+
+        def metered_connect(*args, **kwargs):
+            conn = connect(*args, **kwargs)
+            conn.set_trace_callback(self._trace)
+            conn.set_progress_handler(self._progress, VM_STEP)
+            return conn
+
+        # database.py sees sqlite3 with only connect() replaced
+        proxy = types.SimpleNamespace(**{name: getattr(sqlite3, name) for name in dir(sqlite3)
+                                         if not name.startswith('__')})
+        proxy.connect = metered_connect
+        database_module.sqlite3 = proxy
+
+
+def pick_tenants(cursor, count):
+    """Tutor ids spread over tenant sizes: the largest first, then down to the smallest"""
+    tutors = [row['id'] for row in cursor.execute('''
+        SELECT u.id FROM users u LEFT JOIN students s ON s.user_id = u.id
+        GROUP BY u.id ORDER BY COUNT(s.id) DESC, u.id
+    ''')]
+    if count >= len(tutors):
+        return tutors
+    if count == 1:
+        return tutors[:1]
+    return [tutors[round(i * (len(tutors) - 1) / (count - 1))] for i in range(count)]
+
+
+def route_requests(app, cursor, user_id):
+    """(tutor, student, requests) covering every page and JSON GET endpoint for a tutor
+
+    Each request is (label, client kind, method, url, json body); labels are
+    the URL rules, so the same route of different tenants shares one label.
+    """
+    from utils import get_ist_today
+
+    tutor = cursor.execute('SELECT id, tuition_name FROM users WHERE id = ?', (user_id,)).fetchone()
+    student = cursor.execute('SELECT * FROM students WHERE user_id = ? ORDER BY id LIMIT 1', (user_id,)).fetchone()
+    homework = cursor.execute('SELECT id FROM homework WHERE user_id = ? ORDER BY id LIMIT 1', (user_id,)).fetchone()
+    batch_students = [row['id'] for row in cursor.execute('SELECT id FROM students WHERE batch_id = ?',
+                                                          (student['batch_id'],))]
+
+    ids = {'student_id': student['id'], 'batch_id': student['batch_id'],
+           'homework_id': homework['id'] if homework else None}
+    requests = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if 'GET' not in rule.methods or rule.endpoint in SKIP_ENDPOINTS or rule.endpoint.startswith('help_bot.'):
+            continue
+        if any(ids.get(argument) is None for argument in rule.arguments):
+            continue
+        url = rule.rule
+        for argument in rule.arguments:
+            url = re.sub(rf'<[^>]*:?{argument}>', str(ids[argument]), url)
+        kind = 'student' if rule.rule.startswith(('/student/', '/api/student/')) else 'tutor'
+        requests.append((rule.rule, kind, 'GET', url, None))
+
+    today = get_ist_today()
+    previous_month = (today.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    requests += [
+        # Without ?batch= the page only redirects to the first batch
+        ('/attendance?batch=<id>', 'tutor', 'GET', f"/attendance?batch={student['batch_id']}", None),
+        ('/reports/student/<id>?month=<previous>', 'tutor', 'GET',
+         f"/reports/student/{student['id']}?month={previous_month}", None),
+        ('/export/attendance (60 days)', 'tutor', 'GET',
+         f"/export/attendance?from={today - timedelta(days=60)}&to={today}", None),
+        ('POST /api/attendance/save', 'tutor', 'POST', '/api/attendance/save',
+         {'date': today.isoformat(), 'attendance': [{'student_id': sid, 'status': 1} for sid in batch_students]}),
+    ]
+    return tutor, student, requests
+
+
+def login_clients(app, tutor, student):
+    """Test clients logged in as the tutor and as one of their students"""
+    clients = {'tutor': app.test_client(), 'student': app.test_client()}
+    with clients['tutor'].session_transaction() as sess:
+        sess['user_id'] = tutor['id']
+        sess['role'] = 'tutor'
+        sess['tuition_name'] = tutor['tuition_name']
+    with clients['student'].session_transaction() as sess:
+        sess['user_id'] = student['id']
+        sess['mobile'] = student['phone']
+        sess['role'] = 'student'
+        sess['student_name'] = student['name']
+        sess['student_id'] = student['id']
+        sess['batch_id'] = student['batch_id']
+    return clients
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)] if ordered else 0.0
+
+
+def run(app, database, meter, tenants, repeat):
+    """{label: {'ms': [...], 'statements': [...], 'steps': [...]}} over the tenants' workloads"""
+    results = defaultdict(lambda: {'ms': [], 'statements': [], 'steps': []})
+    conn = database.get_db_connection()
+    workloads = [route_requests(app, conn.cursor(), user_id) for user_id in tenants]
+    conn.close()
+    for tutor, student, requests in workloads:
+        clients = login_clients(app, tutor, student)
+        for label, kind, method, url, body in requests:
+            for attempt in range(repeat + 1):
+                meter.reset()
+                start = time.perf_counter()
+                response = clients[kind].open(url, method=method, json=body)
+                elapsed = (time.perf_counter() - start) * 1000
+                if response.status_code >= 500:
+                    print(f"   Warning: {method} {url} returned {response.status_code}")
+                if attempt == 0:
+                    continue  # Warm-up: first import of templates, cold page cache
+                result = results[label]
+                result['ms'].append(elapsed)
+                result['statements'].append(meter.statements)
+                result['steps'].append(meter.steps)
+    return results
+
+
+def summarize(results):
+    """{label: {'p50', 'p95', 'p99', 'statements', 'ksteps'}}"""
+    summary = {}
+    for label, result in results.items():
+        count = len(result['ms'])
+        summary[label] = {
+            'p50': percentile(result['ms'], 50),
+            'p95': percentile(result['ms'], 95),
+            'p99': percentile(result['ms'], 99),
+            'statements': sum(result['statements']) / count,
+            'ksteps': sum(result['steps']) / count / 1000,
+        }
+    return summary
+
+
+def regressions(summary, baseline, max_regression):
+    """Routes that do more work than in the baseline
+
+    Statement and VM step counts do not depend on machine load, so they are
+    compared exactly (steps within ``max_regression`` percent); time only at
+    p50 and only past MIN_SLOWDOWN_MS, since a single slow sample moves p95/p99.
+    """
+    found = []
+    allowed = 1 + max_regression / 100
+    for label, current in summary.items():
+        before = baseline.get(label)
+        if not before:
+            continue
+        if current['statements'] > before['statements'] + 0.5:
+            found.append(f"{label}: {before['statements']:.1f} -> {current['statements']:.1f} statements")
+        if current['ksteps'] > before['ksteps'] * allowed + 1:
+            found.append(f"{label}: {before['ksteps']:.1f} -> {current['ksteps']:.1f} thousand VM steps")
+        if current['p50'] > before['p50'] * allowed and current['p50'] - before['p50'] > MIN_SLOWDOWN_MS:
+            found.append(f"{label}: p50 {before['p50']:.2f} -> {current['p50']:.2f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route on a generated dataset')
+    parser.add_argument('--database', help='Database from generate_dataset.py (default: generate a small one)')
+    parser.add_argument('--tenants', type=int, default=3, help='Tutors to run as, from the largest to the smallest')
+    parser.add_argument('--requests', type=int, default=20, help='Timed requests per route and tenant')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON from an earlier --save run to compare against')
+    parser.add_argument('--max-regression', type=float, default=25.0,
+                        help='Allowed growth in p50 time and VM steps against --baseline, in percent')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='tuitiontrack-routes-')
+    db_path = os.path.join(tmp_dir, 'routes.db')
+    if args.database:
+        if not os.path.exists(args.database):
+            print(f"Error: {args.database} not found")
+            sys.exit(1)
+        with sqlite3.connect(args.database) as source, sqlite3.connect(db_path) as target:
+            source.backup(target)
+    os.environ['DATABASE'] = db_path
+    os.environ['UPLOAD_FOLDER'] = os.path.join(tmp_dir, 'uploads')
+    os.environ['FRAGMENT_CACHE_ENABLED'] = 'false'
+    # /metrics reads every process's files; earlier runs' would make it slower each time
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = os.path.join(tmp_dir, 'metrics')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import database
+        from app import app
+    if not args.database:
+        from generate_dataset import generate
+        conn = database.get_db_connection()
+        generate(conn, tutors=20, students=100, months=6, homework=40, attachments=5, seed=42)
+        conn.close()
+
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+    tenants = pick_tenants(cursor, args.tenants)
+    sizes = [cursor.execute('SELECT COUNT(*) FROM students WHERE user_id = ?', (user_id,)).fetchone()[0]
+             for user_id in tenants]
+    totals = {table: cursor.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+              for table in ('users', 'students', 'attendance', 'attendance_archive', 'homework')}
+    conn.close()
+
+    meter = SqlMeter()
+    meter.install(database)
+    summary = summarize(run(app, database, meter, tenants, args.requests))
+
+    print("=" * 78)
+    print("Route Benchmark")
+    print("=" * 78)
+    print(f"{totals['users']:,} tutors, {totals['students']:,} students, {totals['attendance']:,} attendance rows, "
+          f"{totals['attendance_archive']:,} archived months, {totals['homework']:,} homework")
+    print(f"Tenants: {', '.join(f'{size} students' for size in sizes)}; "
+          f"{args.requests} requests per route and tenant")
+    print(f"\n   {'route':<40} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'stmts':>6} {'ksteps':>7}")
+    for label, row in summary.items():
+        print(f"   {label[:40]:<40} {row['p50']:>7.2f} {row['p95']:>7.2f} {row['p99']:>7.2f} "
+              f"{row['statements']:>6.1f} {row['ksteps']:>7.1f}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+        print(f"\nSaved to {args.save}")
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(summary, baseline, args.max_regression)
+        print(f"\nCompared with {args.baseline} (growth allowed: {args.max_regression:.0f}%)")
+        for line in found:
+            print(f"   REGRESSION {line}")
+        if not found:
+            print("   No regressions")
+        failed = bool(found)
+
+    print("\n" + "=" * 78)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Load-test the gunicorn worker classes at equal memory
+
+Starts gunicorn_config.py once per GUNICORN_WORKER_CLASS against a throwaway
+database filled by populate_db.py (removed afterwards), each time with the same
+number of worker processes, so the pools use about the same memory. Logged-in
+clients then request a mix of pages and help bot questions for --duration
+seconds. Help bot answers use the stub model (NIYA_STUB_MODEL_DELAY), standing
+in for the network waits (Gemini, push services) that hold a sync worker.
+
+The table shows the pool's resident memory next to its throughput and latency;
+gthread and gevent keep serving pages while other requests wait.
+
+Run build_rag_index.py first so the help bot has an index.
+
+Usage:
+    python3 benchmark_workers.py
+    python3 benchmark_workers.py --workers 2 --threads 8 --clients 32 --duration 20
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TUTOR_MOBILE = '1111111111'  # Created by populate_db.py
+# (method, path) mix each client cycles through; one request in four waits on the help bot
+REQUEST_MIX = [
+    ('GET', '/dashboard'),
+    ('GET', '/students'),
+    ('POST', '/api/help-bot/query'),
+    ('GET', '/batches'),
+    ('GET', '/reports'),
+    ('GET', '/homework'),
+    ('POST', '/api/help-bot/query'),
+    ('GET', '/attendance'),
+]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def login(base_url):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    form = urllib.parse.urlencode({'action': 'login', 'mobile': TUTOR_MOBILE}).encode()
+    opener.open(f"{base_url}/login", data=form, timeout=30).read()
+    return opener
+
+
+def wait_until_ready(base_url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(f"{base_url}/health", timeout=2).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not become ready")
+
+
+def pool_rss_mb(master_pid):
+    """Resident memory of the gunicorn master and its workers (Linux)"""
+    output = subprocess.run(['ps', '-o', 'rss=', '-p', str(master_pid), '--ppid', str(master_pid)],
+                            capture_output=True, text=True).stdout
+    return sum(int(value) for value in output.split()) / 1024
+
+
+def client(base_url, deadline, offset, results):
+    opener = login(base_url)
+    index = offset
+    while time.time() < deadline:
+        method, path = REQUEST_MIX[index % len(REQUEST_MIX)]
+        index += 1
+        data = json.dumps({'query': 'How do I mark attendance?'}).encode() if method == 'POST' else None
+        request = urllib.request.Request(base_url + path, data=data, headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            opener.open(request, timeout=60).read()
+            ok = True
+        except Exception:
+            ok = False
+        results.append((path, time.perf_counter() - start, ok))
+
+
+def run_mode(mode, args, env, port):
+    base_url = f"http://127.0.0.1:{port}"
+    mode_env = dict(env, PORT=str(port), GUNICORN_WORKER_CLASS=mode, GUNICORN_WORKERS=str(args.workers),
+                    GUNICORN_THREADS=str(args.threads), GUNICORN_WORKER_CONNECTIONS=str(args.connections))
+    process = subprocess.Popen(['gunicorn', '-c', 'gunicorn_config.py', 'app:app'], cwd=ROOT, env=mode_env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(base_url, process)
+        # Warm-up: log in once and load the help bot index in every worker
+        opener = login(base_url)
+        for _ in range(args.workers * 2):
+            opener.open(urllib.request.Request(f"{base_url}/api/help-bot/query", data=b'{"query": "hi"}',
+                                               headers={'Content-Type': 'application/json'}), timeout=60).read()
+
+        results = []
+        deadline = time.time() + args.duration
+        threads = [threading.Thread(target=client, args=(base_url, deadline, i, results)) for i in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rss = pool_rss_mb(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return results, rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test gunicorn worker classes at equal memory')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes in every mode')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gthread worker')
+    parser.add_argument('--connections', type=int, default=100, help='Greenlets per gevent worker')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of load per mode')
+    parser.add_argument('--bot-delay', type=float, default=0.3, help='Seconds the stub help bot model takes')
+    parser.add_argument('--port', type=int, default=5090, help='First port to use')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='tuitiontrack-bench-')
+    env = dict(os.environ,
+               DATABASE=os.path.join(tmp_dir, 'bench.db'),
+               UPLOAD_FOLDER=os.path.join(tmp_dir, 'uploads'),
+               NIYA_STUB_MODEL_DELAY=str(args.bot_delay),
+               HELP_BOT_MAX_CONCURRENT='0',
+               HELP_BOT_SLOT_DIR=os.path.join(tmp_dir, 'slots'),
+               FRAGMENT_CACHE_DIR=os.path.join(tmp_dir, 'fragments'),
+               LOG_LEVEL='warning')
+    os.environ.update(DATABASE=env['DATABASE'], UPLOAD_FOLDER=env['UPLOAD_FOLDER'])
+
+    from database import init_db, migrate_db, add_indexes
+    from populate_db import populate_database
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+        migrate_db()
+        add_indexes()
+        populate_database()
+
+    modes = ['sync', 'gthread']
+    if importlib.util.find_spec('gevent') is not None:
+        modes.append('gevent')
+
+    print("=" * 78)
+    print("Gunicorn Worker Class Benchmark")
+    print("=" * 78)
+    print(f"{args.workers} workers per mode, {args.clients} clients for {args.duration:g} s, "
+          f"help bot stub {args.bot_delay:g} s")
+    if 'gevent' not in modes:
+        print("Note: gevent not installed, skipping the gevent mode (pip install gevent)")
+    print(f"\n   {'mode':<9} {'concurrency':>11} {'RSS MB':>8} {'req/s':>8} {'page p50':>9} "
+          f"{'page p95':>9} {'bot p50':>8} {'errors':>7}")
+
+    for offset, mode in enumerate(modes):
+        results, rss = run_mode(mode, args, env, args.port + offset)
+        pages = [elapsed for path, elapsed, ok in results if ok and not path.startswith('/api/')]
+        bot = [elapsed for path, elapsed, ok in results if ok and path.startswith('/api/')]
+        errors = sum(1 for _, _, ok in results if not ok)
+        concurrency = {'sync': args.workers, 'gthread': args.workers * args.threads,
+                       'gevent': args.workers * args.connections}[mode]
+        print(f"   {mode:<9} {concurrency:>11} {rss:>8.0f} {len(results) / args.duration:>8.1f} "
+              f"{percentile(pages, 50) * 1000:>7.0f}ms {percentile(pages, 95) * 1000:>7.0f}ms "
+              f"{percentile(bot, 50) * 1000:>6.0f}ms {errors:>7}")
+
+    print("\n" + "=" * 78)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,15 +3,18 @@ from flask import Blueprint, render_template, request, session, jsonify, flash
 from datetime import date, datetime, timedelta
 from database import get_db_connection
 from utils import require_login, get_ist_now, get_ist_today, cleanup_old_attendance
+from utils.attendance_archive import attendance_statuses, month_key, refresh_monthly
 from utils.push_notifications import send_notification_to_user
+from utils.sql_trace import query_budget
 
 attendance_bp = Blueprint('attendance', __name__, url_prefix='')
 
 @attendance_bp.route('/attendance')
 @require_login
+@query_budget(8)
 def attendance():
     """Attendance tracker page"""
-    # Clean up old attendance records (keep only current month)
+    # Archive attendance from closed months (attendance keeps only the current month)
     cleanup_old_attendance()
     
     conn = get_db_connection()
@@ -226,6 +229,11 @@ def save_attendance():
         conn.close()
         return jsonify({'success': False, 'error': 'Attendance can only be marked for today or yesterday'}), 400
     
+    # Students already marked for this date (locked). On the 1st, yesterday's
+    # records have already moved to the archive, so both tiers are checked.
+    day = date.fromisoformat(date_str)
+    already_marked = set(attendance_statuses(cursor, session['user_id'], day, day))
+    
     # Validate and save attendance
     saved_students = []
     for item in attendance_data:
@@ -243,9 +251,7 @@ def save_attendance():
             continue
         
         # Check if attendance already exists for this student and date
-        cursor.execute('SELECT id FROM attendance WHERE student_id = ? AND date = ?', (student_id, date_str))
-        existing_attendance = cursor.fetchone()
-        if existing_attendance:
+        if student['id'] in already_marked:
             # Attendance already saved, skip (locked)
             continue
         
@@ -269,6 +275,13 @@ def save_attendance():
         ''', (student_id, date_str, status, session['user_id']))
         
         saved_students.append(student_id)
+        already_marked.add(student['id'])
+    
+    # Yesterday's month may already be archived: recompute its totals from both
+    # tiers rather than leaving the insert trigger's increment on top of them
+    if day.month != today.month:
+        for student_id in saved_students:
+            refresh_monthly(cursor, session['user_id'], student_id, month_key(day))
     
     conn.commit()
     
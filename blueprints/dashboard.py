@@ -3,11 +3,14 @@ from flask import Blueprint, render_template, session, jsonify
 from datetime import date, datetime, timedelta
 from database import get_db_connection
 from utils import require_login, get_ist_now, get_ist_today, cleanup_expired_homework, cleanup_old_attendance
+from utils.fragment_cache import LazyValue, fragment_key
+from utils.sql_trace import query_budget
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='')
 
 @dashboard_bp.route('/dashboard')
 @require_login
+@query_budget(15)
 def dashboard():
     """Main dashboard"""
     # Clean up expired homework and old attendance before showing dashboard
@@ -24,32 +27,8 @@ def dashboard():
     today_obj = get_ist_today()
     cutoff_date = (today_obj - timedelta(days=1)).isoformat()
     
-    # Get stats
-    cursor.execute('SELECT COUNT(*) as count FROM students WHERE user_id = ?', (user_id,))
-    student_count = cursor.fetchone()['count']
-    
-    cursor.execute('SELECT COUNT(*) as count FROM batches WHERE user_id = ?', (user_id,))
-    batch_count = cursor.fetchone()['count']
-    
-    # Get today's attendance count
-    # Count distinct students who are present or late (status 1 or 2)
-    cursor.execute('''
-        SELECT COUNT(DISTINCT student_id) as count 
-        FROM attendance 
-        WHERE user_id = ? AND date = ? 
-        AND COALESCE(status, present, 0) IN (1, 2)
-    ''', (user_id, today))
-    attendance_result = cursor.fetchone()
-    attendance_count = attendance_result['count'] if attendance_result else 0
-    
-    # Calculate attendance percentage
-    # Percentage = (students marked present or late / total students) * 100
-    if student_count > 0:
-        attendance_percentage = round((attendance_count / student_count) * 100)
-        # Cap at 100% to prevent showing more than 100%
-        attendance_percentage = min(attendance_percentage, 100)
-    else:
-        attendance_percentage = 0
+    # Stat cards are cached until students, batches or attendance change (see dashboard.html)
+    stats_cache_key = fragment_key(cursor, 'dashboard-stats', user_id, today)
     
     # Get upcoming batches for today (IST)
     now = get_ist_now()
@@ -148,10 +127,8 @@ def dashboard():
     conn.close()
     
     return render_template('dashboard/dashboard.html', 
-                         student_count=student_count,
-                         batch_count=batch_count,
-                         attendance_count=attendance_count,
-                         attendance_percentage=attendance_percentage,
+                         stats=LazyValue(_dashboard_stats, user_id, today),
+                         stats_cache_key=stats_cache_key,
                          upcoming_batches=upcoming_batches,
                          current_batches=current_batches,
                          recent_homework=recent_homework,
@@ -159,6 +136,47 @@ def dashboard():
                          today=today,
                          onboarding_completed=onboarding_completed)
 
+def _dashboard_stats(user_id, today):
+    """Student, batch and today's attendance counts for the stat cards"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # Get stats
+    cursor.execute('SELECT COUNT(*) as count FROM students WHERE user_id = ?', (user_id,))
+    student_count = cursor.fetchone()['count']
+    
+    cursor.execute('SELECT COUNT(*) as count FROM batches WHERE user_id = ?', (user_id,))
+    batch_count = cursor.fetchone()['count']
+    
+    # Get today's attendance count
+    # Count distinct students who are present or late (status 1 or 2)
+    cursor.execute('''
+        SELECT COUNT(DISTINCT student_id) as count 
+        FROM attendance 
+        WHERE user_id = ? AND date = ? 
+        AND COALESCE(status, present, 0) IN (1, 2)
+    ''', (user_id, today))
+    attendance_result = cursor.fetchone()
+    attendance_count = attendance_result['count'] if attendance_result else 0
+    
+    # Calculate attendance percentage
+    # Percentage = (students marked present or late / total students) * 100
+    if student_count > 0:
+        attendance_percentage = round((attendance_count / student_count) * 100)
+        # Cap at 100% to prevent showing more than 100%
+        attendance_percentage = min(attendance_percentage, 100)
+    else:
+        attendance_percentage = 0
+    
+    conn.close()
+    
+    return {
+        'student_count': student_count,
+        'batch_count': batch_count,
+        'attendance_count': attendance_count,
+        'attendance_percentage': attendance_percentage
+    }
+
 @dashboard_bp.route('/api/onboarding/complete', methods=['POST'])
 @require_login
 def complete_onboarding():
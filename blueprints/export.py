@@ -2,12 +2,17 @@
 from flask import Blueprint, Response, session, request
 from database import get_db_connection
 from utils import require_login, get_ist_today
+from utils.attendance_archive import attendance_statuses, attendance_counts
+from utils.sql_trace import query_budget
 from datetime import date, datetime, timedelta
 import csv
 import io
 
 export_bp = Blueprint('export', __name__, url_prefix='')
 
+STATUS_LABELS = {0: 'Absent', 1: 'Present', 2: 'Late'}
+MAX_EXPORT_DAYS = 366  # Longest attendance export; the range is read into a students x days matrix
+
 @export_bp.route('/export/students')
 @require_login
 def export_students():
@@ -56,40 +61,57 @@ def export_students():
 
 @export_bp.route('/export/attendance')
 @require_login
+@query_budget(6)
 def export_attendance():
-    """Export attendance as CSV"""
-    date_from = request.args.get('from', (get_ist_today() - timedelta(days=30)).isoformat())
-    date_to = request.args.get('to', get_ist_today().isoformat())
+    """Export attendance as CSV (closed months are read from the archive)"""
+    today = get_ist_today()
+    try:
+        date_from = date.fromisoformat(request.args.get('from', ''))
+    except ValueError:
+        date_from = today - timedelta(days=30)
+    try:
+        date_to = date.fromisoformat(request.args.get('to', ''))
+    except ValueError:
+        date_to = today
+    # Nothing is marked after today; longer ranges keep their most recent MAX_EXPORT_DAYS
+    date_to = min(date_to, today)
+    date_from = max(date_from, date_to - timedelta(days=MAX_EXPORT_DAYS - 1))
     batch_id = request.args.get('batch', type=int)
     
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Build query
     query = '''
-        SELECT s.name as student_name, b.name as batch_name, a.date,
-               CASE 
-                   WHEN COALESCE(a.status, a.present, 0) = 1 THEN 'Present'
-                   WHEN COALESCE(a.status, a.present, 0) = 2 THEN 'Late'
-                   ELSE 'Absent'
-               END as status
-        FROM attendance a
-        JOIN students s ON a.student_id = s.id
+        SELECT s.id, s.name as student_name, b.name as batch_name
+        FROM students s
         LEFT JOIN batches b ON s.batch_id = b.id
-        WHERE a.user_id = ? AND a.date BETWEEN ? AND ?
+        WHERE s.user_id = ?
     '''
-    params = [session['user_id'], date_from, date_to]
+    params = [session['user_id']]
     
     if batch_id:
         query += ' AND s.batch_id = ?'
         params.append(batch_id)
     
-    query += ' ORDER BY a.date DESC, s.name'
-    
     cursor.execute(query, params)
-    attendance_records = cursor.fetchall()
+    students = {student['id']: student for student in cursor.fetchall()}
+    statuses = attendance_statuses(cursor, session['user_id'], date_from, date_to,
+                                   list(students) if batch_id else None)
     conn.close()
     
+    attendance_records = [
+        {
+            'date': day.isoformat(),
+            'student_name': students[student_id]['student_name'],
+            'batch_name': students[student_id]['batch_name'],
+            'status': STATUS_LABELS.get(status, 'Absent')
+        }
+        for student_id, days in statuses.items() if student_id in students
+        for day, status in days.items()
+    ]
+    attendance_records.sort(key=lambda record: record['student_name'])
+    attendance_records.sort(key=lambda record: record['date'], reverse=True)
+    
     # Create CSV
     output = io.StringIO()
     writer = csv.writer(output)
@@ -134,21 +156,11 @@ def export_batch_report(batch_id):
     today = get_ist_today()
     thirty_days_ago = today - timedelta(days=30)
     
-    cursor.execute('''
-        SELECT s.name, s.phone,
-               COUNT(a.id) as total_days,
-               SUM(CASE WHEN COALESCE(a.status, a.present, 0) = 1 THEN 1 ELSE 0 END) as present_days,
-               SUM(CASE WHEN COALESCE(a.status, a.present, 0) = 2 THEN 1 ELSE 0 END) as late_days,
-               SUM(CASE WHEN COALESCE(a.status, a.present, 0) = 0 THEN 1 ELSE 0 END) as absent_days,
-               ROUND(100.0 * SUM(CASE WHEN COALESCE(a.status, a.present, 0) IN (1, 2) THEN 1 ELSE 0 END) / NULLIF(COUNT(a.id), 0), 1) as attendance_percentage
-        FROM students s
-        LEFT JOIN attendance a ON s.id = a.student_id AND a.date >= ? AND a.date <= ? AND a.user_id = ?
-        WHERE s.batch_id = ? AND s.user_id = ?
-        GROUP BY s.id, s.name, s.phone
-        ORDER BY s.name
-    ''', (thirty_days_ago.isoformat(), today.isoformat(), session['user_id'], batch_id, session['user_id']))
-    
+    cursor.execute('SELECT id, name, phone FROM students WHERE batch_id = ? AND user_id = ? ORDER BY name',
+                   (batch_id, session['user_id']))
     students = cursor.fetchall()
+    counts = attendance_counts(cursor, session['user_id'], thirty_days_ago, today,
+                               [student['id'] for student in students])
     conn.close()
     
     # Create CSV
@@ -160,14 +172,18 @@ def export_batch_report(batch_id):
     
     # Write data
     for student in students:
+        student_counts = counts.get(student['id'], {'present': 0, 'late': 0, 'absent': 0})
+        total_days = student_counts['present'] + student_counts['late'] + student_counts['absent']
+        attended = student_counts['present'] + student_counts['late']
+        attendance_percentage = round(100.0 * attended / total_days, 1) if total_days else 0
         writer.writerow([
             student['name'],
             student['phone'],
-            student['total_days'] or 0,
-            student['present_days'] or 0,
-            student['late_days'] or 0,
-            student['absent_days'] or 0,
-            f"{student['attendance_percentage'] or 0}%"
+            total_days,
+            student_counts['present'],
+            student_counts['late'],
+            student_counts['absent'],
+            f"{attendance_percentage}%"
         ])
     
     output.seek(0)
@@ -1,19 +1,28 @@
 """Help Bot API Blueprint with RAG system"""
-from flask import Blueprint, request, jsonify, session
+import json
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
 from utils import require_login
-from utils.rag_system import get_rag_system
-import os
+from utils.rag_system import get_rag_system, DEFAULT_RESPONSE
+from utils.metrics import record_help_bot_retrieval
 
 help_bot_bp = Blueprint('help_bot', __name__, url_prefix='')
 
+def _query_and_context():
+    """(query, context) from a JSON object body; query is None unless it is a non-empty string"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, ''
+    user_query = data.get('query')
+    context = data.get('context')
+    user_query = user_query.strip() if isinstance(user_query, str) else ''
+    return user_query or None, context if isinstance(context, str) else ''
+
 @help_bot_bp.route('/api/help-bot/query', methods=['POST'])
 @require_login
 def help_bot_query():
     """Handle help bot queries using RAG system"""
     try:
-        data = request.get_json()
-        user_query = data.get('query', '').strip()
-        context = data.get('context', '')
+        user_query, context = _query_and_context()
         
         if not user_query:
             return jsonify({
@@ -27,25 +36,13 @@ def help_bot_query():
         # Get RAG system
         rag = get_rag_system()
         
-        # Ensure index is loaded
-        if rag.index is None or len(rag.qa_pairs) == 0:
-            # Try to load existing index
-            if os.path.exists(rag.faiss_index_path) and os.path.exists(rag.qa_data_path):
-                import json as json_lib
-                with open(rag.qa_data_path, 'r', encoding='utf-8') as f:
-                    rag.qa_pairs = json_lib.load(f)
-                import faiss
-                rag.index = faiss.read_index(rag.faiss_index_path)
-                if os.path.exists(rag.embeddings_path):
-                    with open(rag.embeddings_path, 'rb') as f:
-                        import pickle
-                        rag.embeddings = pickle.load(f)
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'RAG index not initialized. Please run build_rag_index.py first.',
-                    'response': "I'm setting up my knowledge base. Please try again in a moment! 😊"
-                }), 500
+        # Ensure index is loaded (also picks up generations published since the last query)
+        if not rag.ensure_index_loaded():
+            return jsonify({
+                'success': False,
+                'error': 'RAG index not initialized. Please run build_rag_index.py first.',
+                'response': "I'm setting up my knowledge base. Please try again in a moment! 😊"
+            }), 500
         
         # Get RAG response
         response_data = rag.get_rag_response(
@@ -59,7 +56,8 @@ def help_bot_query():
             'response': response_data['response'],
             'used_rag': response_data.get('used_rag', False),
             'similarity_scores': response_data.get('similarity_scores', []),
-            'rag_context': response_data.get('rag_context', [])
+            'rag_context': response_data.get('rag_context', []),
+            'generation_status': response_data.get('generation_status')
         })
         
     except Exception as e:
@@ -71,3 +69,128 @@ def help_bot_query():
             'error': 'An error occurred while processing your query',
             'response': "I'm here to help! Could you please rephrase your question? 😊"
         }), 500
+
+def _sse_event(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@help_bot_bp.route('/api/help-bot/query/stream', methods=['POST'])
+@require_login
+def help_bot_query_stream():
+    """Stream a help bot answer as Server-Sent Events
+
+    Events: ``context`` (retrieval result with the best matching answer, sent
+    before generation starts), ``token`` (each generated text chunk), ``done``
+    (final text) or ``error``. Validation failures return JSON like
+    /api/help-bot/query.
+    """
+    user_query, context = _query_and_context()
+    
+    if not user_query:
+        return jsonify({
+            'success': False,
+            'error': 'Query is required'
+        }), 400
+    
+    user_role = session.get('role', 'tutor')
+    rag = get_rag_system()
+    
+    if not rag.ensure_index_loaded():
+        return jsonify({
+            'success': False,
+            'error': 'RAG index not initialized. Please run build_rag_index.py first.',
+            'response': "I'm setting up my knowledge base. Please try again in a moment! 😊"
+        }), 500
+    
+    def generate():
+        try:
+            for event, payload in rag.stream_rag_response(user_query=user_query, user_role=user_role, context=context):
+                yield _sse_event(event, payload)
+        except Exception as e:
+            import traceback
+            print(f"Error in help_bot_query_stream: {e}")
+            print(traceback.format_exc())
+            yield _sse_event('error', {
+                'error': 'An error occurred while processing your query',
+                'response': DEFAULT_RESPONSE
+            })
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Tell nginx to pass chunks through unbuffered
+    })
+
+# Upper bound on queries per batch request so one call cannot monopolise a worker
+MAX_BATCH_QUERIES = 50
+
+@help_bot_bp.route('/api/help-bot/query/batch', methods=['POST'])
+@require_login
+def help_bot_query_batch():
+    """Retrieve knowledge base matches for many queries in one request
+
+    Retrieval only: all queries are vectorized and searched together, and each
+    result carries the best matching answer when it clears the similarity
+    threshold. No Gemini calls are made.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            data = {}
+        queries = data.get('queries')
+        top_k = data.get('top_k', 3)
+        
+        if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+            return jsonify({
+                'success': False,
+                'error': 'queries must be a non-empty list of non-empty strings'
+            }), 400
+        
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({
+                'success': False,
+                'error': f'At most {MAX_BATCH_QUERIES} queries per batch'
+            }), 400
+        
+        # JSON true/false arrive as bool, which is an int subclass
+        if isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= 10:
+            return jsonify({
+                'success': False,
+                'error': 'top_k must be an integer between 1 and 10'
+            }), 400
+        
+        rag = get_rag_system()
+        
+        if not rag.ensure_index_loaded():
+            return jsonify({
+                'success': False,
+                'error': 'RAG index not initialized. Please run build_rag_index.py first.'
+            }), 500
+        
+        queries = [q.strip() for q in queries]
+        batch_results = rag.search_similar_batch(queries, top_k=top_k)
+        
+        results = []
+        for query, matches in zip(queries, batch_results):
+            used_rag = bool(matches) and matches[0][1] >= rag.similarity_threshold
+            record_help_bot_retrieval(used_rag)
+            results.append({
+                'query': query,
+                'used_rag': used_rag,
+                'response': matches[0][0]['answer'] if used_rag else None,
+                'matches': [{'id': qa['id'], 'question': qa['question'], 'score': score}
+                            for qa, score in matches]
+            })
+        
+        return jsonify({
+            'success': True,
+            'results': results
+        })
+        
+    except Exception as e:
+        import traceback
+        print(f"Error in help_bot_query_batch: {e}")
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while processing your queries'
+        }), 500
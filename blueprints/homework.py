@@ -1,11 +1,13 @@
 """Homework management blueprint"""
-from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, send_from_directory, flash
-from datetime import datetime, date, timedelta
 import os
+from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, flash, abort
+from datetime import datetime, date, timedelta
 from database import get_db_connection
-from utils import require_login, allowed_file, get_secure_filename, get_ist_now, get_ist_today, cleanup_expired_homework
+from utils import require_login, allowed_file, get_ist_today, cleanup_expired_homework
 from utils.push_notifications import send_notification_to_students
-from config import Config
+from utils.file_delivery import send_upload
+from utils.blob_store import store_upload, is_blob_path
+from utils.upload_derivatives import variant_path
 
 homework_bp = Blueprint('homework', __name__, url_prefix='')
 
@@ -77,19 +79,8 @@ def share_homework():
         student_id = request.form.get('student_id') or None
         submission_date = request.form.get('submission_date', '').strip()
         
-        # Handle file upload
-        file_path = None
-        if 'file' in request.files:
-            file = request.files['file']
-            if file and file.filename and allowed_file(file.filename):
-                filename = get_secure_filename(file.filename)
-                # Add timestamp to avoid conflicts
-                timestamp = get_ist_now().strftime('%Y%m%d_%H%M%S_')
-                filename = timestamp + filename
-                file_path = os.path.join('homework', filename)
-                full_path = os.path.join(Config.UPLOAD_FOLDER, file_path)
-                file.save(full_path)
-                file_path = file_path.replace('\\', '/')  # Normalize path
+        # Oversized files were already rejected while streaming (see app.request_too_large)
+        file = request.files.get('file')
         
         # Validation
         if not title or not title.strip():
@@ -114,20 +105,11 @@ def share_homework():
             today = get_ist_today().isoformat()
             return render_template('homework/share_homework.html', batches=batches, students=students, today=today)
         
-        # Validate file size
-        if 'file' in request.files:
-            file = request.files['file']
-            if file and file.filename:
-                if file.content_length and file.content_length > Config.MAX_FILE_SIZE:
-                    flash(f'File size exceeds {Config.MAX_FILE_SIZE // (1024*1024)}MB limit', 'error')
-                    conn.close()
-                    cursor.execute('SELECT * FROM batches WHERE user_id = ? ORDER BY name', (session['user_id'],))
-                    batches = cursor.fetchall()
-                    cursor.execute('SELECT * FROM students WHERE user_id = ? ORDER BY name', (session['user_id'],))
-                    students = cursor.fetchall()
-                    conn.close()
-                    today = get_ist_today().isoformat()
-                    return render_template('homework/share_homework.html', batches=batches, students=students, today=today)
+        # Handle file upload (stored once per unique content)
+        file_path = None
+        file_name = None
+        if file and file.filename and allowed_file(file.filename):
+            file_path, file_name = store_upload(conn, file)
         
         if title:
             if batch_id:
@@ -144,9 +126,9 @@ def share_homework():
                 submission_date = get_ist_today().isoformat()
             
             cursor.execute('''
-                INSERT INTO homework (title, content, file_path, youtube_url, batch_id, student_id, submission_date, user_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (title, content, file_path, youtube_url, batch_id, student_id, submission_date, session['user_id']))
+                INSERT INTO homework (title, content, file_path, file_name, youtube_url, batch_id, student_id, submission_date, user_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (title, content, file_path, file_name, youtube_url, batch_id, student_id, submission_date, session['user_id']))
             homework_id = cursor.lastrowid
             conn.commit()
             
@@ -201,12 +183,59 @@ def share_homework():
     
     return render_template('homework/share_homework.html', batches=batches, students=students, today=today)
 
+def find_accessible_upload(cursor, file_path):
+    """Homework row (file_name) through which the logged-in user may download a file, or None
+
+    Tutors may download files attached to their own homework; students files
+    attached to homework for their batch or for them personally.
+    """
+    if session.get('role') == 'student':
+        cursor.execute('''
+            SELECT h.file_name
+            FROM homework h
+            JOIN students s ON s.id = ?
+            WHERE h.file_path = ? AND h.user_id = s.user_id
+            AND (h.batch_id = s.batch_id OR h.student_id = s.id)
+            LIMIT 1
+        ''', (session.get('student_id'), file_path))
+    else:
+        cursor.execute('SELECT file_name FROM homework WHERE file_path = ? AND user_id = ? LIMIT 1',
+                       (file_path, session['user_id']))
+    return cursor.fetchone()
+
 @homework_bp.route('/uploads/<path:filename>')
 @require_login
 def uploaded_file(filename):
-    """Serve uploaded files"""
-    from flask import current_app
-    return send_from_directory(Config.UPLOAD_FOLDER, filename)
+    """Serve uploaded files (after an ownership check, via Config.FILE_DELIVERY_MODE)
+
+    Images are served as their resized display copy unless ?variant=original is
+    given; ?variant=thumb serves the list thumbnail. Files without copies are
+    always served as they are.
+    """
+    variant = request.args.get('variant', 'display')
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    homework = find_accessible_upload(cursor, filename)
+    served_path, settled = variant_path(cursor, filename, variant) if homework else (None, True)
+    conn.close()
+    
+    if not homework:
+        # Same response as a missing file so other tutors' file names are not revealed
+        abort(404)
+    
+    download_name = homework['file_name']
+    etag = None
+    immutable = False
+    if is_blob_path(filename):
+        # Blob names are content hashes, so the URL pins the content once the variant is settled
+        sha256 = os.path.basename(filename).split('.', 1)[0]
+        etag = f'{sha256}.{variant}' if served_path else sha256
+        immutable = settled
+    if served_path:
+        if download_name:
+            download_name = download_name.rsplit('.', 1)[0] + '.jpg'
+        filename = served_path
+    return send_upload(filename, download_name=download_name, etag=etag, immutable=immutable)
 
 @homework_bp.route('/homework/<int:homework_id>/edit', methods=['GET', 'POST'])
 @require_login
@@ -224,18 +253,8 @@ def edit_homework(homework_id):
         submission_date = request.form.get('submission_date', '').strip()
         remove_file = request.form.get('remove_file') == '1'
         
-        # Handle file upload
-        file_path = None
-        if 'file' in request.files:
-            file = request.files['file']
-            if file and file.filename and allowed_file(file.filename):
-                filename = get_secure_filename(file.filename)
-                timestamp = get_ist_now().strftime('%Y%m%d_%H%M%S_')
-                filename = timestamp + filename
-                file_path = os.path.join('homework', filename)
-                full_path = os.path.join(Config.UPLOAD_FOLDER, file_path)
-                file.save(full_path)
-                file_path = file_path.replace('\\', '/')
+        # Oversized files were already rejected while streaming (see app.request_too_large)
+        file = request.files.get('file')
         
         # Validation
         if not title or not title.strip():
@@ -276,21 +295,30 @@ def edit_homework(homework_id):
             if not submission_date:
                 submission_date = get_ist_today().isoformat()
             
+            # Handle file upload (stored once per unique content)
+            file_path = None
+            file_name = None
+            if file and file.filename and allowed_file(file.filename):
+                file_path, file_name = store_upload(conn, file)
+            
             # Get existing homework to preserve file_path if not updating
-            cursor.execute('SELECT file_path FROM homework WHERE id = ? AND user_id = ?', 
+            cursor.execute('SELECT file_path, file_name FROM homework WHERE id = ? AND user_id = ?', 
                          (homework_id, session['user_id']))
             existing = cursor.fetchone()
             
+            # A replaced or removed file is garbage collected once no homework references it
             if remove_file:
                 file_path = None
+                file_name = None
             elif not file_path and existing:
                 file_path = existing['file_path']
+                file_name = existing['file_name']
             
             cursor.execute('''
                 UPDATE homework 
-                SET title = ?, content = ?, file_path = ?, youtube_url = ?, batch_id = ?, student_id = ?, submission_date = ?
+                SET title = ?, content = ?, file_path = ?, file_name = ?, youtube_url = ?, batch_id = ?, student_id = ?, submission_date = ?
                 WHERE id = ? AND user_id = ?
-            ''', (title, content, file_path, youtube_url, batch_id, student_id, submission_date, homework_id, session['user_id']))
+            ''', (title, content, file_path, file_name, youtube_url, batch_id, student_id, submission_date, homework_id, session['user_id']))
             conn.commit()
             conn.close()
             flash('Homework updated successfully!', 'success')
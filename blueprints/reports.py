@@ -2,8 +2,13 @@
 from flask import Blueprint, render_template, redirect, url_for, session, request
 from datetime import date, timedelta
 from calendar import monthrange
+import numpy as np
 from database import get_db_connection
 from utils import require_login, get_ist_today, cleanup_old_attendance
+from utils.fragment_cache import LazyValue, fragment_key
+from utils.attendance_archive import attendance_statuses, attendance_counts
+from utils.attendance_grid import month_grid, parse_month, adjacent_months
+from utils.sql_trace import query_budget
 
 # Map day abbreviations to weekday numbers (0=Monday, 6=Sunday)
 DAY_MAP = {
@@ -20,109 +25,91 @@ reports_bp = Blueprint('reports', __name__, url_prefix='')
 
 @reports_bp.route('/reports')
 @require_login
+@query_budget(12)
 def reports():
-    """Attendance summary report for all batches and students (current month)"""
+    """Attendance summary report for all batches and students (current month)
+
+    Both lists are rendered inside {% cache %} blocks keyed on the tutor's data
+    versions, so they are only computed when attendance, students or batches
+    changed since the last view (or the cached copy expired).
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     
     user_id = session['user_id']
     today = get_ist_today()
     active_tab = request.args.get('tab', 'batches')  # Default to batches tab
+    report_cache_key = fragment_key(cursor, 'reports', user_id, today.isoformat())
     
-    # Get current month date range
-    current_month = today.month
-    current_year = today.year
-    month_days = monthrange(current_year, current_month)[1]
+    conn.close()
     
-    # Generate all dates for current month (up to today)
-    current_month_dates = []
-    for day in range(1, month_days + 1):
-        d = date(current_year, current_month, day)
-        if d <= today:
-            current_month_dates.append(d)
+    return render_template('reports/reports.html', 
+                         batch_reports=LazyValue(_load_report, _batch_reports, user_id, today),
+                         student_reports=LazyValue(_load_report, _student_reports, user_id, today),
+                         report_cache_key=report_cache_key,
+                         active_tab=active_tab)
+
+def _load_report(builder, user_id, today):
+    conn = get_db_connection()
+    try:
+        return builder(conn.cursor(), user_id, today)
+    finally:
+        conn.close()
+
+def _current_month_dates(today):
+    """Dates of the current month up to today"""
+    return [date(today.year, today.month, day) for day in range(1, today.day + 1)]
+
+def _parse_batch_days(batch_days_str):
+    """Parse batch days (e.g., "mo,tu,we" -> [0, 1, 2])"""
+    day_list = [d.strip() for d in (batch_days_str or '').split(',') if d.strip()]
+    return [DAY_MAP[day] for day in day_list if day in DAY_MAP]
+
+def _count_class_days(dates, batch_weekdays):
+    """Days in ``dates`` the batch has classes; every day if no batch days are set"""
+    if not batch_weekdays:
+        return len(dates)
+    return sum(1 for d in dates if d.weekday() in batch_weekdays)
+
+def _attendance_totals(cursor, user_id, start, end, student_ids):
+    """Present, late and absent counts between two dates as arrays aligned with student_ids"""
+    counts = attendance_counts(cursor, user_id, start, end, student_ids)
+    empty = {'present': 0, 'late': 0, 'absent': 0}
+    return tuple(np.array([counts.get(student_id, empty)[status] for student_id in student_ids], dtype=np.int64)
+                 for status in ('present', 'late', 'absent'))
+
+def _batch_reports(cursor, user_id, today):
+    """Current month attendance summary for each batch"""
+    current_month_dates = _current_month_dates(today)
     
     # Get all batches with their schedule days
     cursor.execute('SELECT * FROM batches WHERE user_id = ? ORDER BY name', (user_id,))
     batches = cursor.fetchall()
     
+    # One attendance matrix for all the tutor's students, sliced per batch
+    cursor.execute('SELECT id, batch_id FROM students WHERE user_id = ?', (user_id,))
+    students = cursor.fetchall()
+    student_ids = [s['id'] for s in students]
+    first_of_month = date(today.year, today.month, 1)
+    present, late, _ = _attendance_totals(cursor, user_id, first_of_month, today, student_ids)
+    attended = present + late
+    present_today, late_today, absent_today = _attendance_totals(cursor, user_id, today, today, student_ids)
+    batch_ids = np.array([s['batch_id'] or 0 for s in students], dtype=np.int64)
+    
     batch_reports = []
     for batch in batches:
         batch_id = batch['id']
-        batch_days_str = batch['days'] or ''
+        batch_weekdays = _parse_batch_days(batch['days'])
+        in_batch = batch_ids == batch_id
+        student_count = int(in_batch.sum())
         
-        # Parse batch days (e.g., "mo,tu,we" -> [0, 1, 2])
-        batch_weekdays = []
-        if batch_days_str:
-            day_list = [d.strip() for d in batch_days_str.split(',') if d.strip()]
-            batch_weekdays = [DAY_MAP[day] for day in day_list if day in DAY_MAP]
-        
-        # Get all students in this batch
-        cursor.execute('SELECT id FROM students WHERE batch_id = ? AND user_id = ?', (batch_id, user_id))
-        students = cursor.fetchall()
-        student_ids = [s['id'] for s in students]
-        
-        if not student_ids:
+        if not student_count:
             continue
         
-        # Calculate total expected sessions for current month
-        # Count class days in current month (up to today) based on batch schedule
-        total_class_days = 0
-        if batch_weekdays:
-            for d in current_month_dates:
-                if d.weekday() in batch_weekdays:
-                    total_class_days += 1
-        else:
-            # If no batch days specified, count all days up to today
-            total_class_days = len(current_month_dates)
-        
-        # Total expected = number of students * number of class days
-        total_expected = len(student_ids) * total_class_days
-        
-        # Get actual attendance records for these students in current month
-        attended_sessions = 0
-        
-        if student_ids and total_class_days > 0:
-            placeholders = ','.join(['?'] * len(student_ids))
-            month_date_strings = [d.isoformat() for d in current_month_dates]
-            date_placeholders = ','.join(['?'] * len(month_date_strings))
-            
-            # Check if 'present' column exists in attendance table
-            cursor.execute("PRAGMA table_info(attendance)")
-            columns = [row[1] for row in cursor.fetchall()]
-            has_present_column = 'present' in columns
-            has_status_column = 'status' in columns
-            
-            # Build query based on available columns
-            if has_status_column:
-                # Use status column (new schema) - count present (1) or late (2)
-                query = f'''
-                    SELECT 
-                        COALESCE(SUM(CASE WHEN status IN (1, 2) THEN 1 ELSE 0 END), 0) as attended_sessions
-                    FROM attendance
-                    WHERE student_id IN ({placeholders})
-                    AND user_id = ?
-                    AND date IN ({date_placeholders})
-                '''
-            elif has_present_column:
-                # Use present column (old schema)
-                query = f'''
-                    SELECT 
-                        COALESCE(SUM(CASE WHEN present = 1 THEN 1 ELSE 0 END), 0) as attended_sessions
-                    FROM attendance
-                    WHERE student_id IN ({placeholders})
-                    AND user_id = ?
-                    AND date IN ({date_placeholders})
-                '''
-            else:
-                # No attendance table structure - use defaults (already 0)
-                query = None
-            
-            if query:
-                params = student_ids + [user_id] + month_date_strings
-                cursor.execute(query, params)
-                result = cursor.fetchone()
-                if result:
-                    attended_sessions = result['attended_sessions'] if result['attended_sessions'] is not None else 0
+        # Total expected = number of students * number of class days (current month up to today)
+        total_class_days = _count_class_days(current_month_dates, batch_weekdays)
+        total_expected = student_count * total_class_days
+        attended_sessions = int(attended[in_batch].sum()) if total_class_days > 0 else 0
         
         # Calculate attendance percentage
         if total_expected > 0:
@@ -131,61 +118,24 @@ def reports():
         else:
             attendance_percentage = 0
         
-        # Get today's attendance stats (Present and Absent)
-        today_str = today.isoformat()
-        present_today = 0
-        absent_today = 0
-        
-        if student_ids:
-            placeholders = ','.join(['?'] * len(student_ids))
-            cursor.execute("PRAGMA table_info(attendance)")
-            columns = [row[1] for row in cursor.fetchall()]
-            has_present_column = 'present' in columns
-            has_status_column = 'status' in columns
-            
-            if has_status_column:
-                # Count present (1) and late (2) as present, absent (0) as absent
-                query = f'''
-                    SELECT 
-                        COALESCE(SUM(CASE WHEN status IN (1, 2) THEN 1 ELSE 0 END), 0) as present_count,
-                        COALESCE(SUM(CASE WHEN status = 0 THEN 1 ELSE 0 END), 0) as absent_count
-                    FROM attendance
-                    WHERE student_id IN ({placeholders})
-                    AND user_id = ?
-                    AND date = ?
-                '''
-            elif has_present_column:
-                query = f'''
-                    SELECT 
-                        COALESCE(SUM(CASE WHEN present = 1 THEN 1 ELSE 0 END), 0) as present_count,
-                        COALESCE(SUM(CASE WHEN present = 0 THEN 1 ELSE 0 END), 0) as absent_count
-                    FROM attendance
-                    WHERE student_id IN ({placeholders})
-                    AND user_id = ?
-                    AND date = ?
-                '''
-            else:
-                query = None
-            
-            if query:
-                params = student_ids + [user_id, today_str]
-                cursor.execute(query, params)
-                result = cursor.fetchone()
-                if result:
-                    present_today = result['present_count'] if result['present_count'] is not None else 0
-                    absent_today = result['absent_count'] if result['absent_count'] is not None else 0
-        
         batch_reports.append({
             'batch_id': batch_id,
             'batch_name': batch['name'],
-            'student_count': len(student_ids),
+            'student_count': student_count,
             'total_expected': total_expected,
             'attended_sessions': attended_sessions,
             'attendance_percentage': attendance_percentage,
-            'present_today': present_today,
-            'absent_today': absent_today
+            # Today's stats: late counts as present
+            'present_today': int((present_today + late_today)[in_batch].sum()),
+            'absent_today': int(absent_today[in_batch].sum())
         })
     
+    return batch_reports
+
+def _student_reports(cursor, user_id, today):
+    """Current month attendance summary for each student"""
+    current_month_dates = _current_month_dates(today)
+    
     # Get all students for student reports with batch info
     cursor.execute('''
         SELECT s.*, b.name as batch_name, b.days as batch_days
@@ -196,86 +146,17 @@ def reports():
     ''', (user_id,))
     all_students = cursor.fetchall()
     
-    # Get current month date range
-    today = get_ist_today()
-    current_month = today.month
-    current_year = today.year
-    month_days = monthrange(current_year, current_month)[1]
-    
-    # Generate all dates for current month
-    current_month_dates = []
-    for day in range(1, month_days + 1):
-        d = date(current_year, current_month, day)
-        # Only include dates up to today (not future dates)
-        if d <= today:
-            current_month_dates.append(d)
+    present, late, _ = _attendance_totals(cursor, user_id, date(today.year, today.month, 1), today,
+                                          [s['id'] for s in all_students])
+    attended = present + late
     
     student_reports = []
-    for student in all_students:
-        student_id = student['id']
-        batch_days_str = student['batch_days'] or ''
-        
-        # Parse batch days (e.g., "mo,tu,we" -> [0, 1, 2])
-        batch_weekdays = []
-        if batch_days_str:
-            day_list = [d.strip() for d in batch_days_str.split(',') if d.strip()]
-            batch_weekdays = [DAY_MAP[day] for day in day_list if day in DAY_MAP]
+    for index, student in enumerate(all_students):
+        # Total days classes happened: current month dates (up to today) on the batch's scheduled days
+        total_days_classes = _count_class_days(current_month_dates, _parse_batch_days(student['batch_days']))
         
-        # Calculate total days classes happened in current month
-        # Count dates that are:
-        # 1. In the current month (up to today)
-        # 2. On the batch's scheduled days
-        total_days_classes = 0
-        if batch_weekdays:
-            for d in current_month_dates:
-                if d.weekday() in batch_weekdays:
-                    total_days_classes += 1
-        else:
-            # If no batch days specified, count all days up to today
-            total_days_classes = len(current_month_dates)
-        
-        # Get present days (status 1 or 2) for current month
-        present_days = 0
-        if total_days_classes > 0:
-            # Check which columns exist
-            cursor.execute("PRAGMA table_info(attendance)")
-            columns = [row[1] for row in cursor.fetchall()]
-            has_present_column = 'present' in columns
-            has_status_column = 'status' in columns
-            
-            # Get dates in current month as strings
-            month_date_strings = [d.isoformat() for d in current_month_dates]
-            
-            if month_date_strings:
-                placeholders = ','.join(['?'] * len(month_date_strings))
-                
-                if has_status_column:
-                    query = f'''
-                        SELECT COUNT(*) as present_count
-                        FROM attendance
-                        WHERE student_id = ?
-                        AND user_id = ?
-                        AND date IN ({placeholders})
-                        AND status IN (1, 2)
-                    '''
-                elif has_present_column:
-                    query = f'''
-                        SELECT COUNT(*) as present_count
-                        FROM attendance
-                        WHERE student_id = ?
-                        AND user_id = ?
-                        AND date IN ({placeholders})
-                        AND present = 1
-                    '''
-                else:
-                    query = None
-                
-                if query:
-                    params = [student_id, user_id] + month_date_strings
-                    cursor.execute(query, params)
-                    result = cursor.fetchone()
-                    if result:
-                        present_days = result['present_count'] if result['present_count'] is not None else 0
+        # Present days (present or late) for current month
+        present_days = int(attended[index]) if total_days_classes > 0 else 0
         
         # Calculate attendance percentage
         if total_days_classes > 0:
@@ -285,7 +166,7 @@ def reports():
             attendance_percentage = 0
         
         student_reports.append({
-            'student_id': student_id,
+            'student_id': student['id'],
             'student_name': student['name'],
             'student_phone': student['phone'],
             'batch_name': student['batch_name'] or 'No Batch',
@@ -294,15 +175,11 @@ def reports():
             'attendance_percentage': attendance_percentage
         })
     
-    conn.close()
-    
-    return render_template('reports/reports.html', 
-                         batch_reports=batch_reports,
-                         student_reports=student_reports,
-                         active_tab=active_tab)
+    return student_reports
 
 @reports_bp.route('/reports/batch/<int:batch_id>')
 @require_login
+@query_budget(10)
 def batch_report_detail(batch_id):
     """Detailed attendance report for a specific batch with date selection"""
     conn = get_db_connection()
@@ -361,46 +238,16 @@ def batch_report_detail(batch_id):
     ''', (batch_id, user_id))
     students = cursor.fetchall()
     
+    # Last 30 days of attendance for every student, from the archive for closed months
+    statuses = attendance_statuses(cursor, user_id, today - timedelta(days=29), today,
+                                   [student['id'] for student in students])
+    
     student_reports = []
     for student in students:
         student_id = student['id']
         
-        # Get attendance for each day in the date range
-        # Check which columns exist
-        cursor.execute("PRAGMA table_info(attendance)")
-        columns = [row[1] for row in cursor.fetchall()]
-        has_present_column = 'present' in columns
-        has_status_column = 'status' in columns
-        
-        attendance_by_date = {}
-        for date_str in date_range:
-            if has_status_column:
-                # Use status column
-                cursor.execute('''
-                    SELECT status
-                    FROM attendance
-                    WHERE student_id = ? AND date = ? AND user_id = ?
-                ''', (student_id, date_str, user_id))
-            elif has_present_column:
-                # Use present column and convert to status format
-                cursor.execute('''
-                    SELECT present
-                    FROM attendance
-                    WHERE student_id = ? AND date = ? AND user_id = ?
-                ''', (student_id, date_str, user_id))
-            else:
-                # No attendance table structure
-                result = None
-            
-            result = cursor.fetchone()
-            if result:
-                if has_status_column:
-                    attendance_by_date[date_str] = result['status'] if result['status'] is not None else -1
-                else:
-                    # Convert present (0/1) to status format (0=absent, 1=present, -1=no record)
-                    attendance_by_date[date_str] = result['present'] if result['present'] is not None else -1
-            else:
-                attendance_by_date[date_str] = -1  # -1 means no record
+        student_statuses = statuses.get(student_id, {})
+        attendance_by_date = {date_str: student_statuses.get(date.fromisoformat(date_str), -1) for date_str in date_range}
         
         # Calculate student statistics for 30 days
         total_days = len(date_range)
@@ -501,8 +348,12 @@ def batch_report_detail(batch_id):
 
 @reports_bp.route('/reports/student/<int:student_id>')
 @require_login
+@query_budget(8)
 def student_report_detail(student_id):
-    """Monthly attendance grid for a specific student (current month only)"""
+    """Monthly attendance grid for a specific student
+
+    Shows the current month, or a closed month from the archive with ?month=YYYY-MM.
+    """
     # Clean up old attendance records before showing report
     cleanup_old_attendance()
     
@@ -525,100 +376,25 @@ def student_report_detail(student_id):
         conn.close()
         return redirect(url_for('reports.reports'))
     
-    # Only allow viewing current month - ignore month/year params
-    month = today.month
-    year = today.year
-    
-    # Generate all dates for the selected month
-    month_days = monthrange(year, month)[1]  # Number of days in month
-    
-    date_range = []
-    for day in range(1, month_days + 1):
-        d = date(year, month, day)
-        date_range.append(d.isoformat())
-    
-    # Get first day of month to calculate which day of week it starts on
-    first_day = date(year, month, 1)
-    first_day_weekday = first_day.weekday()  # 0 = Monday, 6 = Sunday
-    
-    # Get last day of month to calculate which day of week it ends on
-    last_day = date(year, month, month_days)
-    last_day_weekday = last_day.weekday()  # 0 = Monday, 6 = Sunday
-    remaining_cells = 6 - last_day_weekday  # Empty cells needed after month ends
-    
-    # Get attendance for each day in the date range
-    # Check which columns exist
-    cursor.execute("PRAGMA table_info(attendance)")
-    columns = [row[1] for row in cursor.fetchall()]
-    has_present_column = 'present' in columns
-    has_status_column = 'status' in columns
-    
-    attendance_by_date = {}
-    for date_str in date_range:
-        if has_status_column:
-            # Use status column
-            cursor.execute('''
-                SELECT status
-                FROM attendance
-                WHERE student_id = ? AND date = ? AND user_id = ?
-            ''', (student_id, date_str, user_id))
-        elif has_present_column:
-            # Use present column
-            cursor.execute('''
-                SELECT present
-                FROM attendance
-                WHERE student_id = ? AND date = ? AND user_id = ?
-            ''', (student_id, date_str, user_id))
-        else:
-            result = None
-        
-        result = cursor.fetchone()
-        if result:
-            if has_status_column:
-                attendance_by_date[date_str] = result['status'] if result['status'] is not None else -1
-            else:
-                # Convert present (0/1) to status format (0=absent, 1=present, -1=no record)
-                attendance_by_date[date_str] = result['present'] if result['present'] is not None else -1
-        else:
-            attendance_by_date[date_str] = -1  # -1 means no record
-    
-    # Calculate statistics for the month
-    present_count = sum(1 for status in attendance_by_date.values() if status == 1)
-    late_count = sum(1 for status in attendance_by_date.values() if status == 2)
-    absent_count = sum(1 for status in attendance_by_date.values() if status == 0)
-    na_count = sum(1 for status in attendance_by_date.values() if status == -1)
-    attended_count = present_count + late_count
+    # Current month unless an earlier archived month is requested
+    year, month = parse_month(request.args.get('month'), today)
+    grid = month_grid(cursor, user_id, student_id, year, month)
+    prev_month, next_month = adjacent_months(cursor, student_id, today, grid['month_key'])
     
     # Calculate attendance percentage (only for days with records)
-    days_with_records = month_days - na_count
+    days_with_records = grid['month_days'] - grid['na_count']
     if days_with_records > 0:
-        attendance_percentage = round((attended_count / days_with_records) * 100)
+        attendance_percentage = round((grid['attended_count'] / days_with_records) * 100)
     else:
         attendance_percentage = 0
     
-    # Month names
-    month_names = ['January', 'February', 'March', 'April', 'May', 'June',
-                   'July', 'August', 'September', 'October', 'November', 'December']
-    month_name = month_names[month - 1]
-    
     conn.close()
     
     return render_template('reports/student_report_detail.html',
                          student=student,
-                         attendance_by_date=attendance_by_date,
-                         date_range=date_range,
-                         present_count=present_count,
-                         late_count=late_count,
-                         absent_count=absent_count,
-                         na_count=na_count,
-                         attended_count=attended_count,
                          attendance_percentage=attendance_percentage,
                          today=today,
-                         month=month,
-                         year=year,
-                         month_name=month_name,
-                         month_days=month_days,
-                         first_day_weekday=first_day_weekday,
-                         last_day_weekday=last_day_weekday,
-                         remaining_cells=remaining_cells)
+                         prev_month=prev_month,
+                         next_month=next_month,
+                         **grid)
 
@@ -1,14 +1,17 @@
 """Student portal blueprint"""
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from datetime import date, timedelta, datetime
-from calendar import monthrange
 from database import get_db_connection
 from utils import require_login, get_ist_now, get_ist_today, cleanup_expired_homework
+from utils.attendance_archive import attendance_counts
+from utils.attendance_grid import month_grid, parse_month, adjacent_months
+from utils.sql_trace import query_budget
 
 student_bp = Blueprint('student', __name__, url_prefix='')
 
 @student_bp.route('/student/dashboard')
 @require_login
+@query_budget(14)
 def dashboard():
     """Student dashboard"""
     # Check if user is a student
@@ -64,19 +67,17 @@ def dashboard():
     ''', (student_id, today))
     today_attendance = cursor.fetchone()
     
-    # Get attendance stats (last 30 days)
-    thirty_days_ago = (get_ist_today() - timedelta(days=29)).isoformat()
-    cursor.execute('''
-        SELECT 
-            COUNT(*) as total_days,
-            SUM(CASE WHEN COALESCE(status, present, 0) IN (1, 2) THEN 1 ELSE 0 END) as attended_days,
-            SUM(CASE WHEN COALESCE(status, present, 0) = 1 THEN 1 ELSE 0 END) as present_days,
-            SUM(CASE WHEN COALESCE(status, present, 0) = 2 THEN 1 ELSE 0 END) as late_days,
-            SUM(CASE WHEN COALESCE(status, present, 0) = 0 THEN 1 ELSE 0 END) as absent_days
-        FROM attendance
-        WHERE student_id = ? AND date >= ?
-    ''', (student_id, thirty_days_ago))
-    attendance_stats = cursor.fetchone()
+    # Get attendance stats (last 30 days, from the monthly totals)
+    today = get_ist_today()
+    counts = attendance_counts(cursor, student['user_id'], today - timedelta(days=29), today, [student_id])
+    counts = counts.get(student_id, {'present': 0, 'late': 0, 'absent': 0})
+    attendance_stats = {
+        'total_days': counts['present'] + counts['late'] + counts['absent'],
+        'attended_days': counts['present'] + counts['late'],
+        'present_days': counts['present'],
+        'late_days': counts['late'],
+        'absent_days': counts['absent']
+    }
     
     # Calculate attendance percentage
     if attendance_stats and attendance_stats['total_days'] and attendance_stats['total_days'] > 0:
@@ -181,6 +182,7 @@ def dashboard():
 
 @student_bp.route('/student/attendance')
 @require_login
+@query_budget(10)
 def attendance():
     """Student attendance view"""
     if session.get('role') != 'student':
@@ -202,68 +204,86 @@ def attendance():
         session.clear()
         return redirect(url_for('auth.student_login'))
     
-    # Get attendance stats (last 30 days)
-    thirty_days_ago = (get_ist_today() - timedelta(days=29)).isoformat()
-    cursor.execute('''
-        SELECT 
-            COUNT(*) as total_days,
-            SUM(CASE WHEN COALESCE(status, present, 0) IN (1, 2) THEN 1 ELSE 0 END) as attended_days,
-            SUM(CASE WHEN COALESCE(status, present, 0) = 1 THEN 1 ELSE 0 END) as present_days,
-            SUM(CASE WHEN COALESCE(status, present, 0) = 2 THEN 1 ELSE 0 END) as late_days,
-            SUM(CASE WHEN COALESCE(status, present, 0) = 0 THEN 1 ELSE 0 END) as absent_days
-        FROM attendance
-        WHERE student_id = ? AND date >= ?
-    ''', (student_id, thirty_days_ago))
-    attendance_stats = cursor.fetchone()
-    
-    # Get current month dates (e.g., December 1-31) - IST
+    # Get attendance stats (last 30 days, from the monthly totals)
     today = get_ist_today()
-    current_month = today.month
-    current_year = today.year
-    
-    # Generate all dates for current month
-    month_days = monthrange(current_year, current_month)[1]  # Number of days in month
-    
-    date_range = []
-    for day in range(1, month_days + 1):
-        d = date(current_year, current_month, day)
-        date_range.append(d.isoformat())
-    
-    # Get first day of month to calculate which day of week it starts on
-    first_day = date(current_year, current_month, 1)
-    first_day_weekday = first_day.weekday()  # 0 = Monday, 6 = Sunday
-    
-    attendance_by_date = {}
-    for date_str in date_range:
-        cursor.execute('''
-            SELECT COALESCE(status, present, -1) as status
-            FROM attendance
-            WHERE student_id = ? AND date = ?
-        ''', (student_id, date_str))
-        result = cursor.fetchone()
-        if result:
-            attendance_by_date[date_str] = result['status'] if result['status'] is not None else -1
-        else:
-            attendance_by_date[date_str] = -1
+    counts = attendance_counts(cursor, student['user_id'], today - timedelta(days=29), today, [student_id])
+    counts = counts.get(student_id, {'present': 0, 'late': 0, 'absent': 0})
+    attendance_stats = {
+        'total_days': counts['present'] + counts['late'] + counts['absent'],
+        'attended_days': counts['present'] + counts['late'],
+        'present_days': counts['present'],
+        'late_days': counts['late'],
+        'absent_days': counts['absent']
+    }
+    
+    # Current month calendar (one range read, see utils.attendance_grid)
+    grid = month_grid(cursor, student['user_id'], student_id, today.year, today.month)
+    prev_month, _ = adjacent_months(cursor, student_id, today, grid['month_key'])
     
     conn.close()
     
-    # Get month name
-    month_names = ['January', 'February', 'March', 'April', 'May', 'June', 
-                   'July', 'August', 'September', 'October', 'November', 'December']
-    month_name = month_names[current_month - 1]
-    
     return render_template('student/attendance.html',
                          student=student,
-                         attendance_by_date=attendance_by_date,
-                         date_range=date_range,
+                         attendance_by_date=grid['attendance_by_date'],
+                         date_range=grid['date_range'],
                          attendance_stats=attendance_stats,
-                         current_month=current_month,
-                         current_year=current_year,
-                         month_name=month_name,
-                         first_day_weekday=first_day_weekday,
+                         current_month=grid['month'],
+                         current_year=grid['year'],
+                         month_name=grid['month_name'],
+                         first_day_weekday=grid['first_day_weekday'],
+                         month_key=grid['month_key'],
+                         prev_month=prev_month,
                          today=today.isoformat())
 
+@student_bp.route('/api/student/attendance/month', methods=['GET'])
+@require_login
+@query_budget(6)
+def attendance_month_api():
+    """A month of the student's attendance calendar as JSON (?month=YYYY-MM, default current)
+
+    The attendance page renders other months from this and the service worker
+    keeps a copy for offline use. Responses carry an ETag, so revisiting an
+    unchanged month costs a 304.
+    """
+    if session.get('role') != 'student':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    student_id = session.get('student_id')
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT user_id FROM students WHERE id = ?', (student_id,))
+    student = cursor.fetchone()
+    if not student:
+        conn.close()
+        return jsonify({'error': 'Student not found'}), 404
+    
+    today = get_ist_today()
+    year, month = parse_month(request.args.get('month'), today)
+    grid = month_grid(cursor, student['user_id'], student_id, year, month)
+    prev_month, next_month = adjacent_months(cursor, student_id, today, grid['month_key'])
+    conn.close()
+    
+    response = jsonify({
+        'month': grid['month_key'],
+        'month_name': grid['month_name'],
+        'year': grid['year'],
+        'month_days': grid['month_days'],
+        'first_day_weekday': grid['first_day_weekday'],
+        'days': grid['attendance_by_date'],
+        'counts': {
+            'present': grid['present_count'],
+            'late': grid['late_count'],
+            'absent': grid['absent_count'],
+            'no_record': grid['na_count']
+        },
+        'prev_month': prev_month,
+        'next_month': next_month,
+        'today': today.isoformat()
+    })
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
 @student_bp.route('/student/homework')
 @require_login
 def homework():
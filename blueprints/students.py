@@ -3,6 +3,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, sessio
 from datetime import date
 from database import get_db_connection
 from utils import require_login, get_ist_today
+from utils.attendance_archive import month_key
 import sqlite3
 import re
 
@@ -288,16 +289,16 @@ def view_student(student_id):
         conn.close()
         return redirect(url_for('students.students'))
     
-    # Get attendance stats
-    # Use COALESCE to handle both 'status' and 'present' columns during migration
+    # Get attendance stats for the current month (closed months are archived),
+    # from the trigger-maintained monthly totals
     cursor.execute('''
         SELECT 
-            COUNT(*) as total_days,
-            SUM(CASE WHEN COALESCE(status, present, 0) = 1 THEN 1 ELSE 0 END) as present_days,
-            SUM(CASE WHEN COALESCE(status, present, 0) = 2 THEN 1 ELSE 0 END) as late_days
-        FROM attendance 
-        WHERE student_id = ? AND user_id = ?
-    ''', (student_id, session['user_id']))
+            COALESCE(SUM(present + late + absent), 0) as total_days,
+            COALESCE(SUM(present), 0) as present_days,
+            COALESCE(SUM(late), 0) as late_days
+        FROM attendance_monthly 
+        WHERE student_id = ? AND month = ? AND user_id = ?
+    ''', (student_id, month_key(get_ist_today()), session['user_id']))
     attendance_stats = cursor.fetchone()
     
     # Get recent attendance (last 10 days)
@@ -0,0 +1,54 @@
+"""Script to build the fingerprinted CSS/JS bundles into static/dist/
+
+Run on every deploy (start.sh does). Each bundle is minified and written as
+<name>.<content hash>.<ext>, and static/dist/manifest.json records which file
+is current; the templates link to it with asset_url(). Each bundle also gets
+.gz/.br copies that are sent to clients accepting them. The service worker is
+rebuilt with the precache manifest, and the output shows how much an
+installed worker downloads for this deploy compared to re-fetching everything.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.assets import build_assets, rcssmin, rjsmin
+from utils.compression import brotli
+
+
+def main():
+    print("=" * 50)
+    print("Building Static Asset Bundles")
+    print("=" * 50)
+
+    if rcssmin is None or rjsmin is None:
+        print("\nNote: rcssmin/rjsmin not installed, using the built-in minifier")
+    if brotli is None:
+        print("Note: brotli not installed, writing gzip copies only")
+
+    report, precache = build_assets()
+
+    total_source = 0
+    total_size = 0
+    total_compressed = 0
+    print()
+    for name, details in report.items():
+        total_source += details['source_size']
+        total_size += details['size']
+        compressed = details['br'] or details['gzip'] or details['size']
+        total_compressed += compressed
+        print(f"   {name:<14} {details['source_size']:>8,} -> {details['size']:>8,} bytes   {details['file']}")
+        print(f"   {'':<14} gzip {details['gzip'] or 0:>8,} / br {details['br'] or 0:>8,} bytes")
+
+    print(f"\n   Service worker precache {precache['version']}: {precache['entries']} files, {precache['size']:,} bytes")
+    print(f"   Changed since last build: {precache['changed']} files, {precache['changed_size']:,} bytes "
+          f"(downloaded by installed workers on update)")
+
+    print("\n" + "=" * 50)
+    print(f"✅ Bundles built: {total_source:,} -> {total_size:,} bytes ({total_compressed:,} compressed)")
+    print("=" * 50)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,10 @@
-"""Script to build FAISS index from help bot Q&A pairs"""
+"""Script to build the help bot RAG index from Q&A pairs
+
+By default the index is updated incrementally: only Q&A pairs that were added,
+edited or removed in data/niya_qa_pairs.json since the last build are
+re-embedded. Use --full to refit the TF-IDF vectorizer from scratch.
+"""
+import argparse
 import json
 import sys
 import os
@@ -9,42 +15,55 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from utils.rag_system import get_rag_system
 
 def main():
+    parser = argparse.ArgumentParser(description='Build the Niya help bot RAG index')
+    parser.add_argument('--full', action='store_true',
+                        help='Refit the vectorizer and rebuild the whole index')
+    args = parser.parse_args()
+
     print("=" * 50)
     print("Building RAG Index for Niya Help Bot")
     print("=" * 50)
-    
+
     # Load Q&A pairs from JSON file
     qa_file = 'data/niya_qa_pairs.json'
     print(f"\n1. Loading Q&A pairs from {qa_file}...")
-    
+
     if not os.path.exists(qa_file):
         print(f"ERROR: {qa_file} not found!")
         print("Please create the Q&A pairs JSON file first.")
         return
-    
+
     with open(qa_file, 'r', encoding='utf-8') as f:
         qa_pairs = json.load(f)
-    
+
     print(f"   Loaded {len(qa_pairs)} Q&A pairs")
-    
+
     # Initialize RAG system
     print("\n2. Initializing RAG system...")
     rag = get_rag_system()
-    
-    # Build FAISS index
-    print("\n3. Building FAISS index with TF-IDF...")
-    print("   This will be very fast (1-2 seconds)...")
-    rag.build_faiss_index(qa_pairs, force_rebuild=True)
-    
+
+    if args.full or not rag.ensure_index_loaded():
+        # Build index
+        print("\n3. Building index with TF-IDF...")
+        print("   This will be very fast (1-2 seconds)...")
+        rag.build_index(qa_pairs, force_rebuild=True)
+    else:
+        print(f"\n3. Updating index generation {rag.generation.name} incrementally...")
+        changes = rag.sync_qa_pairs(qa_pairs)
+        print(f"   Added: {changes['added']}, updated: {changes['updated']}, removed: {changes['removed']}")
+        print(f"   Vocabulary drift since last fit: {rag.vocabulary_drift():.0%}")
+        # A refit may have been scheduled in the background; let it finish before exiting
+        rag.wait_for_refit()
+
     print("\n" + "=" * 50)
     print("✅ RAG Index built successfully!")
     print("=" * 50)
-    print(f"\nTotal Q&A pairs: {len(qa_pairs)}")
-    print(f"Index saved to: {rag.faiss_index_path}")
+    print(f"\nTotal Q&A pairs: {len(rag.qa_pairs)}")
+    print(f"Index generation: {rag.generation.name} (in {rag.index_dir})")
     print(f"Q&A data saved to: {rag.qa_data_path}")
     print(f"\nSimilarity threshold: {rag.similarity_threshold}")
+    print("Running workers pick up the new generation on their next query.")
     print("Ready to use RAG system!")
 
 if __name__ == '__main__':
     main()
-
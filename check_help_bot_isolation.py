@@ -0,0 +1,112 @@
+"""Check that a burst of help bot questions does not starve the rest of the app
+
+Logs in as a tutor, measures a normal page (the probe) while idle, then fires a
+burst of concurrent help bot queries and measures the probe again while they
+run. Run the app with the stub model so every answer is slow:
+
+    NIYA_STUB_MODEL_DELAY=10 gunicorn -c gunicorn_config.py app:app
+    NIYA_STUB_MODEL_DELAY=10 gunicorn -c gunicorn_help_bot_config.py app:app   # optional second pool
+    python3 check_help_bot_isolation.py --mobile 9876543210
+
+With the generation limit in place the probe stays fast: extra questions get
+the knowledge base answer (generation_status "busy") instead of holding a
+worker, and with the help bot pool behind the proxy they do not touch the main
+workers at all.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import Counter
+from http.cookiejar import CookieJar
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def login(base_url, mobile):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    form = urllib.parse.urlencode({'action': 'login', 'mobile': mobile}).encode()
+    opener.open(f"{base_url}/login", data=form, timeout=30)
+    return opener
+
+
+def probe(opener, url, count, interval):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        opener.open(url, timeout=60).read()
+        timings.append(time.perf_counter() - start)
+        time.sleep(interval)
+    return timings
+
+
+def ask(opener, url, question, results):
+    body = json.dumps({'query': question}).encode()
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        data = json.loads(opener.open(request, timeout=120).read())
+        status = data.get('generation_status') or ('ok' if data.get('success') else 'error')
+    except Exception as e:
+        status = f'failed ({e.__class__.__name__})'
+    results.append((time.perf_counter() - start, status))
+
+
+def report(label, timings):
+    print(f"  {label}: p50 {percentile(timings, 50) * 1000:.0f} ms, "
+          f"p95 {percentile(timings, 95) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check help bot isolation from the main worker pool')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000', help='Main app URL')
+    parser.add_argument('--bot-url', default=None, help='Help bot URL if not behind the same proxy (e.g. http://127.0.0.1:5001)')
+    parser.add_argument('--mobile', required=True, help='Mobile number of an existing tutor')
+    parser.add_argument('--probe-path', default='/batches', help='Page to time while the bot is busy')
+    parser.add_argument('--questions', type=int, default=20, help='Concurrent help bot questions in the burst')
+    parser.add_argument('--probes', type=int, default=20, help='Probe requests per phase')
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    bot_url = (args.bot_url or base_url).rstrip('/') + '/api/help-bot/query'
+    probe_url = base_url + args.probe_path
+    opener = login(base_url, args.mobile)
+
+    print("=" * 50)
+    print("Help Bot Isolation Check")
+    print("=" * 50)
+
+    print(f"\n1. Probing {args.probe_path} while idle...")
+    idle = probe(opener, probe_url, args.probes, 0.05)
+    report('idle', idle)
+
+    print(f"\n2. Sending {args.questions} concurrent help bot questions and probing again...")
+    results = []
+    threads = [threading.Thread(target=ask, args=(opener, bot_url, f"How do I mark attendance? ({i})", results))
+               for i in range(args.questions)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    busy = probe(opener, probe_url, args.probes, 0.05)
+    report('during burst', busy)
+    for thread in threads:
+        thread.join()
+
+    print("\n3. Help bot answers")
+    report('latency', [elapsed for elapsed, _ in results])
+    for status, count in Counter(status for _, status in results).most_common():
+        print(f"  {status}: {count}")
+
+    slowdown = percentile(busy, 95) / percentile(idle, 95)
+    print("\n" + "=" * 50)
+    print(f"Probe p95 slowdown during burst: {slowdown:.1f}x")
+    print("=" * 50)
+
+
+if __name__ == '__main__':
+    main()
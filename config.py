@@ -1,6 +1,7 @@
 """Configuration settings for the TuitionTrack application"""
 import os
 import secrets
+import tempfile
 
 # Try to load dotenv if available
 try:
@@ -18,7 +19,67 @@ class Config:
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx'}
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+    # Whole request body; uploads are also cut off per file at MAX_FILE_SIZE while streaming
+    MAX_CONTENT_LENGTH = MAX_FILE_SIZE + 1024 * 1024
+    # Resized JPEG copies of image uploads (see utils/upload_derivatives.py)
+    UPLOAD_DISPLAY_MAX_SIDE = int(os.environ.get('UPLOAD_DISPLAY_MAX_SIDE', 1600))
+    UPLOAD_THUMB_MAX_SIDE = int(os.environ.get('UPLOAD_THUMB_MAX_SIDE', 480))
+    UPLOAD_JPEG_QUALITY = int(os.environ.get('UPLOAD_JPEG_QUALITY', 80))
+
+    # Who sends /uploads/ files once access is checked (see utils/file_delivery.py):
+    # 'flask' (the worker), 'x-accel' (nginx) or 'x-sendfile' (Apache/lighttpd)
+    FILE_DELIVERY_MODE = os.environ.get('FILE_DELIVERY_MODE', 'flask').lower()
+    # nginx `internal` location that maps to UPLOAD_FOLDER (x-accel mode)
+    FILE_DELIVERY_INTERNAL_PREFIX = os.environ.get('FILE_DELIVERY_INTERNAL_PREFIX', '/protected-uploads/')
+    
+    # Response compression (see utils/compression.py); brotli needs the optional brotli package
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'True').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 500))  # Bytes; smaller bodies are sent as they are
+    COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+    
+    # Rendered page fragments ({% cache %} in templates), shared by all workers on the host
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', 'True').lower() == 'true'
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR') or None  # None: fragment_cache/ next to DATABASE (must be private, see utils/fragment_cache.py)
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 600))  # Seconds
     
+    # Compiled Jinja templates on disk, shared by workers and kept across restarts (see utils/template_cache.py)
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', 'True').lower() == 'true'
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR') or None  # None: a private directory under /tmp
+    
+    # Per-request SQL instrumentation (see utils/sql_trace.py)
+    SQL_TRACE_ENABLED = os.environ.get('SQL_TRACE_ENABLED', 'True').lower() == 'true'
+    SQL_SERVER_TIMING = os.environ.get('SQL_SERVER_TIMING', 'True').lower() == 'true'  # Server-Timing header with query count and time
+    SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', 100))  # Statements slower than this go to the slow-query log
+    SQL_SLOW_QUERY_LOG = os.environ.get('SQL_SLOW_QUERY_LOG', '')  # File for the JSON lines; empty = application log
+    SQL_QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET', 0))  # Statements per request for routes without @query_budget; 0 = none
+    SQL_QUERY_BUDGET_STRICT = os.environ.get('SQL_QUERY_BUDGET_STRICT', 'False').lower() == 'true'  # Fail over-budget requests
+
+    # Prometheus metrics at /metrics, summed over all workers on the host (see utils/metrics.py; needs prometheus_client)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'tuitiontrack-metrics'))
+    # Scrapers must send "Authorization: Bearer <token>"; unset, /metrics only answers direct requests from localhost
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+    # Write transactions and WAL checkpoints (see utils/write_coordinator.py)
+    DB_BUSY_TIMEOUT = float(os.environ.get('DB_BUSY_TIMEOUT', 5))  # Seconds a statement waits on a lock per attempt
+    DB_WRITE_RETRIES = int(os.environ.get('DB_WRITE_RETRIES', 3))  # Extra BEGIN IMMEDIATE attempts while locked
+    DB_WRITE_RETRY_DELAY = float(os.environ.get('DB_WRITE_RETRY_DELAY', 0.05))  # Backoff base (seconds), doubled per retry
+    DB_WRITE_RETRY_MAX_DELAY = float(os.environ.get('DB_WRITE_RETRY_MAX_DELAY', 1.0))
+    DB_CHECKPOINT_ENABLED = os.environ.get('DB_CHECKPOINT_ENABLED', 'True').lower() == 'true'
+    DB_CHECKPOINT_INTERVAL = float(os.environ.get('DB_CHECKPOINT_INTERVAL', 10))  # Seconds between WAL size checks
+    DB_CHECKPOINT_BUSY_TIMEOUT = float(os.environ.get('DB_CHECKPOINT_BUSY_TIMEOUT', 1))  # TRUNCATE's wait for readers
+    DB_WAL_PASSIVE_MB = float(os.environ.get('DB_WAL_PASSIVE_MB', 4))
+    DB_WAL_TRUNCATE_MB = float(os.environ.get('DB_WAL_TRUNCATE_MB', 64))
+
+    # Readiness checks at /health/ready (see utils/health.py)
+    HEALTH_CACHE_SECONDS = float(os.environ.get('HEALTH_CACHE_SECONDS', 10))  # Per worker
+    HEALTH_DB_TIMEOUT = float(os.environ.get('HEALTH_DB_TIMEOUT', 2))  # Seconds to wait for the write lock
+    HEALTH_DB_MAX_MS = float(os.environ.get('HEALTH_DB_MAX_MS', 1000))  # Slower round trips fail the check
+    HEALTH_WAL_MAX_MB = float(os.environ.get('HEALTH_WAL_MAX_MB', 512))
+    HEALTH_MIN_FREE_MB = float(os.environ.get('HEALTH_MIN_FREE_MB', 500))
+    HEALTH_MAX_BACKLOG = int(os.environ.get('HEALTH_MAX_BACKLOG', 200))  # Images waiting for resized copies
+
     # User roles (for future student/enterprise login)
     ROLE_TUTOR = 'tutor'
     ROLE_STUDENT = 'student'
@@ -43,3 +104,10 @@ class Config:
     # Set GEMINI_API_KEY in environment variables
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
 
+    # Help bot generation limits, shared by all workers on the host (see utils/help_bot_limits.py)
+    HELP_BOT_MAX_CONCURRENT = int(os.environ.get('HELP_BOT_MAX_CONCURRENT', 4))  # 0 = unlimited; gunicorn_config.py derives it from the pool size
+    HELP_BOT_TIMEOUT = float(os.environ.get('HELP_BOT_TIMEOUT', 20))  # Seconds before falling back to the knowledge base answer
+    HELP_BOT_SLOT_DIR = os.environ.get('HELP_BOT_SLOT_DIR', os.path.join(tempfile.gettempdir(), 'tuitiontrack-help-bot'))
+    # Local testing: replace Gemini with a stub that sleeps this many seconds per answer
+    NIYA_STUB_MODEL_DELAY = os.environ.get('NIYA_STUB_MODEL_DELAY', '')
+
@@ -1,12 +1,26 @@
 """Database connection and initialization"""
 import sqlite3
 import os
-import time
+from flask import g, has_app_context
 from config import Config
+from utils.sql_trace import TracedConnection, current_trace
+from utils.write_coordinator import CoordinatedConnection, configure_wal
 
-def get_db_connection(timeout=30.0):
-    """Get database connection with WAL mode and optimizations for better concurrency"""
-    conn = sqlite3.connect(Config.DATABASE, timeout=timeout)
+def get_db_connection(timeout=None):
+    """Get database connection with WAL mode and optimizations for better concurrency
+
+    Every call opens a new connection owned by the calling thread (sqlite3
+    refuses to use it from another one), so threaded and gevent workers never
+    share a connection. Inside a request it is also closed at teardown, in case
+    an exception skipped the route's own conn.close(), and its statements are
+    recorded for the request's SQL trace (utils/sql_trace.py). Write
+    transactions start with BEGIN IMMEDIATE, retried while the database is
+    locked (utils/write_coordinator.py); ``timeout`` is the wait per attempt.
+    """
+    timeout = Config.DB_BUSY_TIMEOUT if timeout is None else timeout
+    trace = current_trace() if has_app_context() else None
+    factory = TracedConnection if trace is not None else CoordinatedConnection
+    conn = sqlite3.connect(Config.DATABASE, timeout=timeout, factory=factory)
     conn.row_factory = sqlite3.Row
     
     # Enable WAL mode for better concurrency (readers don't block writers)
@@ -24,43 +38,35 @@ def get_db_connection(timeout=30.0):
         conn.execute('PRAGMA temp_store=MEMORY')  # Store temp tables in memory
         conn.execute('PRAGMA mmap_size=268435456')  # 256MB memory-mapped I/O
         conn.execute('PRAGMA foreign_keys=ON')  # Ensure foreign keys are enabled
+        configure_wal(conn)  # Checkpoints are left to the background checkpointer
     except sqlite3.OperationalError:
         # If any PRAGMA fails, continue (some may not be supported in all SQLite versions)
         pass
     
+    if trace is not None:
+        conn.trace = trace  # Record the route's statements, not the PRAGMAs above
+    if has_app_context():
+        g.setdefault('_db_connections', []).append(conn)
     return conn
 
-def execute_with_retry(conn, query, params=None, max_retries=3, retry_delay=0.1):
+def close_request_connections(exception=None):
+    """teardown_appcontext handler: close the connections this request opened"""
+    for conn in g.pop('_db_connections', []):
+        conn.close()
+
+def execute_with_retry(conn, query, params=None):
     """
-    Execute query with retry logic for database locked errors.
-    Useful for write operations that may encounter temporary locks.
-    
-    Args:
-        conn: Database connection
-        query: SQL query string
-        params: Query parameters (optional)
-        max_retries: Maximum number of retry attempts
-        retry_delay: Initial delay between retries (increases exponentially)
+    Execute a write statement (kept for existing callers).
+
+    Connections from get_db_connection() already open write transactions with
+    BEGIN IMMEDIATE and retry it with jittered backoff while the database is
+    locked (utils/write_coordinator.py), so this is a plain execute.
     
     Returns:
         Cursor object
     """
     cursor = conn.cursor()
-    for attempt in range(max_retries):
-        try:
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            return cursor
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e).lower() and attempt < max_retries - 1:
-                # Exponential backoff: wait longer with each retry
-                wait_time = retry_delay * (2 ** attempt)
-                time.sleep(wait_time)
-                continue
-            # Re-raise if not a lock error or if we've exhausted retries
-            raise
+    cursor.execute(query, params or ())
     return cursor
 
 def init_db():
@@ -161,6 +167,7 @@ def init_db():
             batch_id INTEGER,
             student_id INTEGER,
             file_path TEXT,
+            file_name TEXT,
             youtube_url TEXT,
             submission_date DATE,
             user_id INTEGER NOT NULL,
@@ -185,9 +192,197 @@ def init_db():
         )
     ''')
     
+    create_upload_blob_schema(cursor)
+    create_data_version_schema(cursor)
+    create_attendance_archive_schema(cursor)
+    create_attendance_monthly_schema(cursor)
+    
     conn.commit()
     conn.close()
 
+def create_upload_blob_schema(cursor):
+    """Create the content-addressed upload table and the triggers that keep its reference counts
+
+    Each row is one stored file under UPLOAD_FOLDER/blobs/. ref_count is the
+    number of homework rows whose file_path points at it, maintained by the
+    triggers below, so every way a homework row is inserted, re-pointed or
+    deleted is counted. utils.blob_store.collect_garbage() removes blobs whose
+    count has stayed at zero past a grace period.
+
+    For images, display_path and thumb_path are the resized copies written by
+    utils.upload_derivatives; derivative_status is NULL for other files, else
+    'pending', 'processing', 'done' or 'failed'.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_blobs (
+            path TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            derivative_status TEXT,
+            display_path TEXT,
+            thumb_path TEXT
+        )
+    ''')
+    cursor.execute("PRAGMA table_info(upload_blobs)")
+    blob_columns = [row[1] for row in cursor.fetchall()]
+    for column in ('derivative_status', 'display_path', 'thumb_path'):
+        if column not in blob_columns:
+            cursor.execute(f'ALTER TABLE upload_blobs ADD COLUMN {column} TEXT')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_homework_blob_insert
+        AFTER INSERT ON homework WHEN NEW.file_path IS NOT NULL
+        BEGIN
+            UPDATE upload_blobs SET ref_count = ref_count + 1 WHERE path = NEW.file_path;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_homework_blob_delete
+        AFTER DELETE ON homework WHEN OLD.file_path IS NOT NULL
+        BEGIN
+            UPDATE upload_blobs SET ref_count = ref_count - 1 WHERE path = OLD.file_path;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_homework_blob_update
+        AFTER UPDATE OF file_path ON homework WHEN OLD.file_path IS NOT NEW.file_path
+        BEGIN
+            UPDATE upload_blobs SET ref_count = ref_count - 1 WHERE path = OLD.file_path;
+            UPDATE upload_blobs SET ref_count = ref_count + 1 WHERE path = NEW.file_path;
+        END
+    ''')
+
+def create_data_version_schema(cursor):
+    """Create the per-tutor data version counters and the triggers that bump them
+
+    data_versions holds one counter per (tutor, scope), where scope is the
+    table name: 'attendance', 'students' or 'batches'. Every insert, update or
+    delete on those tables bumps the tutor's counter for it, so cached page
+    fragments (utils.fragment_cache) keyed on the counters go stale as soon as
+    the data under them changes, whichever code path made the change.
+
+    A counter starts at a random value so that fragments cached for a deleted
+    and re-created database are not mistaken for the new one's.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            user_id INTEGER NOT NULL,
+            scope TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (user_id, scope)
+        )
+    ''')
+    bump = '''
+        INSERT INTO data_versions (user_id, scope, version) VALUES ({row}.user_id, '{scope}', abs(random() % 1000000000))
+        ON CONFLICT (user_id, scope) DO UPDATE SET version = version + 1;
+    '''
+    for scope in ('attendance', 'students', 'batches'):
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{scope}_version_{event.lower()}
+                AFTER {event} ON {scope} WHEN {row}.user_id IS NOT NULL
+                BEGIN
+                    {bump.format(row=row, scope=scope).strip()}
+                END
+            ''')
+
+
+def create_attendance_archive_schema(cursor):
+    """Create the table closed months of attendance are rolled up into
+
+    One row per student per month; days is an 8-byte bitmap with 2 bits per
+    day (0 = no record, else status + 1). See utils.attendance_archive. A
+    student's archive goes with the student.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance_archive (
+            user_id INTEGER NOT NULL,
+            student_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            days BLOB NOT NULL,
+            PRIMARY KEY (student_id, month)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_attendance_archive_user_month
+        ON attendance_archive(user_id, month)
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_students_archive_delete
+        AFTER DELETE ON students
+        BEGIN
+            DELETE FROM attendance_archive WHERE student_id = OLD.id;
+        END
+    ''')
+
+
+def create_attendance_monthly_schema(cursor):
+    """Create the per-student monthly attendance totals and the triggers that maintain them
+
+    attendance_monthly holds one row per student per 'YYYY-MM' month with its
+    present, late and absent counts and the last date marked, so stats widgets
+    read a few rows instead of scanning attendance. The triggers apply every
+    attendance insert, update and delete to the row of the month it falls in;
+    utils.attendance_archive.refresh_monthly() recomputes the rows of archived
+    months from their bitmaps and any rows written late for them. A student's
+    totals go with the student.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance_monthly (
+            student_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            present INTEGER NOT NULL DEFAULT 0,
+            late INTEGER NOT NULL DEFAULT 0,
+            absent INTEGER NOT NULL DEFAULT 0,
+            last_marked TEXT,
+            PRIMARY KEY (student_id, month)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_attendance_monthly_user_month
+        ON attendance_monthly(user_id, month)
+    ''')
+    status = 'COALESCE({row}.status, {row}.present, 0)'
+    add = '''
+        INSERT INTO attendance_monthly (student_id, month, user_id, present, late, absent, last_marked)
+        VALUES (NEW.student_id, substr(NEW.date, 1, 7), NEW.user_id,
+                {status} = 1, {status} = 2, {status} = 0, NEW.date)
+        ON CONFLICT (student_id, month) DO UPDATE SET
+            present = present + excluded.present,
+            late = late + excluded.late,
+            absent = absent + excluded.absent,
+            last_marked = MAX(COALESCE(last_marked, ''), excluded.last_marked);
+    '''.format(status=status.format(row='NEW'))
+    remove = '''
+        UPDATE attendance_monthly SET
+            present = present - ({status} = 1),
+            late = late - ({status} = 2),
+            absent = absent - ({status} = 0),
+            last_marked = (SELECT MAX(date) FROM attendance
+                           WHERE student_id = OLD.student_id
+                           AND date BETWEEN substr(OLD.date, 1, 7) || '-01' AND substr(OLD.date, 1, 7) || '-31')
+        WHERE student_id = OLD.student_id AND month = substr(OLD.date, 1, 7);
+    '''.format(status=status.format(row='OLD'))
+    for event, body in (('INSERT', add), ('UPDATE OF student_id, date, status, present', remove + add),
+                        ('DELETE', remove)):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_attendance_monthly_{event.split()[0].lower()}
+            AFTER {event} ON attendance
+            BEGIN
+                {body.strip()}
+            END
+        ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_students_monthly_delete
+        AFTER DELETE ON students
+        BEGIN
+            DELETE FROM attendance_monthly WHERE student_id = OLD.id;
+        END
+    ''')
+
+
 def migrate_db():
     """Migrate existing database to add new columns"""
     if not os.path.exists(Config.DATABASE):
@@ -302,6 +497,12 @@ def migrate_db():
         except sqlite3.OperationalError:
             pass
     
+    if 'file_name' not in homework_columns:
+        try:
+            cursor.execute('ALTER TABLE homework ADD COLUMN file_name TEXT')
+        except sqlite3.OperationalError:
+            pass
+    
     if 'youtube_url' not in homework_columns:
         try:
             cursor.execute('ALTER TABLE homework ADD COLUMN youtube_url TEXT')
@@ -384,42 +585,77 @@ def migrate_db():
         # Index might already exist, ignore
         pass
     
+    create_upload_blob_schema(cursor)
+    create_data_version_schema(cursor)
+    create_attendance_archive_schema(cursor)
+    
+    # Archive rows written before the 2-bit bitmap format
+    from utils.attendance_archive import repack_archive, rebuild_attendance_monthly
+    repacked = repack_archive(cursor)
+    if repacked:
+        print(f"Repacked {repacked} attendance archive rows")
+    
+    # Monthly totals for attendance recorded before the table existed
+    create_attendance_monthly_schema(cursor)
+    cursor.execute('''
+        SELECT NOT EXISTS (SELECT 1 FROM attendance_monthly)
+               AND (EXISTS (SELECT 1 FROM attendance) OR EXISTS (SELECT 1 FROM attendance_archive))
+    ''')
+    if cursor.fetchone()[0]:
+        print(f"Built {rebuild_attendance_monthly(cursor)} monthly attendance totals")
+    
     conn.commit()
     conn.close()
 
+# Performance indexes: name -> table(columns) [WHERE ...]
+# Composite keys follow the app's filters and sort orders (python3 analyze_indexes.py)
+INDEXES = {
+    # Student lists: WHERE user_id [AND batch_id] ORDER BY name, login by phone
+    'idx_students_user_name': 'students(user_id, name)',
+    'idx_students_batch_name': 'students(batch_id, name)',
+    'idx_students_phone': 'students(phone)',
+    # Per-student reads use UNIQUE(student_id, date); tutor-wide reads filter
+    # user_id and a date range and only need these columns
+    'idx_attendance_user_date_status': 'attendance(user_id, date, student_id, status, present)',
+    'idx_attendance_date': 'attendance(date)',
+    # Batch pickers sort by name; the dashboard's per-batch counts group by id
+    'idx_batches_user_name': 'batches(user_id, name)',
+    'idx_batches_user_id': 'batches(user_id)',
+    # Homework lists: WHERE user_id ... ORDER BY created_at DESC LIMIT
+    'idx_homework_user_created': 'homework(user_id, created_at)',
+    'idx_homework_batch_created': 'homework(batch_id, created_at)',
+    'idx_homework_student_created': 'homework(student_id, created_at)',
+    'idx_homework_submission_date': 'homework(submission_date)',
+    'idx_homework_file_path': 'homework(file_path)',
+    # Garbage collection only ever looks at unreferenced blobs
+    'idx_upload_blobs_unreferenced': 'upload_blobs(created_at) WHERE ref_count <= 0',
+    # Resize backlog: worker start-up sweep and the readiness check
+    'idx_upload_blobs_pending': "upload_blobs(derivative_status) WHERE derivative_status IN ('pending', 'processing')",
+}
+# Indexes earlier versions created that others now cover
+REDUNDANT_INDEXES = [
+    'idx_students_user_id',       # idx_students_user_name
+    'idx_students_batch_id',      # idx_students_batch_name
+    'idx_attendance_user_id',     # idx_attendance_user_date_status
+    'idx_attendance_user_date',   # idx_attendance_user_date_status
+    'idx_attendance_student_id',  # UNIQUE(student_id, date)
+    'idx_homework_user_id',       # idx_homework_user_created
+    'idx_homework_batch_id',      # idx_homework_batch_created
+    'idx_homework_student_id',    # idx_homework_student_created
+    'idx_users_mobile',           # UNIQUE(mobile)
+]
+
 def add_indexes():
-    """Add performance indexes to database"""
+    """Add performance indexes to database (see analyze_indexes.py) and drop redundant ones"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    indexes = [
-        # Students table indexes
-        "CREATE INDEX IF NOT EXISTS idx_students_user_id ON students(user_id)",
-        "CREATE INDEX IF NOT EXISTS idx_students_batch_id ON students(batch_id)",
-        "CREATE INDEX IF NOT EXISTS idx_students_phone ON students(phone)",
-        
-        # Attendance table indexes
-        "CREATE INDEX IF NOT EXISTS idx_attendance_user_id ON attendance(user_id)",
-        "CREATE INDEX IF NOT EXISTS idx_attendance_student_id ON attendance(student_id)",
-        "CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)",
-        "CREATE INDEX IF NOT EXISTS idx_attendance_user_date ON attendance(user_id, date)",
-        
-        # Batches table indexes
-        "CREATE INDEX IF NOT EXISTS idx_batches_user_id ON batches(user_id)",
-        
-        # Homework table indexes
-        "CREATE INDEX IF NOT EXISTS idx_homework_user_id ON homework(user_id)",
-        "CREATE INDEX IF NOT EXISTS idx_homework_batch_id ON homework(batch_id)",
-        "CREATE INDEX IF NOT EXISTS idx_homework_student_id ON homework(student_id)",
-        "CREATE INDEX IF NOT EXISTS idx_homework_submission_date ON homework(submission_date)",
-        
-        # Users table indexes
-        "CREATE INDEX IF NOT EXISTS idx_users_mobile ON users(mobile)",
-    ]
-    
-    for index_sql in indexes:
+    for name in REDUNDANT_INDEXES:
+        cursor.execute(f'DROP INDEX IF EXISTS {name}')
+    
+    for name, target in INDEXES.items():
         try:
-            cursor.execute(index_sql)
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
         except sqlite3.OperationalError:
             # Index might already exist, ignore
             pass
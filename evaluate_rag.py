@@ -0,0 +1,126 @@
+"""Offline evaluation harness for the Niya help bot retrieval
+
+Replays a labelled query set (data/niya_eval_queries.json) against the Q&A
+pairs in data/niya_qa_pairs.json and reports recall@k, per-query latency
+percentiles and batched throughput. The index is built in a temporary
+directory, so the published index in data/niya_index/ is never touched.
+
+Each labelled query lists the ids of every Q&A pair that answers it; a query
+counts as a hit at k when any of them is among the top k results.
+
+Usage:
+    python3 evaluate_rag.py
+    python3 evaluate_rag.py --k 1 3 5 --repeat 20 --batch-size 64
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.rag_system import NiyaRAGSystem
+
+
+def recall_at_k(results, relevant_ids, k):
+    """Fraction of queries with at least one relevant Q&A id in their top k results"""
+    hits = 0
+    for matches, relevant in zip(results, relevant_ids):
+        if any(qa['id'] in relevant for qa, _ in matches[:k]):
+            hits += 1
+    return hits / len(results) if results else 0.0
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate Niya help bot retrieval offline')
+    parser.add_argument('--qa-file', default='data/niya_qa_pairs.json', help='Q&A pairs to index')
+    parser.add_argument('--queries', default='data/niya_eval_queries.json', help='Labelled query set')
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 3, 5], help='Cut-offs for recall@k')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed passes over the query set')
+    parser.add_argument('--batch-size', type=int, default=32, help='Queries per batched search')
+    parser.add_argument('--show-misses', action='store_true', help='List queries missed at the largest k')
+    args = parser.parse_args()
+
+    with open(args.qa_file, 'r', encoding='utf-8') as f:
+        qa_pairs = json.load(f)
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        labelled = json.load(f)
+
+    queries = [item['query'] for item in labelled]
+    relevant_ids = [set(item['relevant_ids']) for item in labelled]
+    max_k = max(args.k)
+
+    print("=" * 50)
+    print("Niya Help Bot Retrieval Evaluation")
+    print("=" * 50)
+    print(f"Q&A pairs: {len(qa_pairs)} ({args.qa_file})")
+    print(f"Labelled queries: {len(queries)} ({args.queries})")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rag = NiyaRAGSystem()
+        rag.index_dir = os.path.join(tmp_dir, 'niya_index')
+        rag.current_pointer_path = os.path.join(rag.index_dir, 'CURRENT')
+        rag.qa_data_path = os.path.join(tmp_dir, 'niya_qa_pairs.json')
+        rag.build_index(qa_pairs, force_rebuild=True)
+        # Reopen from disk so the timings cover the memory-mapped index workers serve
+        rag.generation = None
+        rag.maybe_reload(force=True)
+
+        # Quality
+        results = rag.search_similar_batch(queries, top_k=max_k)
+        print("\nRecall")
+        for k in sorted(args.k):
+            print(f"  recall@{k}: {recall_at_k(results, relevant_ids, k):.1%}")
+        above = sum(1 for matches in results if matches and matches[0][1] >= rag.similarity_threshold)
+        print(f"  top-1 above similarity threshold ({rag.similarity_threshold}): {above}/{len(queries)}")
+
+        if args.show_misses:
+            print(f"\nMisses at k={max_k}")
+            for query, matches, relevant in zip(queries, results, relevant_ids):
+                if not any(qa['id'] in relevant for qa, _ in matches):
+                    got = ', '.join(f"{qa['id']}:{score:.2f}" for qa, score in matches)
+                    print(f"  {query!r} expected {sorted(relevant)} got [{got}]")
+
+        # Latency: one query per call, as /api/help-bot/query does
+        latencies = []
+        for _ in range(args.repeat):
+            for query in queries:
+                start = time.perf_counter()
+                rag.search_similar(query, top_k=max_k)
+                latencies.append(time.perf_counter() - start)
+        single_qps = len(latencies) / sum(latencies)
+        print(f"\nSingle-query latency ({len(latencies)} searches)")
+        print(f"  p50: {percentile_ms(latencies, 50):.3f} ms")
+        print(f"  p95: {percentile_ms(latencies, 95):.3f} ms")
+        print(f"  p99: {percentile_ms(latencies, 99):.3f} ms")
+        print(f"  throughput: {single_qps:,.0f} queries/s")
+
+        # Throughput: batched, as /api/help-bot/query/batch does
+        batch_latencies = []
+        for _ in range(args.repeat):
+            for i in range(0, len(queries), args.batch_size):
+                batch = queries[i:i + args.batch_size]
+                start = time.perf_counter()
+                rag.search_similar_batch(batch, top_k=max_k)
+                batch_latencies.append((time.perf_counter() - start, len(batch)))
+        batch_time = sum(elapsed for elapsed, _ in batch_latencies)
+        batch_qps = sum(count for _, count in batch_latencies) / batch_time
+        print(f"\nBatched search (batch size {args.batch_size}, {len(batch_latencies)} batches)")
+        print(f"  p50 per batch: {percentile_ms([e for e, _ in batch_latencies], 50):.3f} ms")
+        print(f"  p95 per batch: {percentile_ms([e for e, _ in batch_latencies], 95):.3f} ms")
+        print(f"  throughput: {batch_qps:,.0f} queries/s ({batch_qps / single_qps:.1f}x single)")
+
+    print("\n" + "=" * 50)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""Generate a large synthetic database for performance testing
+
+populate_db.py gives the test tutor a few dozen students, which is too small
+for an N+1 query or a full table scan to show up. This script builds a
+separate database with many tenants shaped like real ones:
+
+- tutors with log-normally distributed class sizes (a few large institutes,
+  many small tutors), students in batches of about 25 that meet 3-6 days a week
+- students joining over the whole period, each with their own attendance rate
+- attendance on class days for --months closed months plus the current one:
+  closed months are written straight into attendance_archive and
+  attendance_monthly the way archive_closed_months() leaves them, the current
+  month as attendance rows
+- live homework for batches and single students, part of it with attachments
+  stored in the blob store (shared worksheets, as tutors upload them)
+
+The same --seed always produces the same database. benchmark_routes.py and
+analyze_indexes.py run against it.
+
+Usage:
+    python3 generate_dataset.py --database /tmp/large.db
+    python3 generate_dataset.py --database /tmp/large.db --tutors 1000 --students 100 --months 24
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from calendar import monthrange
+from datetime import date, timedelta
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DAY_CODES = ['mo', 'tu', 'we', 'th', 'fr', 'sa', 'su']
+FIRST_NAMES = ['Aarav', 'Aditi', 'Arjun', 'Diya', 'Ishaan', 'Kavya', 'Krishna', 'Meera', 'Neha', 'Rohan',
+               'Saanvi', 'Sai', 'Tanvi', 'Vihaan', 'Vivaan', 'Ananya', 'Aryan', 'Isha', 'Kabir', 'Riya']
+LAST_NAMES = ['Sharma', 'Patel', 'Reddy', 'Iyer', 'Gupta', 'Singh', 'Nair', 'Joshi', 'Kulkarni', 'Das',
+              'Mehta', 'Rao', 'Verma', 'Pillai', 'Chopra']
+SUBJECTS = ['Algebra', 'Geometry', 'Physics', 'Chemistry', 'Biology', 'Grammar', 'History', 'Geography']
+BATCH_SIZE = 25  # Average students per batch
+ATTACHMENT_RATE = 0.4  # Share of homework with a file
+
+
+def tenant_sizes(rng, tutors, students):
+    """Students per tutor: log-normal around ``students``, at least 5 each"""
+    sizes = rng.lognormal(mean=0.0, sigma=0.9, size=tutors)
+    sizes = np.maximum(np.rint(sizes / sizes.mean() * students), 5).astype(int)
+    return sizes.tolist()
+
+
+def month_starts(today, months):
+    """First days of the ``months`` closed months before today's, oldest first, then today's"""
+    first = date(today.year, today.month, 1)
+    starts = [first]
+    for _ in range(months):
+        starts.append((starts[-1] - timedelta(days=1)).replace(day=1))
+    return starts[::-1]
+
+
+def month_codes(rng, rates, class_days, joined, first_day, days):
+    """(students, days) uint8 day codes for a month: 0 no record, else status + 1
+
+    ``class_days`` is a (students, 7) bool array of the weekdays each student's
+    batch meets and ``joined`` the date ordinals students joined on. The tutor
+    forgets to mark about one class in twenty.
+    """
+    ordinals = first_day.toordinal() + np.arange(days)
+    weekdays = (first_day.weekday() + np.arange(days)) % 7
+    marked = class_days[:, weekdays] & (ordinals[None, :] >= joined[:, None])
+    marked &= rng.random((1, days)) >= 0.05
+    draw = rng.random(marked.shape)
+    attended = draw < rates[:, None]
+    late = draw < rates[:, None] * 0.1
+    # codes: 1 absent, 2 present, 3 late
+    codes = np.where(late, 3, np.where(attended, 2, 1)).astype(np.uint8)
+    return np.where(marked, codes, 0).astype(np.uint8)
+
+
+def pack_codes(codes):
+    """Pack (students, days) codes into 8-byte archive bitmaps (see utils/attendance_archive.py)"""
+    padded = np.zeros((codes.shape[0], 32), dtype=np.uint8)
+    padded[:, :codes.shape[1]] = codes
+    shifts = np.arange(0, 8, 2, dtype=np.uint8)
+    packed = (padded.reshape(-1, 8, 4) << shifts).sum(axis=2, dtype=np.uint8)
+    return [row.tobytes() for row in packed]
+
+
+def store_attachments(conn, count, rng):
+    """Put ``count`` worksheets (small PDFs) in the blob store; returns [(file_path, file_name)]"""
+    from werkzeug.datastructures import FileStorage
+    from utils.blob_store import store_upload
+
+    files = []
+    for index in range(count):
+        body = rng.integers(0, 256, size=int(rng.integers(20_000, 200_000)), dtype=np.uint8).tobytes()
+        upload = FileStorage(io.BytesIO(b'%PDF-1.4\n' + body), filename=f'worksheet-{index + 1}.pdf')
+        files.append(store_upload(conn, upload))
+    return files
+
+
+def generate_tenant(conn, rng, pyrng, index, size, starts, today, homework, attachments):
+    """Insert one tutor with ``size`` students, their attendance and homework; returns row counts"""
+    cursor = conn.cursor()
+    range_start = starts[0]
+    cursor.execute('''
+        INSERT INTO users (mobile, tutor_name, tuition_name, role, onboarding_completed, created_at)
+        VALUES (?, ?, ?, 'tutor', 1, ?)
+    ''', (f'7{index:09d}', f'Tutor {index + 1}', f'{pyrng.choice(SUBJECTS)} Classes {index + 1}',
+          f'{range_start} 09:00:00'))
+    user_id = cursor.lastrowid
+
+    batch_ids, batch_days = [], []
+    for batch in range(max(round(size / BATCH_SIZE), 1)):
+        weekdays = sorted(pyrng.sample(range(7), pyrng.randint(3, 6)))
+        hour = 7 + batch % 12
+        cursor.execute('''
+            INSERT INTO batches (name, description, start_time, end_time, days, user_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (f'{pyrng.choice(SUBJECTS)} {batch + 1}', 'Generated batch', f'{hour:02d}:00', f'{hour + 1:02d}:00',
+              ','.join(DAY_CODES[day] for day in weekdays), user_id, f'{range_start} 09:00:00'))
+        batch_ids.append(cursor.lastrowid)
+        batch_days.append([day in weekdays for day in range(7)])
+
+    # Most students were there from the start, the rest joined along the way
+    span = (today - range_start).days
+    joined = np.where(rng.random(size) < 0.6, 0, rng.integers(0, max(span, 1), size)) + range_start.toordinal()
+    batch_index = rng.integers(0, len(batch_ids), size)
+    cursor.executemany('''
+        INSERT INTO students (name, phone, batch_id, school_name, standard, user_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(f'{pyrng.choice(FIRST_NAMES)} {pyrng.choice(LAST_NAMES)}', f'9{index:04d}{student:05d}',
+           batch_ids[batch_index[student]], f'School {pyrng.randint(1, 40)}', str(pyrng.randint(5, 12)), user_id,
+           f'{date.fromordinal(int(joined[student]))} 10:00:00') for student in range(size)])
+    student_ids = [row[0] for row in cursor.execute('SELECT id FROM students WHERE user_id = ? ORDER BY id',
+                                                    (user_id,))]
+
+    rates = rng.beta(8, 2, size)
+    class_days = np.array(batch_days, dtype=bool)[batch_index]
+    archive_rows = attendance_rows = 0
+    for first_day in starts:
+        current = (first_day.year, first_day.month) == (today.year, today.month)
+        # Today is left for the tutor to mark
+        days = today.day - 1 if current else monthrange(first_day.year, first_day.month)[1]
+        if days <= 0:
+            continue
+        codes = month_codes(rng, rates, class_days, joined, first_day, days)
+        recorded = np.flatnonzero(codes.any(axis=1))
+        if not current:
+            month = f'{first_day.year:04d}-{first_day.month:02d}'
+            bitmaps = pack_codes(codes[recorded])
+            present, late, absent = ((codes[recorded] == code).sum(axis=1) for code in (2, 3, 1))
+            last_day = days - np.argmax(codes[recorded][:, ::-1] > 0, axis=1)
+            cursor.executemany('INSERT INTO attendance_archive (user_id, student_id, month, days) VALUES (?, ?, ?, ?)',
+                               [(user_id, student_ids[row], month, bitmaps[i]) for i, row in enumerate(recorded)])
+            cursor.executemany('''
+                INSERT INTO attendance_monthly (student_id, month, user_id, present, late, absent, last_marked)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(student_ids[row], month, user_id, int(present[i]), int(late[i]), int(absent[i]),
+                   f'{month}-{int(last_day[i]):02d}') for i, row in enumerate(recorded)])
+            archive_rows += len(recorded)
+        else:
+            rows = []
+            for row, day in zip(*np.nonzero(codes)):
+                status = int(codes[row, day]) - 1
+                rows.append((student_ids[row], (first_day + timedelta(days=int(day))).isoformat(),
+                             1 if status else 0, status, user_id))
+            # The attendance triggers keep attendance_monthly in step
+            cursor.executemany('INSERT INTO attendance (student_id, date, present, status, user_id) '
+                               'VALUES (?, ?, ?, ?, ?)', rows)
+            attendance_rows += len(rows)
+
+    # Past-due homework is deleted a day after its due date, so only live homework exists
+    homework_rows = []
+    for item in range(homework):
+        due = today + timedelta(days=pyrng.randint(-1, 21))
+        created = min(due - timedelta(days=pyrng.randint(1, 14)), today)
+        individual = pyrng.random() < 0.2
+        file_path, file_name = pyrng.choice(attachments) if attachments and pyrng.random() < ATTACHMENT_RATE \
+            else (None, None)
+        homework_rows.append((f'{pyrng.choice(SUBJECTS)} exercise {item + 1}', 'Complete the exercises',
+                              None if individual else pyrng.choice(batch_ids),
+                              pyrng.choice(student_ids) if individual else None, file_path, file_name,
+                              due.isoformat(), user_id, f'{created} {pyrng.randint(7, 21):02d}:00:00'))
+    cursor.executemany('''
+        INSERT INTO homework (title, description, batch_id, student_id, file_path, file_name, submission_date,
+                              user_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', homework_rows)
+    conn.commit()
+    return {'batches': len(batch_ids), 'students': size, 'archive': archive_rows,
+            'attendance': attendance_rows, 'homework': homework}
+
+
+def generate(conn, tutors, students, months, homework, attachments, seed, today=None, progress=None):
+    """Fill an initialized database; returns total row counts by table
+
+    ``students`` is the average per tutor and ``homework`` the live homework
+    per tutor. ``progress`` is called with (tutors done, tutors) every tutor.
+    """
+    from utils import get_ist_today
+
+    today = today or get_ist_today()
+    rng = np.random.default_rng(seed)
+    pyrng = random.Random(seed)
+    starts = month_starts(today, months)
+    files = store_attachments(conn, attachments, rng)
+    totals = {'tutors': tutors, 'attachments': len(files)}
+    for index, size in enumerate(tenant_sizes(rng, tutors, students)):
+        counts = generate_tenant(conn, rng, pyrng, index, size, starts, today, homework, files)
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+        if progress:
+            progress(index + 1, tutors)
+    conn.execute('ANALYZE')
+    conn.commit()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a large synthetic TuitionTrack database')
+    parser.add_argument('--database', required=True, help='Database file to create (must not exist)')
+    parser.add_argument('--uploads', help='Upload folder for attachments (default: uploads/ next to the database)')
+    parser.add_argument('--tutors', type=int, default=100, help='Tutors (tenants)')
+    parser.add_argument('--students', type=int, default=100, help='Average students per tutor')
+    parser.add_argument('--months', type=int, default=12, help='Closed months of attendance before this one')
+    parser.add_argument('--homework', type=int, default=40, help='Live homework per tutor')
+    parser.add_argument('--attachments', type=int, default=50, help='Distinct attachment files')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        print(f"Error: {args.database} already exists; generate into a new file")
+        sys.exit(1)
+    os.environ['DATABASE'] = args.database
+    os.environ['UPLOAD_FOLDER'] = args.uploads or os.path.join(os.path.dirname(os.path.abspath(args.database)),
+                                                               'uploads')
+
+    from database import init_db, migrate_db, add_indexes, get_db_connection
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+        migrate_db()
+        add_indexes()
+
+    print("=" * 78)
+    print("Synthetic Dataset Generator")
+    print("=" * 78)
+    print(f"{args.tutors} tutors, ~{args.students} students each, {args.months} closed months, seed {args.seed}")
+
+    def progress(done, total):
+        if done % max(total // 10, 1) == 0 or done == total:
+            print(f"   {done}/{total} tutors ({time.perf_counter() - start:.0f}s)")
+
+    start = time.perf_counter()
+    conn = get_db_connection()
+    conn.execute('PRAGMA synchronous=OFF')  # Throwaway data: skip fsyncs
+    totals = generate(conn, args.tutors, args.students, args.months, args.homework, args.attachments, args.seed,
+                      progress=progress)
+    conn.close()
+
+    print(f"\n   {'Batches':<28} {totals['batches']:>12,}")
+    print(f"   {'Students':<28} {totals['students']:>12,}")
+    print(f"   {'Archived student-months':<28} {totals['archive']:>12,}")
+    print(f"   {'Attendance rows (this month)':<28} {totals['attendance']:>12,}")
+    print(f"   {'Homework':<28} {totals['homework']:>12,}")
+    print(f"   {'Attachment files':<28} {totals['attachments']:>12,}")
+    print(f"   {'Database size (MB)':<28} {os.path.getsize(args.database) / 1e6:>12,.1f}")
+    print(f"\nDone in {time.perf_counter() - start:.0f}s: {args.database}")
+    print("=" * 78)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,61 @@
-"""Gunicorn configuration for production"""
+"""Gunicorn configuration for production
+
+GUNICORN_WORKER_CLASS picks how each worker handles concurrent requests:
+
+    sync    - one request per process (default). Simple, but a request waiting
+              on a SQLite lock, a push service or Gemini holds a whole process.
+    gthread - GUNICORN_THREADS requests per process in threads. The waits above
+              release the GIL, so fewer processes (less memory) serve more
+              concurrent requests.
+    gevent  - GUNICORN_WORKER_CONNECTIONS requests per process in greenlets
+              (pip install gevent). Best for network waits (push, Gemini), but a
+              SQLite busy wait blocks the whole worker, so prefer gthread unless
+              most time is spent on HTTP calls.
+
+The app keeps no unlocked mutable state between requests, so all three are safe.
+Compare them on your hardware with benchmark_workers.py.
+"""
 import multiprocessing
 import os
 
+try:
+    from dotenv import load_dotenv
+    load_dotenv()  # Before reading settings, so .env values win over the defaults below
+except ImportError:
+    pass
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+
+# GUNICORN_PRELOAD=true loads the app once in the master and forks workers
+# from it, so templates compiled in when_ready are shared instead of each
+# worker compiling its own. Off by default: importing the app also runs the
+# database migrations and creates metric files, and with preloading all of
+# that happens in the master before the fork. Without it each worker imports
+# the app itself and compiles its templates in post_worker_init, reading the
+# compiled code from the shared bytecode cache on disk.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'False').lower() == 'true'
+if worker_class == 'gevent' and preload_app:
+    # Patch before the app is preloaded, so its locks and sockets are cooperative
+    # (without preloading, the gevent worker patches itself after the fork)
+    from gevent import monkey
+    monkey.patch_all()
+
 # Server socket
 # Render sets PORT automatically, ensure it's converted to int
 port = int(os.environ.get('PORT', 5000))
 bind = f"0.0.0.0:{port}"
 backlog = 2048
 
-# Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
-worker_connections = 1000
+# Worker processes: threaded and gevent workers need fewer processes for the same concurrency
+default_workers = multiprocessing.cpu_count() * 2 + 1 if worker_class == 'sync' else multiprocessing.cpu_count() + 1
+workers = int(os.environ.get('GUNICORN_WORKERS', default_workers))
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100 if worker_class == 'gevent' else 1000))
+
+# Help bot generation slots are shared by every worker on the host. Unless set
+# explicitly, keep them to half the pool's request capacity so Gemini calls can
+# never hold every worker (on one CPU that is 1 slot for 3 sync workers).
+os.environ.setdefault('HELP_BOT_MAX_CONCURRENT', str(max(1, workers * threads // 2)))
 timeout = 30
 keepalive = 2
 
@@ -36,10 +80,39 @@ tmp_redirect = False
 # keyfile = None
 # certfile = None
 
+def on_starting(server):
+    """Called before the master process is initialized"""
+    from utils.metrics import remove_stale_files
+
+    # Counters of the previous run's workers would otherwise stay in /metrics
+    remove_stale_files()
+
 def when_ready(server):
-    """Called just after the server is started"""
+    """Called just after the server is started, before workers are forked"""
+    # Only with preload_app: importing the app here would otherwise preload it anyway
+    if server.cfg.preload_app:
+        from app import app
+        from utils.template_cache import warm_templates
+
+        count, seconds = warm_templates(app)
+        server.log.info("Compiled %d templates in %.0f ms", count, seconds * 1000)
     server.log.info("Server is ready. Spawning workers")
 
+def post_worker_init(worker):
+    """Called in a worker after it has loaded the app"""
+    if not worker.cfg.preload_app:
+        from app import app
+        from utils.template_cache import warm_templates
+
+        count, seconds = warm_templates(app)
+        worker.log.info("Compiled %d templates in %.0f ms", count, seconds * 1000)
+
+def child_exit(server, worker):
+    """Called in the master after a worker exits"""
+    from utils.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
 def on_exit(server):
     """Called just before exiting"""
     server.log.info("Shutting down: Master")
@@ -0,0 +1,62 @@
+"""Gunicorn configuration for the help bot pool
+
+Runs the same app as gunicorn_config.py, but the reverse proxy sends only
+/api/help-bot/* here. Threaded workers wait on Gemini in threads, so slow
+answers never occupy the sync workers that serve attendance, homework and the
+dashboards. Start it alongside the main pool:
+
+    gunicorn -c gunicorn_help_bot_config.py app:app
+"""
+import os
+
+# Server socket - internal only, the reverse proxy forwards /api/help-bot/ here
+port = int(os.environ.get('HELP_BOT_PORT', 5001))
+bind = f"127.0.0.1:{port}"
+backlog = 256
+
+# Worker processes
+workers = int(os.environ.get('HELP_BOT_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('HELP_BOT_THREADS', 8))
+# Generation itself gives up after HELP_BOT_TIMEOUT; leave headroom for retrieval and streaming
+timeout = int(float(os.environ.get('HELP_BOT_TIMEOUT', 20))) + 30
+graceful_timeout = 30
+keepalive = 5
+
+# Logging
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(D)s'
+
+# Process naming
+proc_name = 'tuitiontrack-help-bot'
+
+# Server mechanics
+daemon = False
+pidfile = None
+umask = 0
+user = None
+group = None
+tmp_redirect = False
+
+def on_starting(server):
+    """Called before the master process is initialized"""
+    from utils.metrics import remove_stale_files
+
+    # Shares METRICS_DIR with the main pool; only files of exited processes are removed
+    remove_stale_files()
+
+def when_ready(server):
+    """Called just after the server is started"""
+    server.log.info("Help bot pool is ready. Spawning workers")
+
+def child_exit(server, worker):
+    """Called in the master after a worker exits"""
+    from utils.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+def on_exit(server):
+    """Called just before exiting"""
+    server.log.info("Shutting down: Help bot pool")
@@ -15,6 +15,10 @@ mkdir -p logs
 echo "Initializing database and indexes..."
 python3 -c "from database import migrate_db, add_indexes; migrate_db(); add_indexes()"
 
+# Build fingerprinted CSS/JS bundles
+echo "Building static asset bundles..."
+python3 build_assets.py
+
 # Start Gunicorn
 echo "Starting TuitionTrack application..."
 gunicorn -c gunicorn_config.py app:app
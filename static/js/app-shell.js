@@ -0,0 +1,135 @@
+// App shell behaviour shared by every page (bundled as app-shell.js, see utils/assets.py)
+// base.html loads it after the page's {% block extra_js %}, so page scripts run first
+// Page data comes from the inline config in base.html: window.userLoggedIn, window.pageCacheUser, window.VAPID_PUBLIC_KEY
+
+// Auto-dismiss flash messages after 5 seconds
+setTimeout(function() {
+    const messages = document.getElementById('flash-messages');
+    if (messages) {
+        messages.style.animation = 'fadeOut 0.3s ease';
+        setTimeout(() => messages.remove(), 300);
+    }
+}, 5000);
+
+// Register Service Worker for PWA functionality
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', () => {
+        // Earlier versions registered the worker under /static/js/, where it controlled no pages
+        navigator.serviceWorker.getRegistrations().then((registrations) => {
+            registrations
+                .filter((registration) => registration.scope.endsWith('/static/js/'))
+                .forEach((registration) => registration.unregister());
+        });
+
+        // Served from the root so it controls every page (see utils/assets.py)
+        navigator.serviceWorker.register('/service-worker.js')
+            .then((registration) => {
+                console.log('Service Worker registered successfully:', registration.scope);
+
+                // Check for updates
+                registration.addEventListener('updatefound', () => {
+                    const newWorker = registration.installing;
+                    newWorker.addEventListener('statechange', () => {
+                        if (newWorker.state === 'installed' && navigator.serviceWorker.controller) {
+                            // New service worker available
+                            console.log('New Service Worker available');
+                            // Optionally show update notification to user
+                            if (confirm('A new version is available. Reload to update?')) {
+                                window.location.reload();
+                            }
+                        }
+                    });
+                });
+            })
+            .catch((error) => {
+                console.error('Service Worker registration failed:', error);
+            });
+
+        // The worker keeps cached pages per user; a different account clears them
+        navigator.serviceWorker.ready.then((registration) => {
+            registration.active.postMessage({ type: 'SET_USER', user: window.pageCacheUser || '' });
+        });
+
+        // Listen for service worker messages
+        navigator.serviceWorker.addEventListener('message', (event) => {
+            console.log('Message from Service Worker:', event.data);
+
+            // Handle push notification when app is open - show SweetAlert
+            if (event.data && event.data.type === 'push-notification') {
+                if (typeof Swal !== 'undefined') {
+                    Swal.fire({
+                        title: event.data.title || 'TuitionTrack',
+                        text: event.data.body || 'You have a new notification',
+                        icon: 'info',
+                        confirmButtonText: 'View',
+                        showCancelButton: true,
+                        cancelButtonText: 'Close',
+                        confirmButtonColor: '#4F46E5',
+                        allowOutsideClick: false,
+                        allowEscapeKey: true
+                    }).then((result) => {
+                        if (result.isConfirmed && event.data.url) {
+                            window.location.href = event.data.url;
+                        }
+                    });
+                } else {
+                    // Fallback to browser notification if SweetAlert not available
+                    if ('Notification' in window && Notification.permission === 'granted') {
+                        new Notification(event.data.title || 'TuitionTrack', {
+                            body: event.data.body || 'You have a new notification',
+                            icon: event.data.icon || '/static/TutionTrack_appIcon.png'
+                        });
+                    }
+                }
+            }
+        });
+    });
+}
+
+// Auto-request notification permission when user is logged in
+if (window.userLoggedIn) {
+    document.addEventListener('DOMContentLoaded', async function() {
+        // Wait a bit for page to load
+        setTimeout(async () => {
+            if ('Notification' in window && typeof subscribeToPushNotifications === 'function') {
+                const currentPermission = Notification.permission;
+                console.log('Current notification permission:', currentPermission);
+
+                // Only request if permission is default (not yet asked)
+                if (currentPermission === 'default') {
+                    console.log('Requesting notification permission...');
+                    try {
+                        const permission = await Notification.requestPermission();
+                        console.log('Permission result:', permission);
+
+                        if (permission === 'granted') {
+                            // Auto-subscribe to push notifications
+                            const result = await subscribeToPushNotifications();
+                            if (result && result.success) {
+                                console.log('Auto-subscribed to push notifications');
+                            }
+                        }
+                    } catch (error) {
+                        console.error('Error requesting notification permission:', error);
+                    }
+                } else if (currentPermission === 'granted') {
+                    // Permission already granted, check if subscribed
+                    try {
+                        const checkFn = window.checkPushSubscriptionStatus || checkPushSubscriptionStatus;
+                        if (typeof checkFn === 'function') {
+                            const status = await checkFn();
+                            if (!status.subscribed) {
+                                // Permission granted but not subscribed, subscribe now
+                                await subscribeToPushNotifications();
+                            }
+                        }
+                    } catch (error) {
+                        console.error('Error checking subscription status:', error);
+                    }
+                }
+            }
+        }, 2000); // Wait 2 seconds after page load
+    });
+}
+
+// Push notifications will be handled by push-notifications.js
@@ -317,11 +317,12 @@ const NiyaHelpBot = {
         messagesDiv.scrollTop = messagesDiv.scrollHeight;
         
         try {
-            // Call AI API
-            const response = await fetch('/api/help-bot/query', {
+            // Call AI API (streamed: the knowledge base answer arrives first, then Gemini's text)
+            const response = await fetch('/api/help-bot/query/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
                 },
                 body: JSON.stringify({
                     query: query,
@@ -329,29 +330,34 @@ const NiyaHelpBot = {
                 })
             });
             
-            const data = await response.json();
-            
-            // Remove typing indicator
-            const typingIndicator = document.getElementById('niya-typing-indicator');
-            if (typingIndicator) {
-                typingIndicator.remove();
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!response.body || !contentType.includes('text/event-stream')) {
+                // Validation or setup error - plain JSON
+                const data = await response.json();
+                this.showResponse(data.error || "I'm here to help! Could you please rephrase your question? 😊");
+                return;
             }
             
-            // Get response text
-            const responseText = data.success ? data.response : (data.error || "I'm here to help! Could you please rephrase your question? 😊");
+            let streamedText = '';
+            await this.readEventStream(response, (event, data) => {
+                if (event === 'context') {
+                    // Show the best knowledge base match while Gemini is still writing
+                    if (data.answer) {
+                        this.showResponse(data.answer);
+                    }
+                } else if (event === 'token') {
+                    streamedText += data.text;
+                    this.showResponse(streamedText);
+                } else if (event === 'done' || event === 'error') {
+                    this.showResponse(data.response);
+                }
+                messagesDiv.scrollTop = messagesDiv.scrollHeight;
+            });
             
-            // Show response
-            const responseEl = document.createElement('div');
-            responseEl.className = 'niya-message niya-message-left';
-            responseEl.innerHTML = `
-                <div class="niya-message-avatar">
-                    <img src="/static/niya_avatar_50x50.png" alt="Niya">
-                </div>
-                <div class="niya-message-content">
-                    ${responseText.replace(/\n/g, '<br>')}
-                </div>
-            `;
-            messagesDiv.appendChild(responseEl);
+            // Stream ended without a final event (connection dropped)
+            if (document.getElementById('niya-typing-indicator')) {
+                this.showResponse(streamedText || "I'm here to help! Could you please rephrase your question? 😊");
+            }
             
         } catch (error) {
             console.error('Error querying AI API:', error);
@@ -375,6 +381,12 @@ const NiyaHelpBot = {
             `;
             messagesDiv.appendChild(errorEl);
         } finally {
+            // The next reply gets its own message bubble
+            const streamingEl = document.getElementById('niya-streaming-response');
+            if (streamingEl) {
+                streamingEl.removeAttribute('id');
+            }
+
             // Re-enable input
             queryInput.disabled = false;
             sendBtn.disabled = false;
@@ -385,6 +397,62 @@ const NiyaHelpBot = {
         }
     },
     
+    // Replace the typing indicator with Niya's reply, or update the reply in place
+    showResponse: function(text) {
+        const messagesDiv = document.getElementById('niya-messages');
+        const typingIndicator = document.getElementById('niya-typing-indicator');
+        if (typingIndicator) {
+            typingIndicator.remove();
+        }
+        
+        let responseEl = document.getElementById('niya-streaming-response');
+        if (!responseEl) {
+            responseEl = document.createElement('div');
+            responseEl.className = 'niya-message niya-message-left';
+            responseEl.id = 'niya-streaming-response';
+            responseEl.innerHTML = `
+                <div class="niya-message-avatar">
+                    <img src="/static/niya_avatar_50x50.png" alt="Niya">
+                </div>
+                <div class="niya-message-content"></div>
+            `;
+            messagesDiv.appendChild(responseEl);
+        }
+        responseEl.querySelector('.niya-message-content').innerHTML = this.escapeHtml(text).replace(/\n/g, '<br>');
+    },
+    
+    // Read a Server-Sent Events response body, calling onEvent(event, data) per message
+    readEventStream: async function(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let event = 'message';
+                let data = '';
+                message.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) {
+                        event = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                });
+                if (data) {
+                    onEvent(event, JSON.parse(data));
+                }
+            }
+        }
+    },
+    
     // Escape HTML to prevent XSS
     escapeHtml: function(text) {
         const div = document.createElement('div');
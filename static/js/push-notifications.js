@@ -104,7 +104,7 @@ async function subscribeToPushNotifications() {
             console.error('Service worker not ready:', swError);
             // Try to register service worker if not already registered
             try {
-                registration = await navigator.serviceWorker.register('/static/js/service-worker.js');
+                registration = await navigator.serviceWorker.register('/service-worker.js');
                 await registration.ready;
                 console.log('Service worker registered and ready');
             } catch (regError) {
@@ -1,99 +1,257 @@
 // Service Worker for TuitionTrack PWA
-const CACHE_NAME = 'tuitiontrack-v1';
-const STATIC_CACHE = 'static-v1';
-const DYNAMIC_CACHE = 'dynamic-v1';
-
-// Assets to cache on install
-const STATIC_ASSETS = [
-  '/',
-  '/static/manifest.json',
-  '/static/TutionTrack_appIcon_192x192.png',
-  '/static/TutionTrack_headerLogo.png',
-  '/static/TutionTrack_logoNoBG.png',
-  '/static/js/swipe-gestures.js',
-  '/static/js/form-validation.js',
-  '/static/js/tours.js'
-];
-
-// Install event - cache static assets
+//
+// Served at /service-worker.js by the app, with the precache manifest that
+// build_assets.py generates prepended as self.__PRECACHE_MANIFEST:
+//     {version: '<hash>', entries: [{url, revision}, ...]}
+// Fingerprinted bundles have revision null (the URL changes with the content);
+// other files carry a content hash. On install only entries whose URL or
+// revision changed are downloaded, and activate drops the ones that are gone.
+const PRECACHE_MANIFEST = self.__PRECACHE_MANIFEST || { version: 'dev', entries: [] };
+const PRECACHE = 'precache-v2';
+// Pages are cached per signed-in user: pages-v2-<role>-<id> (see pagesCacheName)
+const PAGES_CACHE_PREFIX = 'pages-v2-';
+const UPLOADS_CACHE = 'uploads-v1';
+// Small cache holding the worker's own state, which must survive it being stopped
+const STATE_CACHE = 'sw-state-v1';
+const USER_KEY = '/__sw/user';
+
+// Dashboards open from the cached copy while a fresh one is fetched in the background
+const SHELL_PAGES = ['/dashboard', '/student/dashboard'];
+// A navigation this soon after a form submission or redirect is its follow-up
+// (e.g. the dashboard after login, with a flash message): always from the network
+const FOLLOW_UP_WINDOW_MS = 10000;
+let lastFormOrRedirect = 0;
+
+// User the cached pages belong to, as reported by the pages themselves (window.pageCacheUser)
+let currentUser = null;
+
+async function getCurrentUser() {
+    if (currentUser === null) {
+        const stored = await caches.open(STATE_CACHE).then((cache) => cache.match(USER_KEY));
+        currentUser = stored ? await stored.text() : '';
+    }
+    return currentUser;
+}
+
+async function setCurrentUser(user) {
+    if (user === await getCurrentUser()) {
+        return;
+    }
+    // Another account on this device: nothing the previous one cached may be shown
+    await clearUserCaches();
+    currentUser = user;
+    const cache = await caches.open(STATE_CACHE);
+    await cache.put(USER_KEY, new Response(user));
+}
+
+async function clearUserCaches() {
+    currentUser = '';
+    const cacheNames = await caches.keys();
+    await Promise.all(cacheNames
+        .filter((name) => name.startsWith(PAGES_CACHE_PREFIX) || name === UPLOADS_CACHE || name === STATE_CACHE)
+        .map((name) => caches.delete(name)));
+}
+
+// Name of the signed-in user's page cache, or null when the user is unknown
+async function pagesCacheName() {
+    const user = await getCurrentUser();
+    return user ? PAGES_CACHE_PREFIX + user : null;
+}
+
+async function openPagesCache() {
+    const name = await pagesCacheName();
+    return name ? caches.open(name) : null;
+}
+
+function isRedirect(response) {
+    return response && (response.redirected || response.type === 'opaqueredirect');
+}
+
+function precacheKey(entry) {
+    const url = new URL(entry.url, self.location.origin);
+    if (entry.revision) {
+        url.searchParams.set('__rev', entry.revision);
+    }
+    return url.href;
+}
+
+const PRECACHE_KEYS = new Map(
+    PRECACHE_MANIFEST.entries.map((entry) => [new URL(entry.url, self.location.origin).href, precacheKey(entry)])
+);
+
+// Install event - download precache entries that are new or changed
 self.addEventListener('install', (event) => {
-    console.log('Service Worker installing...');
+    console.log('Service Worker installing, precache version', PRECACHE_MANIFEST.version);
     event.waitUntil(
-        caches.open(STATIC_CACHE).then((cache) => {
-            console.log('Caching static assets');
-            return cache.addAll(STATIC_ASSETS.map(url => new Request(url, { cache: 'reload' })));
+        caches.open(PRECACHE).then((cache) => {
+            return Promise.all(PRECACHE_MANIFEST.entries.map(async (entry) => {
+                const key = precacheKey(entry);
+                if (await cache.match(key)) {
+                    return;
+                }
+                const response = await fetch(new Request(entry.url, { cache: 'reload' }));
+                if (response.ok) {
+                    await cache.put(key, response);
+                }
+            }));
         }).catch((error) => {
-            console.error('Error caching static assets:', error);
+            console.error('Error precaching assets:', error);
         })
     );
     self.skipWaiting(); // Activate immediately
 });
 
-// Activate event - clean up old caches
+// Activate event - remove precache entries no longer in the manifest and old caches
 self.addEventListener('activate', (event) => {
     console.log('Service Worker activating...');
+    const currentKeys = new Set(PRECACHE_KEYS.values());
     event.waitUntil(
         caches.keys().then((cacheNames) => {
-            return Promise.all(
-                cacheNames.map((cacheName) => {
-                    if (cacheName !== CACHE_NAME && 
-                        cacheName !== STATIC_CACHE && 
-                        cacheName !== DYNAMIC_CACHE) {
-                        console.log('Deleting old cache:', cacheName);
-                        return caches.delete(cacheName);
-                    }
-                })
-            );
-        })
+            return Promise.all(cacheNames.map((cacheName) => {
+                if (cacheName === PRECACHE) {
+                    return caches.open(PRECACHE).then((cache) => cache.keys().then((requests) => {
+                        return Promise.all(requests
+                            .filter((request) => !currentKeys.has(request.url))
+                            .map((request) => cache.delete(request)));
+                    }));
+                }
+                if (!cacheName.startsWith(PAGES_CACHE_PREFIX) && cacheName !== UPLOADS_CACHE && cacheName !== STATE_CACHE) {
+                    console.log('Deleting old cache:', cacheName);
+                    return caches.delete(cacheName);
+                }
+            }));
+        }).then(() => self.clients.claim()) // Take control of all pages
     );
-    return self.clients.claim(); // Take control of all pages
 });
 
-// Fetch event - serve from cache, fallback to network
+function isCacheable(response) {
+    if (!response || response.status !== 200 || response.type !== 'basic' || response.redirected) {
+        return false;
+    }
+    // Responses that must be revalidated (e.g. an image whose resized copy is
+    // still being made) are left to the HTTP cache
+    const cacheControl = response.headers.get('Cache-Control') || '';
+    return !cacheControl.includes('no-store') && !cacheControl.includes('no-cache');
+}
+
+async function staleWhileRevalidate(event, request) {
+    const cache = await openPagesCache();
+    const followUp = Date.now() - lastFormOrRedirect < FOLLOW_UP_WINDOW_MS;
+    const network = fetch(request).then(async (response) => {
+        if (isRedirect(response)) {
+            lastFormOrRedirect = Date.now();
+            if (cache) {
+                await cache.delete(request.url); // Session ended: do not show this page again
+            }
+        } else if (cache && !followUp && response && response.status === 200) {
+            // Follow-ups are not stored: they carry one-off flash messages
+            await cache.put(request.url, response.clone());
+        }
+        return response;
+    });
+    event.waitUntil(network.catch(() => {}));
+    if (!cache || followUp) {
+        return network;
+    }
+    return (await cache.match(request.url)) || network;
+}
+
+function networkFirstPage(request) {
+    return fetch(request).then((response) => {
+        if (isRedirect(response)) {
+            lastFormOrRedirect = Date.now();
+        }
+        return response;
+    }).catch(async () => {
+        // Offline: a cached copy of this page or the dashboard
+        const cache = await openPagesCache();
+        if (!cache) {
+            return Response.error();
+        }
+        return (await cache.match(request.url)) ||
+            (await cache.match(new URL('/student/dashboard', location.origin).href)) ||
+            (await cache.match(new URL('/dashboard', location.origin).href)) ||
+            Response.error();
+    });
+}
+
+// Fetch event
 self.addEventListener('fetch', (event) => {
     const { request } = event;
     const url = new URL(request.url);
 
-    // Skip cross-origin requests
-    if (url.origin !== location.origin) {
+    // Skip cross-origin and non-GET requests
+    if (url.origin !== location.origin || request.method !== 'GET') {
+        if (request.mode === 'navigate') {
+            lastFormOrRedirect = Date.now(); // Form submission: its redirect target is a follow-up
+        }
         return;
     }
 
-    // Skip non-GET requests
-    if (request.method !== 'GET') {
+    // Precached assets: cache first (their URL or revision changes with the content)
+    const key = PRECACHE_KEYS.get(url.href);
+    if (key) {
+        event.respondWith(
+            caches.open(PRECACHE)
+                .then((cache) => cache.match(key))
+                .then((cached) => cached || fetch(request))
+        );
         return;
     }
 
-    // Strategy: Cache First, then Network
-    event.respondWith(
-        caches.match(request).then((cachedResponse) => {
-            if (cachedResponse) {
-                return cachedResponse;
-            }
+    if (request.mode === 'navigate') {
+        // Cached pages belong to the logged-in user: forget them on logout and
+        // whenever the login page is opened (the session may have expired)
+        if (url.pathname === '/logout' || url.pathname === '/login') {
+            lastFormOrRedirect = Date.now();
+            event.waitUntil(clearUserCaches());
+            return;
+        }
+        if (SHELL_PAGES.includes(url.pathname)) {
+            event.respondWith(staleWhileRevalidate(event, request));
+            return;
+        }
+        // Other pages: network, falling back to a cached copy or dashboard when offline
+        event.respondWith(networkFirstPage(request));
+        return;
+    }
 
-            return fetch(request).then((response) => {
-                // Don't cache non-successful responses
-                if (!response || response.status !== 200 || response.type !== 'basic') {
-                    return response;
+    // Homework files served as immutable: cache first
+    if (url.pathname.startsWith('/uploads/')) {
+        event.respondWith(
+            caches.open(UPLOADS_CACHE).then(async (cache) => {
+                const cached = await cache.match(request);
+                if (cached) {
+                    return cached;
+                }
+                const response = await fetch(request);
+                if (isCacheable(response)) {
+                    cache.put(request, response.clone());
                 }
-
-                // Clone the response
-                const responseToCache = response.clone();
-
-                // Cache dynamic content
-                caches.open(DYNAMIC_CACHE).then((cache) => {
-                    cache.put(request, responseToCache);
-                });
-
                 return response;
-            }).catch(() => {
-                // Network failed, try to serve offline page
-                if (request.headers.get('accept').includes('text/html')) {
-                    return caches.match('/');
+            })
+        );
+        return;
+    }
+
+    // Attendance calendar months: network first, the last copy when offline
+    if (url.pathname === '/api/student/attendance/month') {
+        event.respondWith(
+            fetch(request).then(async (response) => {
+                const cache = await openPagesCache();
+                if (cache && response && response.status === 200 && !response.redirected) {
+                    await cache.put(request.url, response.clone());
                 }
-            });
-        })
-    );
+                return response;
+            }).catch(async () => {
+                const cache = await openPagesCache();
+                return (cache && await cache.match(request.url)) || Response.error();
+            })
+        );
+        return;
+    }
+
+    // Everything else goes to the network and the browser's HTTP cache
 });
 
 // Push event - handle incoming push notifications
@@ -242,11 +400,14 @@ self.addEventListener('message', (event) => {
         self.skipWaiting();
     }
     
+    // Every page reports who is signed in (empty when nobody is), see app-shell.js
+    if (event.data && event.data.type === 'SET_USER') {
+        event.waitUntil(setCurrentUser(event.data.user || ''));
+    }
+    
     if (event.data && event.data.type === 'CACHE_URLS') {
         event.waitUntil(
-            caches.open(DYNAMIC_CACHE).then((cache) => {
-                return cache.addAll(event.data.urls);
-            })
+            openPagesCache().then((cache) => cache && cache.addAll(event.data.urls))
         );
     }
 });
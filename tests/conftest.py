@@ -0,0 +1,60 @@
+"""Shared test setup: everything the app writes goes to a temporary directory
+
+Config reads the environment once, when it is first imported, so this has to
+run before any test imports the app or a utils module.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_root = tempfile.mkdtemp(prefix='tuitiontrack-tests-')
+os.environ.update({
+    'SECRET_KEY': 'test',
+    'DATABASE': os.path.join(_root, 'tutor_app.db'),
+    'UPLOAD_FOLDER': os.path.join(_root, 'uploads'),
+    'FRAGMENT_CACHE_DIR': os.path.join(_root, 'fragments'),
+    'TEMPLATE_CACHE_DIR': os.path.join(_root, 'templates'),
+    'PROMETHEUS_MULTIPROC_DIR': os.path.join(_root, 'metrics'),
+    'HELP_BOT_SLOT_DIR': os.path.join(_root, 'help-bot'),
+    'DB_CHECKPOINT_ENABLED': 'False',
+    'GEMINI_API_KEY': '',
+    'NIYA_STUB_MODEL_DELAY': '',
+})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_root, ignore_errors=True)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database with one tutor (id 1), one batch (id 1) and three students (ids 1-3)"""
+    from config import Config
+    from database import add_indexes, get_db_connection, init_db
+
+    monkeypatch.setattr(Config, 'DATABASE', str(tmp_path / 'tutor_app.db'))
+    init_db()
+    add_indexes()
+    conn = get_db_connection()
+    conn.execute("INSERT INTO users (mobile, tutor_name) VALUES ('9000000001', 'Test Tutor')")
+    conn.execute("INSERT INTO batches (name, start_time, user_id) VALUES ('Morning', '00:00', 1)")
+    conn.executemany('INSERT INTO students (name, phone, batch_id, user_id) VALUES (?, ?, 1, 1)',
+                     [('Asha', '9100000001'), ('Bala', '9100000002'), ('Chitra', '9100000003')])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client(db):
+    """Test client logged in as the tutor of the ``db`` fixture"""
+    from app import app
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['role'] = 'tutor'
+    return client
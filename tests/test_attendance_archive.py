@@ -0,0 +1,129 @@
+"""Archived attendance and monthly totals (utils/attendance_archive.py)"""
+from datetime import date, timedelta
+
+import pytest
+
+from utils import get_ist_today
+from utils.attendance_archive import (
+    ABSENT, LATE, MAX_MATRIX_DAYS, PRESENT, archive_closed_months, attendance_counts, attendance_matrix,
+    attendance_statuses, count_statuses,
+)
+
+FEBRUARY = (date(2026, 2, 1), date(2026, 2, 28))
+MARCH_1 = date(2026, 3, 1)
+
+
+def mark(conn, student_id, day, status):
+    conn.execute('INSERT INTO attendance (student_id, date, status, user_id) VALUES (?, ?, ?, 1)',
+                 (student_id, day.isoformat(), status))
+    conn.commit()
+
+
+def test_archive_moves_closed_months_and_keeps_statuses(db):
+    mark(db, 1, date(2026, 2, 2), PRESENT)
+    mark(db, 1, date(2026, 2, 28), LATE)
+    mark(db, 2, date(2026, 2, 2), ABSENT)
+    mark(db, 1, MARCH_1, PRESENT)
+    before = attendance_statuses(db.cursor(), 1, FEBRUARY[0], MARCH_1)
+
+    assert archive_closed_months(db, MARCH_1) == 3
+    assert db.execute('SELECT date FROM attendance').fetchall()[0]['date'] == MARCH_1.isoformat()
+    assert db.execute('SELECT COUNT(*) FROM attendance_archive').fetchone()[0] == 2
+    assert attendance_statuses(db.cursor(), 1, FEBRUARY[0], MARCH_1) == before
+    assert archive_closed_months(db, MARCH_1) == 0
+
+
+def test_late_rows_merge_into_archived_month(db):
+    mark(db, 1, date(2026, 2, 2), PRESENT)
+    archive_closed_months(db, MARCH_1)
+    mark(db, 1, date(2026, 2, 3), ABSENT)
+    archive_closed_months(db, MARCH_1)
+
+    assert attendance_statuses(db.cursor(), 1, *FEBRUARY) == {
+        1: {date(2026, 2, 2): PRESENT, date(2026, 2, 3): ABSENT}
+    }
+
+
+def test_matrix_rejects_huge_ranges(db):
+    start = date(2000, 1, 1)
+    ids, codes = attendance_matrix(db.cursor(), 1, start, start + timedelta(days=MAX_MATRIX_DAYS - 1), [1])
+    assert codes.shape == (1, MAX_MATRIX_DAYS)
+    with pytest.raises(ValueError):
+        attendance_matrix(db.cursor(), 1, date(1, 1, 1), date(9999, 12, 31), [1])
+
+
+def test_export_clamps_the_date_range(client, db):
+    mark(db, 1, get_ist_today() - timedelta(days=1), PRESENT)
+
+    response = client.get('/export/attendance?from=0001-01-01&to=9999-12-31')
+
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count('Present') == 1
+
+
+def test_student_page_counts_the_current_month(client, db):
+    today = get_ist_today()
+    last_month = today.replace(day=1) - timedelta(days=1)
+    mark(db, 1, last_month, ABSENT)
+    mark(db, 1, today, PRESENT)
+    archive_closed_months(db, today)
+
+    html = client.get('/students/1').get_data(as_text=True)
+
+    assert '100% Present' in html
+
+
+def monthly_totals(conn, month):
+    rows = conn.execute('SELECT student_id, present, late, absent FROM attendance_monthly WHERE month = ?', (month,))
+    return {row['student_id']: (row['present'], row['late'], row['absent']) for row in rows}
+
+
+def test_monthly_triggers_follow_inserts_updates_and_deletes(db):
+    mark(db, 1, date(2026, 3, 2), PRESENT)
+    mark(db, 1, date(2026, 3, 3), LATE)
+    mark(db, 2, date(2026, 3, 2), ABSENT)
+    assert monthly_totals(db, '2026-03') == {1: (1, 1, 0), 2: (0, 0, 1)}
+
+    db.execute("UPDATE attendance SET status = ? WHERE student_id = 1 AND date = '2026-03-03'", (ABSENT,))
+    db.execute("DELETE FROM attendance WHERE student_id = 2")
+    db.commit()
+    assert monthly_totals(db, '2026-03') == {1: (1, 0, 1), 2: (0, 0, 0)}
+
+
+def test_archived_months_keep_their_totals(db):
+    mark(db, 1, date(2026, 2, 2), PRESENT)
+    mark(db, 1, date(2026, 2, 3), LATE)
+    archive_closed_months(db, MARCH_1)
+    assert monthly_totals(db, '2026-02') == {1: (1, 1, 0)}
+
+
+def test_archived_yesterday_cannot_be_marked_again(client, db, monkeypatch):
+    """On the 1st, yesterday is already archived; re-marking it must not double its totals"""
+    import blueprints.attendance as attendance_views
+    from datetime import datetime
+
+    monkeypatch.setattr(attendance_views, 'get_ist_today', lambda: MARCH_1)
+    monkeypatch.setattr(attendance_views, 'get_ist_now', lambda: datetime(2026, 3, 1, 12, 0))
+    mark(db, 1, date(2026, 2, 28), PRESENT)
+    archive_closed_months(db, MARCH_1)
+
+    response = client.post('/api/attendance/save', json={'date': '2026-02-28', 'attendance': [
+        {'student_id': 1, 'status': ABSENT}, {'student_id': 2, 'status': LATE}]})
+
+    assert response.get_json()['saved_count'] == 1
+    assert monthly_totals(db, '2026-02') == {1: (1, 0, 0), 2: (0, 1, 0)}
+    assert attendance_statuses(db.cursor(), 1, *FEBRUARY) == {
+        1: {date(2026, 2, 28): PRESENT}, 2: {date(2026, 2, 28): LATE}
+    }
+    # The late record for student 2 joins the archive without changing the totals
+    archive_closed_months(db, MARCH_1)
+    assert monthly_totals(db, '2026-02') == {1: (1, 0, 0), 2: (0, 1, 0)}
+    assert_counts_match_matrix(db, FEBRUARY[0], MARCH_1)
+
+
+def assert_counts_match_matrix(conn, start, end):
+    ids, codes = attendance_matrix(conn.cursor(), 1, start, end)
+    present, late, absent = count_statuses(codes)
+    expected = {student_id: {'present': int(present[i]), 'late': int(late[i]), 'absent': int(absent[i])}
+                for i, student_id in enumerate(ids)}
+    assert attendance_counts(conn.cursor(), 1, start, end) == expected
@@ -0,0 +1,103 @@
+"""Content-addressed homework uploads (utils/blob_store.py)"""
+import io
+import os
+
+import pytest
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from config import Config
+from utils.blob_store import SpooledUpload, collect_garbage, store_upload
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    return tmp_path / 'uploads'
+
+
+def upload(conn, content=b'Worksheet 1', filename='worksheet.txt'):
+    return store_upload(conn, FileStorage(io.BytesIO(content), filename=filename))
+
+
+def add_homework(conn, file_path, batch_id=1):
+    cursor = conn.execute('''
+        INSERT INTO homework (title, batch_id, file_path, file_name, user_id)
+        VALUES ('Worksheet', ?, ?, 'worksheet.txt', 1)
+    ''', (batch_id, file_path))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def ref_count(conn, path):
+    row = conn.execute('SELECT ref_count FROM upload_blobs WHERE path = ?', (path,)).fetchone()
+    return row['ref_count'] if row else None
+
+
+def age_blob(conn, path, seconds):
+    conn.execute("UPDATE upload_blobs SET created_at = datetime('now', ?) WHERE path = ?",
+                 (f'-{seconds} seconds', path))
+    conn.commit()
+
+
+def test_same_content_is_stored_once(db, uploads):
+    first, _ = upload(db)
+    second, name = upload(db, filename='copy.txt')
+
+    assert first == second
+    assert name == 'copy.txt'
+    assert (uploads / first).read_bytes() == b'Worksheet 1'
+    assert db.execute('SELECT COUNT(*) FROM upload_blobs').fetchone()[0] == 1
+
+
+def test_blob_outlives_one_of_two_homework_rows(db, uploads):
+    path, _ = upload(db)
+    first = add_homework(db, path)
+    add_homework(db, path)
+    assert ref_count(db, path) == 2
+
+    db.execute('DELETE FROM homework WHERE id = ?', (first,))
+    db.commit()
+    age_blob(db, path, 7200)
+
+    assert ref_count(db, path) == 1
+    assert collect_garbage(db) == (0, 0)
+    assert (uploads / path).exists()
+
+
+def test_unreferenced_blob_is_collected_after_the_grace_period(db, uploads):
+    path, _ = upload(db)
+    add_homework(db, path)
+    add_homework(db, path)
+    db.execute('DELETE FROM homework')
+    db.commit()
+    assert ref_count(db, path) == 0
+
+    assert collect_garbage(db, grace_seconds=3600) == (0, 0)
+    assert (uploads / path).exists()
+
+    age_blob(db, path, 3601)
+    assert collect_garbage(db, grace_seconds=3600) == (1, len(b'Worksheet 1'))
+    assert not (uploads / path).exists()
+    assert ref_count(db, path) is None
+
+
+def test_oversize_spooled_upload_leaves_no_temp_file(tmp_path):
+    spool = SpooledUpload(str(tmp_path), max_size=10)
+    spool.write(b'x' * 10)
+    with pytest.raises(RequestEntityTooLarge):
+        spool.write(b'x')
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversize_homework_upload_is_rejected_mid_stream(client, db, uploads, monkeypatch):
+    monkeypatch.setattr(Config, 'MAX_FILE_SIZE', 1024)
+    response = client.post('/homework/share', data={
+        'title': 'Worksheet', 'batch_id': '1',
+        'file': (io.BytesIO(b'x' * 4096), 'worksheet.txt'),
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 302
+    assert os.listdir(uploads / 'blobs' / '.spool') == []
+    assert db.execute('SELECT COUNT(*) FROM homework').fetchone()[0] == 0
+    assert db.execute('SELECT COUNT(*) FROM upload_blobs').fetchone()[0] == 0
@@ -0,0 +1,59 @@
+"""Rendered fragment cache directory (utils/fragment_cache.py)"""
+import os
+import stat
+
+import pytest
+
+from config import Config
+from utils import fragment_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_checks(monkeypatch):
+    monkeypatch.setattr(fragment_cache, '_checked_dirs', {})
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_defaults_to_a_private_dir_next_to_the_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATABASE', str(tmp_path / 'tutor_app.db'))
+    monkeypatch.setattr(Config, 'FRAGMENT_CACHE_DIR', None)
+
+    assert fragment_cache.cache_dir() == str(tmp_path / 'fragment_cache')
+    assert mode(tmp_path / 'fragment_cache') == 0o700
+
+    fragment_cache.set_fragment('key', '<p>Report</p>')
+    assert fragment_cache.get_fragment('key') == '<p>Report</p>'
+
+
+def test_an_open_dir_of_ours_is_made_private(tmp_path, monkeypatch):
+    directory = tmp_path / 'fragments'
+    directory.mkdir()
+    directory.chmod(0o777)
+    monkeypatch.setattr(Config, 'FRAGMENT_CACHE_DIR', str(directory))
+
+    assert fragment_cache.cache_dir() == str(directory)
+    assert mode(directory) == 0o700
+
+
+def test_a_dir_owned_by_someone_else_is_not_used(tmp_path, monkeypatch):
+    directory = tmp_path / 'fragments'
+    directory.mkdir()
+    (directory / 'planted.html').write_text('<script>alert(1)</script>')
+    monkeypatch.setattr(Config, 'FRAGMENT_CACHE_DIR', str(directory))
+    monkeypatch.setattr(os, 'geteuid', lambda: os.stat(directory).st_uid + 1)
+
+    assert fragment_cache.cache_dir() is None
+    assert fragment_cache.get_fragment('key') is None
+    fragment_cache.set_fragment('key', '<p>Report</p>')
+    assert os.listdir(directory) == ['planted.html']
+
+
+def test_a_symlinked_dir_is_not_used(tmp_path, monkeypatch):
+    (tmp_path / 'elsewhere').mkdir()
+    (tmp_path / 'fragments').symlink_to(tmp_path / 'elsewhere')
+    monkeypatch.setattr(Config, 'FRAGMENT_CACHE_DIR', str(tmp_path / 'fragments'))
+
+    assert fragment_cache.cache_dir() is None
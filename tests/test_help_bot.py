@@ -0,0 +1,74 @@
+"""Help bot API endpoints (blueprints/help_bot.py)"""
+import json
+
+import pytest
+
+from config import Config
+from tests.test_rag_index import QA_PAIRS, open_index
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Must be set before construction: the stub model streams word chunks like Gemini
+    monkeypatch.setattr(Config, 'NIYA_STUB_MODEL_DELAY', '0.01')
+    rag = open_index(tmp_path)
+    rag.build_index([dict(qa) for qa in QA_PAIRS], force_rebuild=True)
+    monkeypatch.setattr('blueprints.help_bot.get_rag_system', lambda: rag)
+    return rag
+
+
+def sse_events(response):
+    events = []
+    for message in response.get_data(as_text=True).split('\n\n'):
+        if message:
+            event, data = message.split('\n')
+            events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+    return events
+
+
+def test_stream_sends_context_tokens_then_done(client, rag):
+    response = client.post('/api/help-bot/query/stream', json={'query': 'How do I record a fee payment?'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    events = sse_events(response)
+    names = [event for event, _ in events]
+    assert names[0] == 'context' and names[-1] == 'done'
+    assert set(names[1:-1]) == {'token'}
+
+    assert events[0][1]['used_rag'] is True
+    assert events[0][1]['answer'] == 'Open Payments.'
+    done = events[-1][1]
+    assert done['streamed'] is True
+    assert done['generation_status'] == 'ok'
+    assert done['response'] == ''.join(data['text'] for _, data in events[1:-1])
+
+
+@pytest.mark.parametrize('endpoint', ['/api/help-bot/query', '/api/help-bot/query/stream'])
+@pytest.mark.parametrize('body', [[], 'x', {'query': 5}, {'query': '   '}, {}])
+def test_query_requires_a_string(client, rag, endpoint, body):
+    response = client.post(endpoint, json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {'success': False, 'error': 'Query is required'}
+
+
+def test_stream_rejects_non_json_body(client, rag):
+    response = client.post('/api/help-bot/query/stream', data='query', content_type='text/plain')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Query is required'
+
+
+@pytest.mark.parametrize('body', [[], {'queries': ['add a student'], 'top_k': True},
+                                  {'queries': ['add a student'], 'top_k': 0}, {'queries': [5]}])
+def test_batch_rejects_bad_bodies(client, rag, body):
+    response = client.post('/api/help-bot/query/batch', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_batch_returns_matches(client, rag):
+    response = client.post('/api/help-bot/query/batch', json={'queries': ['add a new student'], 'top_k': 1})
+    result, = response.get_json()['results']
+    assert result['used_rag'] is True
+    assert result['matches'][0]['id'] == 2
@@ -0,0 +1,70 @@
+"""Help bot generation slots and timeout (utils/help_bot_limits.py)"""
+import threading
+
+from config import Config
+from utils.help_bot_limits import LimitedGeneration, acquire_generation_slot
+
+
+def test_slots_are_limited_and_released(tmp_path):
+    held = [acquire_generation_slot(limit=2, slot_dir=str(tmp_path)) for _ in range(2)]
+    assert all(held)
+    assert acquire_generation_slot(limit=2, slot_dir=str(tmp_path)) is None
+
+    held[0]()
+    release = acquire_generation_slot(limit=2, slot_dir=str(tmp_path))
+    assert release is not None
+    release()
+    held[1]()
+
+
+def test_generation_is_busy_while_slots_are_full(tmp_path):
+    release = acquire_generation_slot(limit=1, slot_dir=str(tmp_path))
+    called = []
+    generation = LimitedGeneration(lambda: called.append(1) or iter(['text']), limit=1, slot_dir=str(tmp_path))
+
+    assert list(generation) == []
+    assert generation.status == 'busy'
+    assert called == []
+
+    release()
+    generation = LimitedGeneration(lambda: iter(['text']), limit=1, slot_dir=str(tmp_path))
+    assert list(generation) == ['text']
+    assert generation.status == 'ok'
+
+
+def test_generation_times_out_and_keeps_its_slot(tmp_path):
+    finish = threading.Event()
+
+    def slow():
+        finish.wait(5)
+        yield 'late'
+
+    generation = LimitedGeneration(slow, timeout=0.05, limit=1, slot_dir=str(tmp_path))
+    assert list(generation) == []
+    assert generation.status == 'timeout'
+    # The abandoned call still counts against the limit until it finishes
+    assert acquire_generation_slot(limit=1, slot_dir=str(tmp_path)) is None
+    finish.set()
+
+
+def test_busy_query_falls_back_to_the_knowledge_base(client, tmp_path, monkeypatch):
+    from tests.test_rag_index import QA_PAIRS, open_index
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, 'NIYA_STUB_MODEL_DELAY', '0.01')
+    monkeypatch.setattr(Config, 'HELP_BOT_MAX_CONCURRENT', 1)
+    monkeypatch.setattr(Config, 'HELP_BOT_SLOT_DIR', str(tmp_path / 'slots'))
+    rag = open_index(tmp_path)
+    rag.build_index([dict(qa) for qa in QA_PAIRS], force_rebuild=True)
+    monkeypatch.setattr('blueprints.help_bot.get_rag_system', lambda: rag)
+
+    release = acquire_generation_slot()
+    try:
+        response = client.post('/api/help-bot/query', json={'query': 'How do I record a fee payment?'})
+    finally:
+        release()
+
+    data = response.get_json()
+    assert data['success'] is True
+    assert data['generation_status'] == 'busy'
+    assert data['response'] == 'Open Payments.'
@@ -0,0 +1,37 @@
+"""Access to /metrics (utils/metrics.py)"""
+import pytest
+
+from config import Config
+from utils import metrics
+
+pytestmark = pytest.mark.skipif(not metrics.ENABLED, reason='prometheus_client not installed')
+
+
+@pytest.fixture
+def anonymous():
+    from app import app
+
+    app.config['TESTING'] = True
+    return app.test_client()
+
+
+def scrape(client, remote_addr='127.0.0.1', **headers):
+    return client.get('/metrics', headers=headers, environ_base={'REMOTE_ADDR': remote_addr})
+
+
+def test_without_token_only_direct_localhost_requests_are_answered(anonymous, monkeypatch):
+    monkeypatch.setattr(Config, 'METRICS_TOKEN', '')
+
+    assert scrape(anonymous).status_code == 200
+    assert b'tuitiontrack_http_requests_total' in scrape(anonymous).data
+    assert scrape(anonymous, remote_addr='203.0.113.7').status_code == 403
+    # nginx on the same host connects from loopback but forwards the client's address
+    assert scrape(anonymous, **{'X-Forwarded-For': '203.0.113.7'}).status_code == 403
+
+
+def test_token_is_required_when_configured(anonymous, monkeypatch):
+    monkeypatch.setattr(Config, 'METRICS_TOKEN', 's3cret')
+
+    assert scrape(anonymous).status_code == 403
+    assert scrape(anonymous, Authorization='Bearer wrong').status_code == 403
+    assert scrape(anonymous, remote_addr='203.0.113.7', Authorization='Bearer s3cret').status_code == 200
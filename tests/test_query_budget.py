@@ -0,0 +1,61 @@
+"""Query budgets (utils/sql_trace.py): over-budget requests fail while testing"""
+import re
+from datetime import timedelta
+
+import pytest
+
+from utils import get_ist_today
+from utils.sql_trace import QueryBudgetExceeded
+
+TUTOR_PAGES = [
+    '/dashboard',
+    '/attendance?batch=1',
+    '/reports',
+    '/reports/batch/1',
+    '/reports/student/1',
+    '/export/attendance',
+]
+
+
+@pytest.fixture
+def marked(db):
+    """A week of attendance for every student"""
+    today = get_ist_today()
+    db.executemany('INSERT INTO attendance (student_id, date, status, user_id) VALUES (?, ?, 1, 1)',
+                   [(student_id, (today - timedelta(days=offset)).isoformat())
+                    for student_id in (1, 2, 3) for offset in range(7)])
+    db.commit()
+    return db
+
+
+def query_count(response):
+    return int(re.search(r'"(\d+) queries"', response.headers['Server-Timing']).group(1))
+
+
+@pytest.mark.parametrize('path', TUTOR_PAGES)
+def test_pages_stay_within_their_budget(client, marked, path):
+    from app import app
+
+    response = client.get(path)
+
+    view = app.view_functions[app.url_map.bind('localhost').match(path.split('?')[0])[0]]
+    assert response.status_code == 200
+    assert 0 < query_count(response) <= view.query_budget
+
+
+def test_over_budget_request_fails_while_testing(client, marked, monkeypatch):
+    from app import app
+
+    monkeypatch.setattr(app.view_functions['reports.reports'], 'query_budget', 2)
+    with pytest.raises(QueryBudgetExceeded, match='query_budget_exceeded'):
+        client.get('/reports')
+
+
+def test_over_budget_request_only_warns_in_production(client, marked, monkeypatch, caplog):
+    from app import app
+
+    monkeypatch.setattr(app.view_functions['reports.reports'], 'query_budget', 2)
+    monkeypatch.setattr(app, 'testing', False)
+
+    assert client.get('/reports').status_code == 200
+    assert 'query_budget_exceeded' in caplog.text
@@ -0,0 +1,121 @@
+"""Incremental help bot index updates (utils/rag_system.py)"""
+import os
+
+import pytest
+
+from utils.rag_system import NiyaRAGSystem
+
+QA_PAIRS = [
+    {'question': 'How do I mark attendance for a batch?', 'answer': 'Open Attendance.', 'category': 'attendance'},
+    {'question': 'How do I add a new student?', 'answer': 'Open Students.', 'category': 'students'},
+    {'question': 'How do I record a fee payment?', 'answer': 'Open Payments.', 'category': 'payments'},
+]
+
+
+def open_index(path):
+    rag = NiyaRAGSystem()
+    rag.qa_data_path = str(path / 'niya_qa_pairs.json')
+    rag.index_dir = str(path / 'niya_index')
+    rag.current_pointer_path = os.path.join(rag.index_dir, 'CURRENT')
+    return rag
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rag = open_index(tmp_path)
+    rag.build_index([dict(qa) for qa in QA_PAIRS], force_rebuild=True)
+    return rag
+
+
+def top_match(rag, query):
+    qa, score = rag.search_similar(query, top_k=1)[0]
+    return qa['id'], score
+
+
+def test_build_assigns_ids(rag):
+    assert [qa['id'] for qa in rag.qa_pairs] == [1, 2, 3]
+    assert top_match(rag, 'record a fee payment')[0] == 3
+
+
+def test_add_is_searchable_without_refit(rag):
+    vectorizer = rag.vectorizer
+    qa = rag.add_qa_pair('How do I record attendance for a new student?', 'Open Attendance.')
+
+    assert qa['id'] == 4
+    assert rag.vectorizer is vectorizer
+    assert rag.index.ntotal == 4
+    assert top_match(rag, 'record attendance for a new student') == (4, pytest.approx(1.0))
+
+
+def test_update_reembeds_only_a_changed_question(rag):
+    embeddings = rag.embeddings
+    rag.update_qa_pair(2, answer='Open Students and press Add.')
+    assert rag.qa_pairs[1]['answer'] == 'Open Students and press Add.'
+    assert (rag.embeddings == embeddings).all()
+
+    rag.update_qa_pair(2, question='How do I record a batch payment?')
+    assert top_match(rag, 'record a batch payment') == (2, pytest.approx(1.0))
+    assert top_match(rag, 'add a new student')[1] < rag.similarity_threshold
+
+
+def test_remove_drops_pair_from_results(rag):
+    rag.remove_qa_pair(1)
+
+    assert [qa['id'] for qa in rag.qa_pairs] == [2, 3]
+    assert rag.index.ntotal == 2
+    assert all(qa['id'] != 1 for qa, _ in rag.search_similar('mark attendance for a batch'))
+    with pytest.raises(KeyError):
+        rag.remove_qa_pair(1)
+
+
+def test_other_processes_load_published_changes(rag, tmp_path):
+    rag.add_qa_pair('How do I add a batch?', 'Open Batches.')
+
+    other = open_index(tmp_path)
+    assert other.ensure_index_loaded()
+    assert other.generation.name == rag.generation.name
+    assert [qa['id'] for qa in other.qa_pairs] == [1, 2, 3, 4]
+
+
+def test_removed_ids_are_never_reused(rag, tmp_path):
+    rag.remove_qa_pair(3)
+    assert rag.add_qa_pair('How do I add a batch?', 'Open Batches.')['id'] == 4
+
+    rag.remove_qa_pair(4)
+    # A fresh process reads next_id from the manifest, and a full rebuild keeps it
+    other = open_index(tmp_path)
+    other.ensure_index_loaded()
+    assert other.add_qa_pair('How do I delete a batch?', 'Open Batches.')['id'] == 5
+    other.build_index(other.load_qa_pairs_from_json() + [{'question': 'How do I log in?', 'answer': 'Use OTP.'}],
+                      force_rebuild=True)
+    assert [qa['id'] for qa in other.qa_pairs] == [1, 2, 5, 6]
+
+    result = other.sync_qa_pairs(other.qa_pairs[:-1] + [{'question': 'How do I log out?', 'answer': 'Menu.'}])
+    assert result == {'added': 1, 'updated': 0, 'removed': 1}
+    assert [qa['id'] for qa in other.qa_pairs] == [1, 2, 5, 7]
+
+
+def _add_pairs(path, worker, count):
+    rag = open_index(path)
+    for i in range(count):
+        rag.add_qa_pair(f'How do I add batch {worker}-{i}?', 'Open Batches.')
+
+
+def test_concurrent_processes_do_not_lose_updates(rag, tmp_path):
+    """Writers in other processes (the help bot pool, build_rag_index.py) share the index lock"""
+    import multiprocessing
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_add_pairs, args=(tmp_path, worker, 5)) for worker in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    rag.maybe_reload(force=True)
+    ids = [qa['id'] for qa in rag.qa_pairs]
+    assert len(ids) == len(set(ids)) == 3 + 15
+    assert {f'How do I add batch {worker}-{i}?' for worker in range(3) for i in range(5)} <= \
+        {qa['question'] for qa in rag.qa_pairs}
@@ -0,0 +1,153 @@
+"""Write transactions and the checkpointer lock (utils/write_coordinator.py)"""
+import multiprocessing
+import os
+import sqlite3
+
+import pytest
+
+from config import Config
+from database import get_db_connection
+from utils import write_coordinator
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATABASE', str(tmp_path / 'tutor_app.db'))
+    conn = get_db_connection()
+    conn.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT)')
+    conn.commit()
+    conn.close()
+    return Config.DATABASE
+
+
+def traced_connection(timeout=None):
+    conn = get_db_connection(timeout)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    return conn, statements
+
+
+def begins(statements):
+    return [sql for sql in statements if sql.strip().upper().startswith('BEGIN')]
+
+
+def count_notes():
+    conn = get_db_connection()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_write_opens_one_immediate_transaction(database):
+    conn, statements = traced_connection()
+    conn.execute("INSERT INTO notes (body) VALUES ('a')")
+    conn.execute("INSERT INTO notes (body) VALUES ('b')")
+    conn.commit()
+    conn.close()
+
+    assert begins(statements) == ['BEGIN IMMEDIATE']
+    assert count_notes() == 2
+
+
+def test_write_inside_an_explicit_transaction_gets_no_second_begin(database):
+    conn, statements = traced_connection()
+    conn.execute('BEGIN')
+    conn.execute("INSERT INTO notes (body) VALUES ('a')")
+    conn.cursor().executemany('INSERT INTO notes (body) VALUES (?)', [('b',), ('c',)])
+    conn.commit()
+    conn.close()
+
+    assert begins(statements) == ['BEGIN']
+    assert count_notes() == 3
+
+
+def test_executemany_opens_an_immediate_transaction(database):
+    conn, statements = traced_connection()
+    conn.executemany('INSERT INTO notes (body) VALUES (?)', [('a',), ('b',)])
+    assert conn.in_transaction
+    conn.rollback()
+    conn.close()
+
+    assert begins(statements) == ['BEGIN IMMEDIATE']
+    assert count_notes() == 0
+
+
+def test_executescript_runs_as_written(database):
+    conn = get_db_connection()
+    conn.executescript('''
+        BEGIN;
+        INSERT INTO notes (body) VALUES ('a');
+        INSERT INTO notes (body) VALUES ('b');
+        COMMIT;
+    ''')
+    assert not conn.in_transaction
+    conn.close()
+
+    assert count_notes() == 2
+
+
+@pytest.fixture
+def writer_holding_lock(database):
+    blocker = sqlite3.connect(database, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    yield blocker
+    if blocker.in_transaction:
+        blocker.rollback()
+    blocker.close()
+
+
+def test_locked_database_is_retried_then_raised(writer_holding_lock, monkeypatch):
+    monkeypatch.setattr(Config, 'DB_WRITE_RETRIES', 2)
+    attempts = []
+    monkeypatch.setattr(write_coordinator, 'backoff_delay', lambda attempt: attempts.append(attempt) or 0)
+
+    conn = get_db_connection(timeout=0)
+    with pytest.raises(sqlite3.OperationalError, match='database is locked'):
+        conn.execute("INSERT INTO notes (body) VALUES ('a')")
+    assert not conn.in_transaction
+    conn.close()
+
+    assert attempts == [0, 1]
+
+
+def test_write_succeeds_once_the_lock_is_released(writer_holding_lock, monkeypatch):
+    monkeypatch.setattr(Config, 'DB_WRITE_RETRIES', 3)
+
+    def release_on_second_retry(attempt):
+        if attempt == 1:
+            writer_holding_lock.rollback()
+        return 0
+
+    monkeypatch.setattr(write_coordinator, 'backoff_delay', release_on_second_retry)
+
+    conn = get_db_connection(timeout=0)
+    conn.execute("INSERT INTO notes (body) VALUES ('a')")
+    conn.commit()
+    conn.close()
+
+    assert count_notes() == 1
+
+
+def _take_checkpoint_lock(database, taken, release):
+    Config.DATABASE = database
+    taken.put(write_coordinator._hold_checkpoint_lock() is not None)
+    release.wait(10)
+
+
+def test_only_one_process_holds_the_checkpoint_lock(database):
+    ctx = multiprocessing.get_context('fork')
+    taken, release = ctx.Queue(), ctx.Event()
+    holder = ctx.Process(target=_take_checkpoint_lock, args=(database, taken, release))
+    holder.start()
+    try:
+        assert taken.get(timeout=10) is True
+        assert write_coordinator._hold_checkpoint_lock() is None
+    finally:
+        release.set()
+        holder.join(10)
+
+    # The lock goes away with the process that held it
+    fd = write_coordinator._hold_checkpoint_lock()
+    assert fd is not None
+    os.close(fd)
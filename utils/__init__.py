@@ -86,9 +86,14 @@ def get_secure_filename(filename):
     return secure_filename(filename)
 
 def cleanup_expired_homework():
-    """Delete homework that is past due date + 1 day and remove associated files"""
+    """Delete homework that is past due date + 1 day and remove associated files
+
+    Files in the blob store may be shared with other homework, so they are only
+    removed by blob_store.collect_garbage() once nothing references them.
+    """
     from database import get_db_connection
     from config import Config
+    from utils.blob_store import is_blob_path, collect_garbage
     import os
     from datetime import timedelta
     
@@ -112,8 +117,8 @@ def cleanup_expired_homework():
     deleted_files = 0
     
     for hw in expired_homework:
-        # Delete associated file if it exists
-        if hw['file_path']:
+        # Delete associated file if it exists (legacy per-homework uploads only)
+        if hw['file_path'] and not is_blob_path(hw['file_path']):
             file_path = os.path.join(Config.UPLOAD_FOLDER, hw['file_path'])
             try:
                 if os.path.exists(file_path):
@@ -130,33 +135,21 @@ def cleanup_expired_homework():
     if deleted_count > 0:
         conn.commit()
     
+    # Remove blobs no remaining homework uses (also catches replaced or deleted attachments)
+    deleted_blobs, _ = collect_garbage(conn)
+    deleted_files += deleted_blobs
+    
     conn.close()
     return deleted_count, deleted_files
 
 def cleanup_old_attendance():
-    """Delete attendance records from previous months (keep only current month)"""
+    """Archive attendance records from previous months (the table keeps only the current month)"""
     from database import get_db_connection
+    from utils.attendance_archive import archive_closed_months
     
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    today = get_ist_today()
-    current_month = today.month
-    current_year = today.year
-    
-    # Calculate first day of current month
-    first_day_current_month = date(current_year, current_month, 1)
-    
-    # Delete all attendance records before the current month
-    cursor.execute('''
-        DELETE FROM attendance 
-        WHERE date < ?
-    ''', (first_day_current_month.isoformat(),))
-    
-    deleted_count = cursor.rowcount
-    
-    if deleted_count > 0:
-        conn.commit()
-    
-    conn.close()
-    return deleted_count
+    try:
+        # Closed months move to attendance_archive, one compact row per student per month
+        return archive_closed_months(conn, get_ist_today())
+    finally:
+        conn.close()
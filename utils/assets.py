@@ -0,0 +1,330 @@
+"""Fingerprinted CSS/JS bundles for the page templates
+
+The stylesheets and scripts every page needs are concatenated into a few
+bundles, minified and written to static/dist/ under a name containing a hash
+of their content (app.3f9c2b1a7d.css). static/dist/manifest.json maps each
+bundle name to its current file; templates call asset_url('app.css').
+
+Because a changed bundle gets a new URL, the files are served with a one year
+immutable Cache-Control (see app.py), so after the first visit navigations
+fetch no CSS or JS at all.
+
+The same build writes the service worker (static/dist/service-worker.js,
+served at /service-worker.js) with a precache manifest prepended: the URL and
+content hash of every bundle and shell image. A deploy therefore changes the
+worker's bytes exactly when an asset changed, and the worker downloads only
+the entries whose hash differs instead of re-fetching everything.
+
+Each bundle also gets .gz and .br copies at maximum compression, which
+utils.compression serves to clients that accept them.
+
+Bundles are built by build_assets.py during deploy, and by the app at startup
+if the manifest is missing. In debug mode they are rebuilt whenever a source
+file changes. Minification uses rcssmin/rjsmin when installed, otherwise a
+conservative built-in minifier that only drops comments and whitespace.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+from utils.compression import PRECOMPRESSED_SUFFIXES, precompress_file
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+PRECACHE_MANIFEST_NAME = 'precache-manifest.json'
+SERVICE_WORKER_SOURCE = 'js/service-worker.js'
+SERVICE_WORKER_NAME = 'service-worker.js'
+HASH_LENGTH = 10
+FINGERPRINTED_RE = re.compile(rf'^{DIST_DIR}/[\w-]+\.[0-9a-f]{{{HASH_LENGTH}}}\.\w+$')
+
+# Bundle name -> source files under static/, concatenated in order
+BUNDLES = {
+    'app.css': ['css/base.css'],
+    'app.js': [
+        'js/form-validation.js',
+        'js/swipe-gestures.js',
+        'js/skeleton-loader.js',
+        'js/push-notifications.js',
+    ],
+    # Loaded after each page's own scripts (base.html), as the inline code it replaced was
+    'app-shell.js': ['js/app-shell.js'],
+    'help-bot.css': ['css/help-bot.css'],
+    'help-bot.js': ['js/help-bot.js'],
+    'tours.js': ['js/tours.js'],
+}
+
+# Files besides the bundles that the service worker keeps offline: URL -> file under static/
+PRECACHE_FILES = {
+    '/manifest.json': 'manifest.json',
+    '/static/TutionTrack_headerLogo.png': 'TutionTrack_headerLogo.png',
+    '/static/TutionTrack_appIcon_192x192.png': 'TutionTrack_appIcon_192x192.png',
+    '/static/TutionTrack_appIcon_96x96.png': 'TutionTrack_appIcon_96x96.png',
+    '/static/niya_avatar_50x50.png': 'niya_avatar_50x50.png',
+    '/static/niya_avatar_60x60.png': 'niya_avatar_60x60.png',
+    '/static/niya_avatar_80x80.png': 'niya_avatar_80x80.png',
+}
+
+_manifest = None
+_manifest_mtime = None
+_manifest_lock = threading.Lock()  # One thread rebuilds or reloads at a time
+
+
+def minify_css(source):
+    """Drop comments and redundant whitespace from a stylesheet"""
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    # Spaces before ':' are kept: "a :hover" and "a:hover" are different selectors
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+# After these characters a '/' starts a regular expression, not a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORD = re.compile(r'(?:^|[^\w$])(?:return|typeof|case|do|else|in|of|void|delete|new|throw)$')
+
+
+def minify_js(source):
+    """Drop comments, indentation and blank lines from a script
+
+    Strings, template literals and regular expressions are copied untouched and
+    line breaks are kept, so automatic semicolon insertion is not affected.
+    """
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+
+    out = []
+    i = 0
+    length = len(source)
+    pending_space = ''
+    while i < length:
+        char = source[i]
+
+        if char in ' \t\r\n':
+            j = i
+            while j < length and source[j] in ' \t\r\n':
+                j += 1
+            pending_space = '\n' if '\n' in source[i:j] else (pending_space or ' ')
+            i = j
+            continue
+
+        if source.startswith('//', i):
+            end = source.find('\n', i)
+            i = length if end == -1 else end
+            continue
+        if source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            if not pending_space:
+                pending_space = ' '
+            continue
+
+        if out and pending_space:
+            out.append(pending_space)
+        pending_space = ''
+
+        if char in '\'"`':
+            j = i + 1
+            while j < length and source[j] != char:
+                j += 2 if source[j] == '\\' else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+            continue
+
+        if char == '/':
+            previous = ''.join(out[-16:]).rstrip()
+            if not previous or previous[-1] in _REGEX_PRECEDERS or _REGEX_KEYWORD.search(previous):
+                j = i + 1
+                in_class = False
+                while j < length and (in_class or source[j] != '/') and source[j] != '\n':
+                    if source[j] == '\\':
+                        j += 1
+                    elif source[j] == '[':
+                        in_class = True
+                    elif source[j] == ']':
+                        in_class = False
+                    j += 1
+                out.append(source[i:j + 1])
+                i = j + 1
+                continue
+
+        out.append(char)
+        i += 1
+
+    return ''.join(out).strip() + '\n'
+
+
+def build_bundle(name, static_folder=STATIC_FOLDER):
+    """Return the minified content of a bundle"""
+    parts = []
+    for source in BUNDLES[name]:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            parts.append(f.read())
+    if name.endswith('.css'):
+        return '\n'.join(minify_css(part) for part in parts)
+    # A separator keeps one file's last statement from running into the next
+    return ';\n'.join(minify_js(part) for part in parts)
+
+
+def _write_atomic(path, content):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.asset-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def build_service_worker(manifest, static_folder=STATIC_FOLDER):
+    """Write the precache manifest and the service worker that embeds it
+
+    Returns {'version', 'entries', 'size', 'changed', 'changed_size'}, where
+    the changed counts are what an installed worker downloads on update.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    precache_path = os.path.join(dist, PRECACHE_MANIFEST_NAME)
+
+    previous = set()
+    if os.path.exists(precache_path):
+        with open(precache_path) as f:
+            previous = {(entry['url'], entry['revision']) for entry in json.load(f)['entries']}
+
+    entries = [{'url': f"/static/{entry['file']}", 'revision': None, 'size': entry['size']}
+               for entry in manifest.values()]
+    for url, file_name in PRECACHE_FILES.items():
+        path = os.path.join(static_folder, file_name)
+        entries.append({'url': url, 'revision': _file_digest(path)[:HASH_LENGTH], 'size': os.path.getsize(path)})
+    entries.sort(key=lambda entry: entry['url'])
+
+    listing = [{'url': entry['url'], 'revision': entry['revision']} for entry in entries]
+    version = hashlib.sha256(json.dumps(listing, sort_keys=True).encode('utf-8')).hexdigest()[:HASH_LENGTH]
+    precache = {'version': version, 'entries': listing}
+    _write_atomic(precache_path, json.dumps(precache, indent=2).encode('utf-8'))
+
+    with open(os.path.join(static_folder, SERVICE_WORKER_SOURCE), encoding='utf-8') as f:
+        source = f.read()
+    worker = f'self.__PRECACHE_MANIFEST = {json.dumps(precache)};\n' + source
+    _write_atomic(os.path.join(dist, SERVICE_WORKER_NAME), worker.encode('utf-8'))
+
+    changed = [entry for entry in entries if (entry['url'], entry['revision']) not in previous]
+    return {
+        'version': version,
+        'entries': len(entries),
+        'size': sum(entry['size'] for entry in entries),
+        'changed': len(changed),
+        'changed_size': sum(entry['size'] for entry in changed),
+    }
+
+
+def build_assets(static_folder=STATIC_FOLDER):
+    """Write every bundle, the manifest and the service worker
+
+    Returns ({bundle name: details}, precache details from build_service_worker).
+    Files from the previous build are kept so pages rendered before a deploy
+    can still load their assets; anything older is removed.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+    manifest_path = os.path.join(dist, MANIFEST_NAME)
+
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+
+    manifest = {}
+    report = {}
+    for name in BUNDLES:
+        content = build_bundle(name, static_folder).encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()
+        stem, extension = name.rsplit('.', 1)
+        file_name = f'{stem}.{digest[:HASH_LENGTH]}.{extension}'
+        path = os.path.join(dist, file_name)
+        if not os.path.exists(path):
+            _write_atomic(path, content)
+        compressed = precompress_file(path)
+        manifest[name] = {'file': f'{DIST_DIR}/{file_name}', 'sha256': digest, 'size': len(content)}
+        source_size = sum(os.path.getsize(os.path.join(static_folder, source)) for source in BUNDLES[name])
+        report[name] = {'file': file_name, 'source_size': source_size, 'size': len(content),
+                        'gzip': compressed.get('gzip'), 'br': compressed.get('br')}
+
+    _write_atomic(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    precache = build_service_worker(manifest, static_folder)
+
+    keep = {MANIFEST_NAME, PRECACHE_MANIFEST_NAME, SERVICE_WORKER_NAME}
+    keep.update(os.path.basename(entry['file']) for entry in manifest.values())
+    keep.update(os.path.basename(entry['file']) for entry in previous.values() if isinstance(entry, dict))
+    suffixes = tuple(PRECOMPRESSED_SUFFIXES.values())
+    for file_name in os.listdir(dist):
+        original = file_name[:-len(file_name.rsplit('.', 1)[1]) - 1] if file_name.endswith(suffixes) else file_name
+        if original not in keep and not file_name.startswith('.'):
+            os.remove(os.path.join(dist, file_name))
+
+    return report, precache
+
+
+def _sources_changed(manifest_path):
+    built = os.path.getmtime(manifest_path)
+    sources = [source for files in BUNDLES.values() for source in files]
+    sources += [SERVICE_WORKER_SOURCE, *PRECACHE_FILES.values()]
+    return any(os.path.getmtime(os.path.join(STATIC_FOLDER, source)) > built for source in sources)
+
+
+def load_manifest(rebuild_if_stale=False):
+    """Return the asset manifest, building the bundles first if there is none"""
+    global _manifest, _manifest_mtime
+    manifest_path = os.path.join(STATIC_FOLDER, DIST_DIR, MANIFEST_NAME)
+    with _manifest_lock:
+        if not os.path.exists(manifest_path) or (rebuild_if_stale and _sources_changed(manifest_path)):
+            build_assets()
+
+        mtime = os.path.getmtime(manifest_path)
+        if _manifest is None or mtime != _manifest_mtime:
+            with open(manifest_path) as f:
+                _manifest = json.load(f)
+            _manifest_mtime = mtime
+        return _manifest
+
+
+def asset_url(name):
+    """URL of the current fingerprinted file for a bundle (Jinja global)"""
+    from flask import current_app, url_for
+    manifest = load_manifest(rebuild_if_stale=current_app.debug)
+    return url_for('static', filename=manifest[name]['file'])
+
+
+def is_fingerprinted(filename):
+    """Whether a static file name is a content-hashed bundle"""
+    return bool(FINGERPRINTED_RE.match(filename))
+
+
+def static_cache_control(filename):
+    """Cache-Control for a static file: a year for content-hashed bundles, else None (Flask default)"""
+    if is_fingerprinted(filename):
+        return 'public, max-age=31536000, immutable'
+    return None
@@ -0,0 +1,324 @@
+"""Monthly attendance archive
+
+The attendance table only holds the current month, so the pages that mark and
+summarise today's attendance scan a small table. When a month closes,
+archive_closed_months() rolls each student's rows for it into one
+attendance_archive row and deletes them from attendance:
+
+    attendance_archive(user_id, student_id, month 'YYYY-MM', days BLOB)
+
+``days`` is a fixed 8-byte bitmap with a 2-bit code per day of the month:
+0 = no record, otherwise the attendance status + 1 (1 absent, 2 present,
+3 late). Day d sits in byte (d - 1) // 4 at bit 2 * ((d - 1) % 4). A student's
+year is twelve 8-byte values instead of hundreds of attendance rows, each
+with its own index entries.
+
+attendance_matrix() loads any date range from both tiers into a NumPy array of
+codes (one row per student, one column per day), unpacking all archive rows in
+one vectorised step; grids and reports count statuses with array sums instead
+of one query per student or per day. attendance_statuses() is a dict view of
+the same matrix.
+
+Status counts come from attendance_monthly instead, one row per student and
+month with its present/late/absent counts and last marked date. Triggers on
+attendance (database.create_attendance_monthly_schema) keep the current month
+up to date on every write. A closed month's row is recomputed from its merged
+archive bitmap and any attendance rows left for it (refresh_monthly()), never
+added to, so a day written again after archiving is only counted once. attendance_counts() reads whole months from it and only looks
+at single days for a month the range starts partway into.
+"""
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+
+NO_RECORD = -1
+ABSENT, PRESENT, LATE = 0, 1, 2
+PACKED_SIZE = 8  # Bytes per month: 31 days * 2 bits, rounded up
+MAX_MATRIX_DAYS = 3660  # attendance_matrix() allocates one byte per student per day
+_SHIFTS = np.arange(0, 8, 2, dtype=np.uint8)
+
+
+def month_key(day):
+    return f'{day.year:04d}-{day.month:02d}'
+
+
+def encode_month(statuses, year, month):
+    """Pack {day of month: status} into the 2-bit archive bitmap"""
+    days_in_month = monthrange(year, month)[1]
+    packed = 0
+    for day, status in statuses.items():
+        if status is not None and status >= 0 and 1 <= day <= days_in_month:
+            packed |= (status + 1) << (2 * (day - 1))
+    return packed.to_bytes(PACKED_SIZE, 'little')
+
+
+def unpack_months(blobs):
+    """Unpack archive bitmaps into a (len(blobs), 32) uint8 array of day codes"""
+    if not blobs:
+        return np.zeros((0, PACKED_SIZE * 4), dtype=np.uint8)
+    packed = np.frombuffer(b''.join(blobs), dtype=np.uint8).reshape(len(blobs), PACKED_SIZE)
+    return ((packed[:, :, None] >> _SHIFTS) & 3).reshape(len(blobs), PACKED_SIZE * 4)
+
+
+def decode_month(days):
+    """Unpack an archive bitmap into {day of month: status}, leaving out days without a record"""
+    codes = unpack_months([days])[0]
+    return {int(index) + 1: int(codes[index]) - 1 for index in np.flatnonzero(codes)}
+
+
+def _legacy_decode(days):
+    """Read the earlier one-byte-per-day format (status + 1, 0 = no record)"""
+    return {index + 1: value - 1 for index, value in enumerate(days) if value}
+
+
+def _merge(existing, new):
+    """Combine two encoded months; days recorded in ``new`` win"""
+    existing, new = int.from_bytes(existing, 'little'), int.from_bytes(new, 'little')
+    # Keep an existing day only where ``new`` has no record (both bits clear)
+    new_days = (new | (new >> 1)) & int('01' * (PACKED_SIZE * 4), 2)
+    return ((existing & ~(new_days * 3)) | new).to_bytes(PACKED_SIZE, 'little')
+
+
+def archive_closed_months(conn, today):
+    """Move attendance rows from months before today's into attendance_archive
+
+    Returns how many attendance rows were archived. Rows written late for an
+    already archived month are merged into its existing archive row.
+    """
+    first_of_month = date(today.year, today.month, 1).isoformat()
+    cursor = conn.cursor()
+    # Runs on every page view and almost always finds nothing: MIN(date) is a
+    # single idx_attendance_date lookup, where the range query below may be
+    # planned as a skip-scan of the covering user_id index across every tutor
+    cursor.execute('SELECT MIN(date) FROM attendance')
+    oldest = cursor.fetchone()[0]
+    if oldest is None or oldest >= first_of_month:
+        return 0
+    cursor.execute('''
+        SELECT student_id, user_id, date, COALESCE(status, present, 0) AS status
+        FROM attendance
+        WHERE date < ?
+    ''', (first_of_month,))
+    rows = cursor.fetchall()
+    if not rows:
+        return 0
+
+    months = defaultdict(dict)  # (user_id, student_id, 'YYYY-MM') -> {day: status}
+    for row in rows:
+        day = date.fromisoformat(row['date'])
+        months[(row['user_id'], row['student_id'], month_key(day))][day.day] = row['status']
+
+    for (user_id, student_id, month), statuses in months.items():
+        year, month_number = map(int, month.split('-'))
+        days = encode_month(statuses, year, month_number)
+        cursor.execute('SELECT days FROM attendance_archive WHERE student_id = ? AND month = ?', (student_id, month))
+        existing = cursor.fetchone()
+        if existing:
+            days = _merge(existing['days'], days)
+        cursor.execute('''
+            INSERT INTO attendance_archive (user_id, student_id, month, days) VALUES (?, ?, ?, ?)
+            ON CONFLICT (student_id, month) DO UPDATE SET days = excluded.days, user_id = excluded.user_id
+        ''', (user_id, student_id, month, days))
+
+    cursor.execute('DELETE FROM attendance WHERE date < ?', (first_of_month,))
+    # The delete triggers took these rows out of attendance_monthly; the merged
+    # bitmaps (including any late rows for an archived month) are the totals now
+    for (user_id, student_id, month) in months:
+        refresh_monthly(cursor, user_id, student_id, month)
+    conn.commit()
+    return len(rows)
+
+
+def _set_monthly(cursor, user_id, student_id, month, statuses):
+    """Write a student's attendance_monthly row from {day of month: status}"""
+    values = list(statuses.values())
+    last_marked = f'{month}-{max(statuses):02d}' if statuses else None
+    cursor.execute('''
+        INSERT INTO attendance_monthly (student_id, month, user_id, present, late, absent, last_marked)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (student_id, month) DO UPDATE SET
+            user_id = excluded.user_id, present = excluded.present, late = excluded.late,
+            absent = excluded.absent, last_marked = excluded.last_marked
+    ''', (student_id, month, user_id, values.count(PRESENT), values.count(LATE), values.count(ABSENT), last_marked))
+
+
+def refresh_monthly(cursor, user_id, student_id, month):
+    """Recompute a student's attendance_monthly row for ``month`` from both tiers
+
+    The archive bitmap is overlaid with the month's attendance rows (which win,
+    as in _merge), so a day present in both is counted once.
+    """
+    cursor.execute('SELECT days FROM attendance_archive WHERE student_id = ? AND month = ?', (student_id, month))
+    row = cursor.fetchone()
+    statuses = decode_month(row['days']) if row else {}
+    first_day, last_day = _month_bounds(month)
+    cursor.execute('''
+        SELECT date, COALESCE(status, present, 0) AS status FROM attendance
+        WHERE student_id = ? AND date BETWEEN ? AND ?
+    ''', (student_id, first_day.isoformat(), last_day.isoformat()))
+    for row in cursor.fetchall():
+        statuses[int(row['date'][8:10])] = row['status']
+    if statuses:
+        _set_monthly(cursor, user_id, student_id, month, statuses)
+    else:
+        cursor.execute('DELETE FROM attendance_monthly WHERE student_id = ? AND month = ?', (student_id, month))
+
+
+def rebuild_attendance_monthly(cursor):
+    """Recompute attendance_monthly from the archive and attendance tables; return its row count"""
+    months = defaultdict(dict)  # (user_id, student_id, 'YYYY-MM') -> {day: status}
+    cursor.execute('SELECT user_id, student_id, month, days FROM attendance_archive')
+    for row in cursor.fetchall():
+        months[(row['user_id'], row['student_id'], row['month'])].update(decode_month(row['days']))
+    cursor.execute('SELECT user_id, student_id, date, COALESCE(status, present, 0) AS status FROM attendance')
+    for row in cursor.fetchall():
+        months[(row['user_id'], row['student_id'], row['date'][:7])][int(row['date'][8:10])] = row['status']
+
+    cursor.execute('DELETE FROM attendance_monthly')
+    for (user_id, student_id, month), statuses in months.items():
+        _set_monthly(cursor, user_id, student_id, month, statuses)
+    return len(months)
+
+
+def repack_archive(cursor):
+    """Convert archive rows still in the one-byte-per-day format; return how many"""
+    cursor.execute('SELECT student_id, month, days FROM attendance_archive WHERE length(days) != ?', (PACKED_SIZE,))
+    rows = cursor.fetchall()
+    for row in rows:
+        year, month = map(int, row['month'].split('-'))
+        cursor.execute('UPDATE attendance_archive SET days = ? WHERE student_id = ? AND month = ?',
+                       (encode_month(_legacy_decode(row['days']), year, month), row['student_id'], row['month']))
+    return len(rows)
+
+
+def _student_filter(student_ids, column='student_id'):
+    if student_ids is None:
+        return '', []
+    return f' AND {column} IN ({",".join("?" * len(student_ids))})', list(student_ids)
+
+
+def attendance_matrix(cursor, user_id, start, end, student_ids=None):
+    """Load a tutor's attendance between two dates (inclusive) as a code matrix
+
+    Returns (ids, codes): codes[i, j] is the day code (0 = no record, else
+    status + 1) of student ids[i] on start + j days. ``ids`` is ``student_ids``
+    in the given order, or every student with a record when it is None.
+    Closed months come from the archive, the rest from the attendance table.
+    Raises ValueError for ranges over MAX_MATRIX_DAYS; callers taking a range
+    from the request clamp it first.
+    """
+    num_days = max((end - start).days + 1, 0)
+    if num_days > MAX_MATRIX_DAYS:
+        raise ValueError(f"Attendance range of {num_days} days exceeds {MAX_MATRIX_DAYS}")
+    if (student_ids is not None and not student_ids) or not num_days:
+        ids = list(student_ids or [])
+        return ids, np.zeros((len(ids), num_days), dtype=np.uint8)
+
+    student_sql, student_params = _student_filter(student_ids)
+    # With a student list, "+user_id" steers SQLite to the (student_id, month) key
+    # instead of reading every student's months through the user index
+    user_column = 'user_id' if student_ids is None else '+user_id'
+    cursor.execute(f'''
+        SELECT student_id, month, days FROM attendance_archive
+        WHERE {user_column} = ? AND month BETWEEN ? AND ?{student_sql}
+    ''', [user_id, month_key(start), month_key(end)] + student_params)
+    archive_rows = cursor.fetchall()
+    cursor.execute(f'''
+        SELECT student_id, date, COALESCE(status, present, 0) AS status FROM attendance
+        WHERE user_id = ? AND date BETWEEN ? AND ?{student_sql}
+    ''', [user_id, start.isoformat(), end.isoformat()] + student_params)
+    hot_rows = cursor.fetchall()
+
+    if student_ids is None:
+        ids = sorted({row['student_id'] for row in archive_rows} | {row['student_id'] for row in hot_rows})
+    else:
+        ids = list(student_ids)
+    row_of = {student_id: index for index, student_id in enumerate(ids)}
+    codes = np.zeros((len(ids), num_days), dtype=np.uint8)
+
+    unpacked = unpack_months([row['days'] for row in archive_rows])
+    for row, month_codes in zip(archive_rows, unpacked):
+        year, month = map(int, row['month'].split('-'))
+        offset = (date(year, month, 1) - start).days
+        low, high = max(offset, 0), min(offset + monthrange(year, month)[1], num_days)
+        if low < high:
+            codes[row_of[row['student_id']], low:high] = month_codes[low - offset:high - offset]
+
+    if hot_rows:
+        start_ordinal = start.toordinal()
+        rows = [row_of[row['student_id']] for row in hot_rows]
+        columns = [date.fromisoformat(row['date']).toordinal() - start_ordinal for row in hot_rows]
+        codes[rows, columns] = [row['status'] + 1 for row in hot_rows]
+    return ids, codes
+
+
+def count_statuses(codes):
+    """Per-row (present, late, absent) counts of a code matrix, as NumPy arrays"""
+    return ((codes == PRESENT + 1).sum(axis=1),
+            (codes == LATE + 1).sum(axis=1),
+            (codes == ABSENT + 1).sum(axis=1))
+
+
+def attendance_statuses(cursor, user_id, start, end, student_ids=None):
+    """Return {student_id: {date: status}} for a tutor's students between two dates (inclusive)
+
+    ``student_ids`` limits the result to those students; days without a record
+    are left out.
+    """
+    ids, codes = attendance_matrix(cursor, user_id, start, end, student_ids)
+    result = defaultdict(dict)
+    for row, column in zip(*np.nonzero(codes)):
+        result[ids[row]][start + timedelta(days=int(column))] = int(codes[row, column]) - 1
+    return result
+
+
+def _month_bounds(month):
+    year, month_number = map(int, month.split('-'))
+    return date(year, month_number, 1), date(year, month_number, monthrange(year, month_number)[1])
+
+
+def attendance_counts(cursor, user_id, start, end, student_ids=None):
+    """Return {student_id: {'present': n, 'late': n, 'absent': n}} between two dates (inclusive)
+
+    A month is taken from attendance_monthly when the range covers it from its
+    first day through its last marked date; otherwise (a range starting
+    mid-month, or records after ``end``) its days in the range are counted.
+    Students without any record in the range are left out.
+    """
+    if student_ids is not None and not student_ids:
+        return {}
+    student_sql, student_params = _student_filter(student_ids)
+    user_column = 'user_id' if student_ids is None else '+user_id'
+    cursor.execute(f'''
+        SELECT student_id, month, present, late, absent, last_marked FROM attendance_monthly
+        WHERE {user_column} = ? AND month BETWEEN ? AND ?{student_sql}
+    ''', [user_id, month_key(start), month_key(end)] + student_params)
+
+    totals = defaultdict(lambda: np.zeros(3, dtype=np.int64))  # student_id -> [present, late, absent]
+    partial = defaultdict(list)  # 'YYYY-MM' -> students whose days have to be counted
+    for row in cursor.fetchall():
+        first_day, last_day = _month_bounds(row['month'])
+        if first_day >= start and (last_day <= end or (row['last_marked'] or '') <= end.isoformat()):
+            totals[row['student_id']] += (row['present'], row['late'], row['absent'])
+        else:
+            partial[row['month']].append(row['student_id'])
+
+    for month, month_students in partial.items():
+        first_day, last_day = _month_bounds(month)
+        ids, codes = attendance_matrix(cursor, user_id, max(first_day, start), min(last_day, end), month_students)
+        present, late, absent = count_statuses(codes)
+        for index, student_id in enumerate(ids):
+            totals[student_id] += (present[index], late[index], absent[index])
+
+    return {
+        student_id: {'present': int(counts[0]), 'late': int(counts[1]), 'absent': int(counts[2])}
+        for student_id, counts in totals.items() if counts.any()
+    }
+
+
+def archived_months(cursor, student_id):
+    """'YYYY-MM' months archived for a student, oldest first"""
+    cursor.execute('SELECT month FROM attendance_archive WHERE student_id = ? ORDER BY month', (student_id,))
+    return [row['month'] for row in cursor.fetchall()]
@@ -0,0 +1,65 @@
+"""Month attendance calendar for one student
+
+The student attendance page, the tutor's student report and the JSON endpoint
+the PWA renders offline (/api/student/attendance/month) all draw the same
+calendar. month_grid() builds it from one attendance_matrix() range read - an
+archive lookup and an attendance range scan - so a month costs the same two
+queries whether it has 28 or 31 days, instead of one query per day.
+"""
+from calendar import monthrange
+from datetime import date, timedelta
+
+from utils.attendance_archive import archived_months, attendance_matrix, count_statuses, month_key
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+
+
+def parse_month(value, today):
+    """(year, month) for a 'YYYY-MM' string up to today's month; today's month otherwise"""
+    try:
+        requested = date.fromisoformat(f'{value}-01')
+    except (TypeError, ValueError):
+        return today.year, today.month
+    if requested > date(today.year, today.month, 1):
+        return today.year, today.month
+    return requested.year, requested.month
+
+
+def month_grid(cursor, user_id, student_id, year, month):
+    """Calendar layout, day statuses (-1 = no record) and counts for a student's month"""
+    month_days = monthrange(year, month)[1]
+    first_day = date(year, month, 1)
+    last_day = date(year, month, month_days)
+    codes = attendance_matrix(cursor, user_id, first_day, last_day, [student_id])[1]
+    date_range = [(first_day + timedelta(days=i)).isoformat() for i in range(month_days)]
+    present_count, late_count, absent_count = (int(count[0]) for count in count_statuses(codes))
+    return {
+        'year': year,
+        'month': month,
+        'month_key': month_key(first_day),
+        'month_name': MONTH_NAMES[month - 1],
+        'month_days': month_days,
+        'date_range': date_range,
+        'attendance_by_date': {date_str: int(code) - 1 for date_str, code in zip(date_range, codes[0])},
+        'first_day_weekday': first_day.weekday(),  # 0 = Monday, 6 = Sunday
+        'last_day_weekday': last_day.weekday(),
+        'remaining_cells': 6 - last_day.weekday(),  # Empty cells needed after month ends
+        'present_count': present_count,
+        'late_count': late_count,
+        'absent_count': absent_count,
+        'na_count': month_days - present_count - late_count - absent_count,
+        'attended_count': present_count + late_count,
+    }
+
+
+def adjacent_months(cursor, student_id, today, selected_key):
+    """('YYYY-MM' or None, 'YYYY-MM' or None) around a month: archived months plus the current one"""
+    months = archived_months(cursor, student_id)
+    current_key = month_key(today)
+    if current_key not in months:
+        months.append(current_key)
+    index = months.index(selected_key) if selected_key in months else len(months) - 1
+    prev_month = months[index - 1] if index > 0 else None
+    next_month = months[index + 1] if index + 1 < len(months) else None
+    return prev_month, next_month
@@ -0,0 +1,198 @@
+"""Content-addressed storage for homework uploads
+
+Each unique file is stored once, at UPLOAD_FOLDER/blobs/<aa>/<sha256>.<ext>,
+no matter how many homework rows use it. Rows in the upload_blobs table count
+the homework rows pointing at each file (kept by triggers, see
+database.create_upload_blob_schema), and collect_garbage() deletes files nobody
+references any more. Sharing the same worksheet with five batches therefore
+costs one file on disk and in backups.
+
+Multipart uploads are not buffered in memory: UploadRequest streams each file
+part into a spool file inside the blob directory, hashing it and checking
+MAX_FILE_SIZE chunk by chunk, so an oversized file is rejected as soon as it
+crosses the limit and an accepted one is hard-linked into place without being
+read or copied again.
+
+Files saved before this store existed live under uploads/homework/ and are not
+tracked here; cleanup_expired_homework() still deletes those directly.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from config import Config
+from utils import get_secure_filename
+
+BLOB_DIR = 'blobs'
+SPOOL_DIR = f'{BLOB_DIR}/.spool'
+CHUNK_SIZE = 64 * 1024
+# Stored files must be readable by the web server in the x-accel / x-sendfile modes
+FILE_MODE = 0o644
+# Unreferenced blobs are kept this long, so an upload stored just before its
+# homework row is inserted is never collected in between
+GC_GRACE_SECONDS = 3600
+
+
+def blob_path(sha256, extension=''):
+    """Relative path (under UPLOAD_FOLDER) of the blob for a content hash"""
+    suffix = f'.{extension}' if extension else ''
+    return f'{BLOB_DIR}/{sha256[:2]}/{sha256}{suffix}'
+
+
+def is_blob_path(path):
+    """Whether a homework file_path points into the blob store"""
+    return bool(path) and path.startswith(BLOB_DIR + '/')
+
+
+def hash_stream(stream):
+    """Return (sha256 hex digest, size) of a seekable stream, leaving it at the start"""
+    digest = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+class SpooledUpload:
+    """Temporary file a multipart file part is streamed into
+
+    Werkzeug's form parser writes the part here chunk by chunk. Every chunk is
+    added to the SHA-256 digest and counted against ``max_size`` on the way in.
+    The file is deleted when the request closes its uploads; store_upload()
+    links it into the blob store before that.
+    """
+
+    def __init__(self, directory, max_size):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-')
+        self._digest = hashlib.sha256()
+        self.max_size = max_size
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size and self.size > self.max_size:
+            self._file.close()
+            raise RequestEntityTooLarge(f'File size exceeds {self.max_size // (1024 * 1024)}MB limit')
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """Request class that spools uploaded files into the blob store (see SpooledUpload)"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledUpload(os.path.join(Config.UPLOAD_FOLDER, SPOOL_DIR), Config.MAX_FILE_SIZE)
+
+
+def _write_blob(stream, full_path):
+    """Put a stream's content at full_path atomically (hard link for spooled uploads)"""
+    directory = os.path.dirname(full_path)
+    os.makedirs(directory, exist_ok=True)
+    if isinstance(stream, SpooledUpload):
+        stream.flush()
+        os.chmod(stream.name, FILE_MODE)
+        try:
+            os.link(stream.name, full_path)
+            return
+        except FileExistsError:
+            return
+        except OSError:
+            pass  # Spool on another filesystem or no hard links: copy instead
+
+    stream.seek(0)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            shutil.copyfileobj(stream, out, CHUNK_SIZE)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, full_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def store_upload(conn, file):
+    """Store an uploaded file (werkzeug FileStorage) and return (file_path, file_name)
+
+    ``file_path`` is the blob path to save on the homework row and ``file_name``
+    the sanitized original name for display. Content that is already stored is
+    not written again. The blob row is registered and committed here, which
+    also restarts its garbage collection grace period. Images are queued for
+    resized copies (see utils/upload_derivatives.py).
+    """
+    from utils import upload_derivatives
+
+    if isinstance(file.stream, SpooledUpload):
+        sha256, size = file.stream.hexdigest(), file.stream.size
+    else:
+        sha256, size = hash_stream(file.stream)
+    file_name = get_secure_filename(file.filename)
+    extension = file_name.rsplit('.', 1)[1].lower() if '.' in file_name else ''
+    path = blob_path(sha256, extension)
+
+    derivative_status = 'pending' if upload_derivatives.wants_derivatives(path) else None
+
+    conn.execute('''
+        INSERT INTO upload_blobs (path, sha256, size, derivative_status) VALUES (?, ?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET created_at = CURRENT_TIMESTAMP
+    ''', (path, sha256, size, derivative_status))
+    conn.commit()
+
+    # collect_garbage() removes a file before committing the row's deletion, so
+    # once our row is committed a missing file means it really has to be written
+    full_path = os.path.join(Config.UPLOAD_FOLDER, path)
+    if not os.path.exists(full_path):
+        _write_blob(file.stream, full_path)
+
+    if derivative_status:
+        upload_derivatives.enqueue(path)
+
+    return path, file_name
+
+
+def collect_garbage(conn, grace_seconds=GC_GRACE_SECONDS):
+    """Delete blobs no homework row has referenced for ``grace_seconds``
+
+    Returns (blobs deleted, bytes freed). Commits on ``conn``.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT path, size, display_path, thumb_path FROM upload_blobs
+        WHERE ref_count <= 0 AND created_at < datetime('now', ?)
+    ''', (f'-{int(grace_seconds)} seconds',))
+    candidates = cursor.fetchall()
+
+    deleted = 0
+    freed = 0
+    for blob in candidates:
+        # Re-check inside the write transaction: a concurrent upload may have revived it
+        cursor.execute('DELETE FROM upload_blobs WHERE path = ? AND ref_count <= 0', (blob['path'],))
+        if cursor.rowcount:
+            for path in (blob['path'], blob['display_path'], blob['thumb_path']):
+                if not path:
+                    continue
+                try:
+                    os.remove(os.path.join(Config.UPLOAD_FOLDER, path))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Error deleting blob {path}: {e}")
+            deleted += 1
+            freed += blob['size']
+
+    conn.commit()
+    return deleted, freed
@@ -0,0 +1,245 @@
+"""Response compression for HTML, JSON and static text files
+
+CompressionMiddleware wraps the WSGI app. Each response whose content type is
+text-like and at least COMPRESSION_MIN_SIZE bytes is compressed with brotli or
+gzip, whichever the client prefers in Accept-Encoding. Brotli is used only if
+the optional brotli package is installed.
+
+Static CSS/JS that build_assets.py precompressed (<file>.br / <file>.gz) is
+served from those files, so the worker never compresses it per request.
+
+Responses without a Content-Length (streamed) are compressed chunk by chunk,
+and each chunk is flushed, so the client still receives every chunk as it is
+produced. Server-Sent Events (text/event-stream) are never compressed, because
+buffering in the compressor would hold back help bot tokens.
+"""
+import gzip
+import mimetypes
+import os
+import zlib
+
+from werkzeug.http import parse_accept_header
+from werkzeug.utils import send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # gzip only
+
+COMPRESSIBLE_TYPES = {
+    'application/javascript',
+    'application/json',
+    'application/manifest+json',
+    'application/xml',
+    'image/svg+xml',
+}
+PRECOMPRESS_EXTENSIONS = ('.css', '.js', '.json', '.svg')
+# Content-Encoding -> file suffix of the precompressed copy
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def is_compressible(content_type):
+    mimetype = (content_type or '').split(';', 1)[0].strip().lower()
+    if mimetype == 'text/event-stream':
+        return False
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def accepted_encodings(accept_encoding, available):
+    """Encodings from ``available`` the client accepts, most preferred first (ties keep order)"""
+    accepted = parse_accept_header(accept_encoding or '')
+    ranked = sorted(available, key=lambda encoding: -accepted.quality(encoding))
+    return [encoding for encoding in ranked if accepted.quality(encoding) > 0]
+
+
+def _add_vary(headers):
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == 'vary':
+            if 'accept-encoding' not in value.lower():
+                headers[index] = (name, f'{value}, Accept-Encoding')
+            return
+    headers.append(('Vary', 'Accept-Encoding'))
+
+
+class _Compressor:
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data, flush=False):
+        if self.encoding == 'br':
+            out = self._brotli.process(data)
+            return out + self._brotli.flush() if flush else out
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+class _CompressedBody:
+    """Iterable that compresses the wrapped app's body and closes it afterwards
+
+    ``state`` is filled in by start_response, which a WSGI app may call as late
+    as its first chunk, so the choice is read per chunk rather than up front.
+    """
+
+    def __init__(self, app_iter, state):
+        self.app_iter = app_iter
+        self.state = state
+
+    def __iter__(self):
+        for chunk in self.app_iter:
+            compressor = self.state.get('compressor')
+            if compressor is None:
+                yield chunk
+            elif chunk:
+                data = compressor.compress(chunk, flush=self.state['streaming'])
+                if data:
+                    yield data
+        compressor = self.state.get('compressor')
+        if compressor is not None:
+            tail = compressor.finish()
+            if tail:
+                yield tail
+
+    def close(self):
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+class CompressionMiddleware:
+    """WSGI middleware compressing responses and serving precompressed static files"""
+
+    def __init__(self, app, minimum_size=500, gzip_level=6, brotli_quality=5,
+                 static_folder=None, static_url_path='/static', static_cache_control=None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.static_folder = static_folder
+        self.static_url_path = static_url_path.rstrip('/') + '/'
+        # Callable(relative path) -> Cache-Control value for precompressed static files
+        self.static_cache_control = static_cache_control
+
+    def __call__(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if method not in ('GET', 'HEAD'):
+            return self.app(environ, start_response)
+
+        accept_encoding = environ.get('HTTP_ACCEPT_ENCODING')
+        if self.static_folder and environ.get('PATH_INFO', '').startswith(self.static_url_path):
+            precompressed = self._precompressed_response(environ, accepted_encodings(accept_encoding, ('br', 'gzip')))
+            if precompressed is not None:
+                return precompressed(environ, start_response)
+
+        if method == 'HEAD':
+            return self.app(environ, start_response)
+
+        encodings = accepted_encodings(accept_encoding, ('br', 'gzip') if brotli is not None else ('gzip',))
+        encoding = encodings[0] if encodings else None
+        state = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            headers = list(headers)
+            compressor = self._choose(status, headers, encoding)
+            if compressor is not None:
+                state['streaming'] = not any(name.lower() == 'content-length' for name, _ in headers)
+                headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+                headers.append(('Content-Encoding', compressor.encoding))
+                # A compressed body is a different representation of the same resource
+                headers = [(name, f'W/{value}' if name.lower() == 'etag' and not value.startswith('W/') else value)
+                           for name, value in headers]
+                state['compressor'] = compressor
+            if compressor is not None or is_compressible(_header(headers, 'content-type')):
+                _add_vary(headers)
+            write = start_response(status, headers, exc_info)
+            if compressor is None:
+                return write
+            return lambda data: write(compressor.compress(data, flush=True))
+
+        app_iter = self.app(environ, compressing_start_response)
+        if encoding is None:
+            return app_iter
+        return _CompressedBody(app_iter, state)
+
+    def _choose(self, status, headers, encoding):
+        """Return a compressor if this response should be compressed, else None"""
+        if encoding is None:
+            return None
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return None
+        if not is_compressible(_header(headers, 'content-type')):
+            return None
+        if _header(headers, 'content-encoding') or _header(headers, 'content-range'):
+            return None
+        # The proxy sends the body of these responses
+        if _header(headers, 'x-accel-redirect') or _header(headers, 'x-sendfile'):
+            return None
+        if 'no-transform' in (_header(headers, 'cache-control') or '').lower():
+            return None
+        length = _header(headers, 'content-length')
+        if length is not None and int(length) < self.minimum_size:
+            return None
+        return _Compressor(encoding, self.gzip_level, self.brotli_quality)
+
+    def _precompressed_response(self, environ, encodings):
+        """Response for the .br/.gz copy of a static file, or None to fall through"""
+        relative = environ['PATH_INFO'][len(self.static_url_path):]
+        if not encodings or '..' in relative.split('/') or not relative.endswith(PRECOMPRESS_EXTENSIONS):
+            return None
+        source = os.path.join(self.static_folder, *relative.split('/'))
+        for encoding in encodings:
+            path = source + PRECOMPRESSED_SUFFIXES[encoding]
+            try:
+                if os.path.getmtime(path) < os.path.getmtime(source):
+                    continue  # Source edited since the build: compress on the fly instead
+            except OSError:
+                continue
+            mimetype = mimetypes.guess_type(source)[0] or 'application/octet-stream'
+            response = send_file(path, environ, mimetype=mimetype, conditional=True)
+            response.headers['Content-Encoding'] = encoding
+            response.headers['Vary'] = 'Accept-Encoding'
+            cache_control = self.static_cache_control(relative) if self.static_cache_control else None
+            if cache_control:
+                response.headers['Cache-Control'] = cache_control
+            return response
+        return None
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def precompress_file(path, minimum_size=500):
+    """Write <path>.gz (and <path>.br if brotli is installed) at maximum compression
+
+    Copies that would not be smaller are skipped. Returns {encoding: size}.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    sizes = {}
+    if len(data) < minimum_size:
+        return sizes
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    for encoding, compressed in variants.items():
+        target = path + PRECOMPRESSED_SUFFIXES[encoding]
+        if len(compressed) >= len(data):
+            continue
+        with open(target + '.tmp', 'wb') as f:
+            f.write(compressed)
+        os.replace(target + '.tmp', target)
+        sizes[encoding] = len(compressed)
+    return sizes
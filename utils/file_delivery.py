@@ -0,0 +1,87 @@
+"""Delivery of uploaded homework files
+
+The app always performs the login and ownership check. Config.FILE_DELIVERY_MODE
+then decides who moves the bytes:
+
+    'flask'      - the worker streams the file itself (default; works anywhere,
+                   but a slow client holds the worker for the whole transfer)
+    'x-accel'    - nginx: the response carries X-Accel-Redirect pointing at an
+                   internal location and nginx sends the file
+    'x-sendfile' - Apache mod_xsendfile / lighttpd: the response carries
+                   X-Sendfile with the absolute path and the server sends it
+
+In the proxy modes the worker is released as soon as the headers are written.
+
+Every response carries an ETag and is cacheable only by the user's browser
+(Cache-Control: private). Content-addressed URLs never change content, so they
+are cached for a year as immutable and repeat views cost no request at all;
+other files must be revalidated, which a matching If-None-Match answers with
+an empty 304 before any file is touched. Range requests (PDF viewers seeking
+in large worksheets) get 206 partial responses from Werkzeug in 'flask' mode
+and from the proxy in the others.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import Response, abort, request, send_from_directory
+from werkzeug.security import safe_join
+
+from config import Config
+
+DELIVERY_MODES = ('flask', 'x-accel', 'x-sendfile')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _set_cache_headers(response, immutable):
+    if immutable:
+        response.headers['Cache-Control'] = f'private, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def send_upload(relative_path, download_name=None, mode=None, etag=None, immutable=False):
+    """Return a response delivering UPLOAD_FOLDER/relative_path in the configured mode
+
+    Callers must check access first. ``download_name`` is offered to the browser
+    as the file name (blob paths are content hashes). ``etag`` is a strong
+    validator for the content (default: derived from modification time and
+    size); pass ``immutable=True`` only when the URL always serves the same
+    bytes. Aborts with 404 for paths outside the upload folder or files that do
+    not exist.
+    """
+    mode = (mode or Config.FILE_DELIVERY_MODE).lower()
+    if mode not in DELIVERY_MODES:
+        raise ValueError(f"Unknown FILE_DELIVERY_MODE {mode!r}; expected one of {', '.join(DELIVERY_MODES)}")
+
+    full_path = safe_join(Config.UPLOAD_FOLDER, relative_path)
+    if full_path is None or not os.path.isfile(full_path):
+        abort(404)
+
+    if mode == 'flask':
+        # Werkzeug answers If-None-Match with 304 and Range with 206 itself
+        response = send_from_directory(Config.UPLOAD_FOLDER, relative_path,
+                                       download_name=download_name, etag=etag or True)
+        return _set_cache_headers(response, immutable)
+
+    mimetype = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    response = Response(mimetype=mimetype)
+    if not etag:
+        stat = os.stat(full_path)
+        etag = f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+    response.set_etag(etag)
+    _set_cache_headers(response, immutable)
+    # A revalidated file needs no help from the proxy: answer 304 here
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    if download_name:
+        response.headers.set('Content-Disposition', 'inline', filename=download_name)
+    if mode == 'x-accel':
+        prefix = Config.FILE_DELIVERY_INTERNAL_PREFIX.rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(relative_path)}"
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(full_path)
+    return response
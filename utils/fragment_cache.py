@@ -0,0 +1,248 @@
+"""Cache for rendered template fragments
+
+Templates mark an expensive region with
+
+    {% cache report_cache_key ~ ':batches' %} ... {% endcache %}
+    {% cache some_key, 60 %} ... {% endcache %}      (TTL in seconds)
+
+and the rendered HTML is kept in FRAGMENT_CACHE_DIR for FRAGMENT_CACHE_TTL
+seconds, shared by every worker on the host. Keys come from fragment_key(),
+which includes the tutor's data_versions counters: the triggers created by
+database.create_data_version_schema bump them on every attendance, student or
+batch write, so a changed report gets a new key instead of a stale hit. The
+template's source is part of every key, so editing a template also starts
+fresh.
+
+To skip the queries as well as the rendering on a hit, views pass the data as
+LazyValue(loader, ...): the loader runs the first time the fragment uses the
+value, which never happens when the fragment comes from the cache.
+
+A key is read before its data is loaded, so a write that lands in between
+stores newer data under the older key; the next request uses the new key.
+
+Cached fragments go back into pages as trusted HTML, so the directory must be
+private: FRAGMENT_CACHE_DIR (default: fragment_cache/ next to DATABASE) is
+created with mode 0700, and one owned by another user is not used at all.
+"""
+import hashlib
+import os
+import random
+import stat
+import tempfile
+import time
+
+from jinja2 import nodes
+from jinja2.exceptions import TemplateNotFound
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from config import Config
+
+SCOPES = ('attendance', 'students', 'batches')
+PRUNE_PROBABILITY = 0.01  # Share of writes that also delete expired fragments
+
+
+class LazyValue:
+    """Value computed by ``loader(*args)`` the first time a template uses it"""
+
+    def __init__(self, loader, *args):
+        self._loader = loader
+        self._args = args
+        self._loaded = False
+        self._value = None
+
+    def get(self):
+        if not self._loaded:
+            self._value = self._loader(*self._args)
+            self._loaded = True
+        return self._value
+
+    def __iter__(self):
+        return iter(self.get())
+
+    def __len__(self):
+        return len(self.get())
+
+    def __bool__(self):
+        return bool(self.get())
+
+    def __getitem__(self, key):
+        return self.get()[key]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+def data_versions(cursor, user_id, scopes=SCOPES):
+    """Return {scope: version} for a tutor; scopes never written yet are 0"""
+    placeholders = ','.join('?' * len(scopes))
+    cursor.execute(f'''
+        SELECT scope, version FROM data_versions WHERE user_id = ? AND scope IN ({placeholders})
+    ''', (user_id, *scopes))
+    versions = dict.fromkeys(scopes, 0)
+    versions.update((row['scope'], row['version']) for row in cursor.fetchall())
+    return versions
+
+
+def fragment_key(cursor, name, user_id, *parts, scopes=SCOPES):
+    """Cache key for a tutor's fragment that changes whenever data in ``scopes`` does
+
+    ``parts`` are anything else the fragment depends on, such as today's date.
+    """
+    versions = data_versions(cursor, user_id, scopes)
+    return ':'.join([name, str(user_id), *(f'{scope}={versions[scope]}' for scope in scopes), *map(str, parts)])
+
+
+_checked_dirs = {}  # Path -> whether it passed _is_private_dir()
+
+
+def _is_private_dir(path):
+    """Create ``path`` with mode 0700, or check an existing one belongs to us
+
+    A directory of ours that others can open is tightened to 0700; a symlink or
+    one owned by another user is refused.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        st = os.lstat(path)
+    except OSError as e:
+        print(f"Fragment cache disabled: cannot create {path}: {e}")
+        return False
+    if not stat.S_ISDIR(st.st_mode):
+        print(f"Fragment cache disabled: {path} is not a directory")
+        return False
+    if not hasattr(os, 'geteuid'):
+        return True  # Windows: no POSIX owner or mode to check
+    if st.st_uid != os.geteuid():
+        print(f"Fragment cache disabled: {path} is owned by another user")
+        return False
+    if st.st_mode & 0o077:
+        try:
+            os.chmod(path, 0o700)
+        except OSError as e:
+            print(f"Fragment cache disabled: cannot make {path} private: {e}")
+            return False
+    return True
+
+
+def cache_dir():
+    """The fragment directory, or None when it is not private (caching is then skipped)
+
+    Checked once per path and process; app.py calls it at startup so a refused
+    directory is reported straight away.
+    """
+    path = Config.FRAGMENT_CACHE_DIR
+    if not path:
+        path = os.path.join(os.path.dirname(os.path.abspath(Config.DATABASE)), 'fragment_cache')
+    if path not in _checked_dirs:
+        _checked_dirs[path] = _is_private_dir(path)
+    return path if _checked_dirs[path] else None
+
+
+def _fragment_path(directory, key):
+    # The database path keeps two deployments on one host (or a benchmark) apart
+    digest = hashlib.sha256(f'{os.path.abspath(Config.DATABASE)}\0{key}'.encode('utf-8')).hexdigest()
+    return os.path.join(directory, f'{digest}.html')
+
+
+def get_fragment(key):
+    """Return the cached HTML for a key, or None if missing, expired or the cache is unusable"""
+    directory = cache_dir()
+    if directory is None:
+        return None
+    path = _fragment_path(directory, key)
+    try:
+        # A fragment file's mtime is set to its expiry time
+        if os.stat(path).st_mtime <= time.time():
+            return None
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def set_fragment(key, html, ttl=None):
+    """Store rendered HTML for ``ttl`` seconds (default FRAGMENT_CACHE_TTL)"""
+    ttl = Config.FRAGMENT_CACHE_TTL if ttl is None else ttl
+    directory = cache_dir()
+    if directory is None:
+        return
+    path = _fragment_path(directory, key)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.fragment-')
+    except OSError as e:
+        print(f"Error caching fragment: {e}")
+        return
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(html)
+        now = time.time()
+        os.utime(tmp_path, (now, now + ttl))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error caching fragment: {e}")
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return
+    if random.random() < PRUNE_PROBABILITY:
+        prune_fragments()
+
+
+def prune_fragments():
+    """Delete expired fragments (old versions are never read again); return how many"""
+    directory = cache_dir()
+    if directory is None:
+        return 0
+    now = time.time()
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime <= now:
+                os.unlink(entry.path)
+                removed += 1
+        except OSError:
+            pass  # Already removed by another worker
+    return removed
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja extension adding ``{% cache key[, ttl] %} ... {% endcache %}``"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        ttl = parser.parse_expression() if parser.stream.skip_if('comma') else nodes.Const(None)
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        salt = nodes.Const(self._template_salt(parser.name, lineno))
+        return nodes.CallBlock(self.call_method('_render', [salt, key, ttl]), [], [], body).set_lineno(lineno)
+
+    def _template_salt(self, name, lineno):
+        """Identify this block and the template source it was compiled from"""
+        source = ''
+        if name and self.environment.loader is not None:
+            try:
+                source = self.environment.loader.get_source(self.environment, name)[0]
+            except TemplateNotFound:
+                pass
+        return hashlib.sha256(f'{name}:{lineno}:{source}'.encode('utf-8')).hexdigest()[:16]
+
+    def _render(self, salt, key, ttl, caller):
+        if not Config.FRAGMENT_CACHE_ENABLED:
+            return caller()
+        full_key = f'{salt}:{key}'
+        html = get_fragment(full_key)
+        if html is not None:
+            return Markup(html)
+        html = caller()
+        set_fragment(full_key, html, ttl)
+        return html
@@ -0,0 +1,138 @@
+"""Liveness and readiness checks for load balancers and orchestrators
+
+/health/live only says the worker answers requests. /health/ready runs the
+checks below and returns 503 when a critical one fails, so the load balancer
+stops sending traffic to an instance before its users see timeouts:
+
+    database    (critical) a read and a BEGIN IMMEDIATE/ROLLBACK, so a
+                write lock held too long fails it, within HEALTH_DB_MAX_MS
+    wal         (critical) the -wal file is under HEALTH_WAL_MAX_MB
+    disk        (critical) at least HEALTH_MIN_FREE_MB free on the disks
+                holding UPLOAD_FOLDER and the database
+    rag_index   an index generation has been built (build_rag_index.py)
+    backlog     images waiting for resized copies (upload_derivatives.py)
+                stay under HEALTH_MAX_BACKLOG
+
+The other two only mark the instance 'degraded' (still 200): the help bot and
+resized images have fallbacks. Results are cached for HEALTH_CACHE_SECONDS per
+worker, so frequent probes mostly cost a dictionary lookup.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+CRITICAL_CHECKS = ('database', 'wal', 'disk')
+
+_cache = {'result': None, 'expires': 0.0}
+_cache_lock = threading.Lock()
+
+
+def check_database():
+    from database import get_db_connection
+
+    start = time.perf_counter()
+    conn = None
+    try:
+        conn = get_db_connection(timeout=Config.HEALTH_DB_TIMEOUT)
+        conn.execute('SELECT id FROM users LIMIT 1').fetchall()
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('ROLLBACK')
+    except sqlite3.Error as e:
+        return {'ok': False, 'error': str(e)}
+    finally:
+        if conn is not None:
+            conn.close()
+    latency_ms = (time.perf_counter() - start) * 1000
+    return {'ok': latency_ms <= Config.HEALTH_DB_MAX_MS, 'latency_ms': round(latency_ms, 1)}
+
+
+def check_wal():
+    try:
+        size = os.path.getsize(Config.DATABASE + '-wal')
+    except OSError:
+        size = 0  # Checkpointed and removed, or not in WAL mode
+    size_mb = size / (1024 * 1024)
+    return {'ok': size_mb <= Config.HEALTH_WAL_MAX_MB, 'size_mb': round(size_mb, 1)}
+
+
+def check_disk():
+    free = {}
+    for path in (Config.UPLOAD_FOLDER, os.path.dirname(os.path.abspath(Config.DATABASE))):
+        try:
+            free[path] = shutil.disk_usage(path).free / (1024 * 1024)
+        except OSError as e:
+            return {'ok': False, 'error': f'{path}: {e}'}
+    return {'ok': min(free.values()) >= Config.HEALTH_MIN_FREE_MB,
+            'free_mb': {path: round(mb) for path, mb in free.items()}}
+
+
+def check_rag_index():
+    from utils.rag_system import get_rag_system
+
+    status = get_rag_system().index_status()
+    return {'ok': status['published'] is not None, **status}
+
+
+def check_backlog():
+    from database import get_db_connection
+
+    conn = get_db_connection(timeout=Config.HEALTH_DB_TIMEOUT)
+    try:
+        pending = conn.execute(
+            "SELECT COUNT(*) FROM upload_blobs WHERE derivative_status IN ('pending', 'processing')"
+        ).fetchone()[0]
+    except sqlite3.Error as e:
+        return {'ok': False, 'error': str(e)}
+    finally:
+        conn.close()
+    return {'ok': pending <= Config.HEALTH_MAX_BACKLOG, 'resize_pending': pending}
+
+
+CHECKS = {
+    'database': check_database,
+    'wal': check_wal,
+    'disk': check_disk,
+    'rag_index': check_rag_index,
+    'backlog': check_backlog,
+}
+
+
+def run_checks():
+    """Run every check now; returns the readiness document"""
+    checks = {}
+    for name, check in CHECKS.items():
+        try:
+            checks[name] = check()
+        except Exception as e:
+            checks[name] = {'ok': False, 'error': str(e)}
+    if not all(checks[name]['ok'] for name in CRITICAL_CHECKS):
+        status = 'unavailable'
+    elif not all(result['ok'] for result in checks.values()):
+        status = 'degraded'
+    else:
+        status = 'ready'
+    return {'status': status, 'checked_at': time.time(), 'checks': checks}
+
+
+def readiness():
+    """The cached readiness document and its HTTP status (503 when unavailable)
+
+    One thread per worker refreshes an expired result; probes arriving
+    meanwhile get the previous one rather than running the checks again.
+    """
+    now = time.monotonic()
+    result = _cache['result']
+    if result is None or now >= _cache['expires']:
+        if _cache_lock.acquire(blocking=result is None):
+            try:
+                if _cache['result'] is None or time.monotonic() >= _cache['expires']:
+                    _cache['result'] = run_checks()
+                    _cache['expires'] = time.monotonic() + Config.HEALTH_CACHE_SECONDS
+            finally:
+                _cache_lock.release()
+        result = _cache['result']
+    return result, 503 if result['status'] == 'unavailable' else 200
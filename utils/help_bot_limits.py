@@ -0,0 +1,118 @@
+"""Concurrency limit and timeout for help bot generation
+
+Gemini calls can take many seconds. Without a cap, a burst of help bot questions
+ties up every gunicorn worker and attendance saves queue behind them. Generation
+therefore runs only while holding one of HELP_BOT_MAX_CONCURRENT slots, shared by
+every worker process and thread on the host through flock()ed slot files, and is
+abandoned after HELP_BOT_TIMEOUT seconds. Callers fall back to the knowledge base
+answer when no slot is free or the deadline passes.
+"""
+import os
+import queue
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: fall back to a per-process limit
+
+from config import Config
+
+_local_semaphore = None
+_local_semaphore_lock = threading.Lock()
+
+
+def _acquire_local_slot(limit):
+    global _local_semaphore
+    with _local_semaphore_lock:
+        if _local_semaphore is None:
+            _local_semaphore = threading.BoundedSemaphore(limit)
+    if _local_semaphore.acquire(blocking=False):
+        return _local_semaphore.release
+    return None
+
+
+def acquire_generation_slot(limit=None, slot_dir=None):
+    """Try to take a generation slot without waiting
+
+    Returns a release callable, or None when all slots are busy. A slot held by a
+    process that dies is freed by the OS along with its file lock.
+    """
+    limit = Config.HELP_BOT_MAX_CONCURRENT if limit is None else limit
+    slot_dir = slot_dir or Config.HELP_BOT_SLOT_DIR
+    if limit <= 0:
+        return lambda: None  # Unlimited
+    if fcntl is None:
+        return _acquire_local_slot(limit)
+
+    os.makedirs(slot_dir, exist_ok=True)
+    for i in range(limit):
+        fd = os.open(os.path.join(slot_dir, f'slot-{i}'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            continue
+
+        def release(fd=fd):
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        return release
+    return None
+
+
+class LimitedGeneration:
+    """Iterate a generation under a slot and a deadline
+
+    ``make_iterable`` is only called once a slot is held, and is consumed on a
+    daemon thread so the caller can stop waiting at the deadline. The slot stays
+    held until that thread finishes, so abandoned calls still count against the
+    limit. After iteration ``status`` is 'ok', 'busy' (no slot) or 'timeout'.
+    """
+
+    _DONE = object()
+
+    def __init__(self, make_iterable, timeout=None, limit=None, slot_dir=None):
+        self.make_iterable = make_iterable
+        self.timeout = Config.HELP_BOT_TIMEOUT if timeout is None else timeout
+        self.limit = limit
+        self.slot_dir = slot_dir
+        self.status = None
+
+    def __iter__(self):
+        release = acquire_generation_slot(self.limit, self.slot_dir)
+        if release is None:
+            self.status = 'busy'
+            print("Help bot generation skipped: all generation slots are busy")
+            return
+
+        items = queue.Queue()
+
+        def produce():
+            try:
+                for item in self.make_iterable():
+                    items.put(item)
+            except Exception as e:
+                print(f"Error during help bot generation: {e}")
+            finally:
+                release()
+                items.put(self._DONE)
+
+        threading.Thread(target=produce, name='niya-generation', daemon=True).start()
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise queue.Empty
+                item = items.get(timeout=remaining)
+            except queue.Empty:
+                self.status = 'timeout'
+                print(f"Help bot generation timed out after {self.timeout}s")
+                return
+            if item is self._DONE:
+                self.status = 'ok'
+                return
+            yield item
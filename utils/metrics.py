@@ -0,0 +1,218 @@
+"""Prometheus metrics shared by all gunicorn workers on the host
+
+Each worker process counts into its own memory-mapped files under
+METRICS_DIR (prometheus_client's multiprocess mode), and /metrics adds up the
+files of every process, so a scrape sees the whole host whichever worker
+answers it. Both gunicorn pools use the same directory, so help bot metrics
+appear in the main pool's /metrics too.
+
+- tuitiontrack_http_request_duration_seconds{endpoint}: latency histogram per
+  Flask endpoint, up to the response headers (streamed bodies not included);
+  tuitiontrack_http_requests_total{endpoint,method,status} and
+  tuitiontrack_http_requests_in_progress beside it
+- tuitiontrack_sql_statements_total / tuitiontrack_sql_seconds_total{endpoint}:
+  the request's SQL trace (utils/sql_trace.py), so divided by the request count
+  they give statements and SQL time per request
+- tuitiontrack_db_write_lock_wait_seconds: time each write transaction waited
+  for the write lock (utils/write_coordinator.py), retries included;
+  tuitiontrack_db_lock_retries_total and tuitiontrack_db_lock_failures_total:
+  BEGIN IMMEDIATE retried after "database is locked", and given up on
+- tuitiontrack_db_checkpoints_total{mode,result}: WAL checkpoints run by the
+  checkpointer (PASSIVE or TRUNCATE; ok, or busy when readers or writers kept
+  it from finishing), with tuitiontrack_db_checkpoint_seconds and
+  tuitiontrack_db_wal_bytes as last measured
+- tuitiontrack_push_notifications_total{result}: sent, expired (410 from the
+  push service) or failed, with tuitiontrack_push_send_seconds
+- tuitiontrack_help_bot_retrievals_total{result}: knowledge base hit or miss
+  (best match above the similarity threshold);
+  tuitiontrack_help_bot_answers_total{source,status}: where the answer came
+  from (model, knowledge_base, default) and how generation ended (ok, busy,
+  timeout, disabled); tuitiontrack_help_bot_model_fallbacks_total{model}: rate
+  limited models the bot moved on from
+
+prometheus_client is optional: without it (or with METRICS_ENABLED off) the
+record_* functions do nothing and /metrics returns 404. The page is closed by
+default: it answers scrapers sending METRICS_TOKEN as a bearer token, or,
+with no token configured, only direct connections from this host (loopback
+without proxy forwarding headers, so nginx on the same host does not count).
+"""
+import hmac
+import os
+import re
+import time
+
+from flask import Response, abort, g, request
+
+from config import Config
+
+# prometheus_client picks multiprocess mode from the environment when it is imported
+if Config.METRICS_ENABLED:
+    os.makedirs(Config.METRICS_DIR, exist_ok=True)
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = Config.METRICS_DIR
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+    from prometheus_client import CONTENT_TYPE_LATEST
+except ImportError:
+    multiprocess = None
+    if Config.METRICS_ENABLED:
+        print("Warning: prometheus_client not installed. /metrics will not be available.")
+
+ENABLED = Config.METRICS_ENABLED and multiprocess is not None
+
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+PROXY_HEADERS = ('X-Forwarded-For', 'X-Real-IP', 'Forwarded')
+
+# Help bot answers can take HELP_BOT_TIMEOUT (20s by default)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Most writes get the lock at once; waits run up to DB_BUSY_TIMEOUT per attempt
+LOCK_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+if ENABLED:
+    REQUEST_DURATION = Histogram('tuitiontrack_http_request_duration_seconds', 'Time to the response headers',
+                                 ['endpoint'], buckets=LATENCY_BUCKETS)
+    REQUESTS = Counter('tuitiontrack_http_requests_total', 'Requests answered', ['endpoint', 'method', 'status'])
+    IN_PROGRESS = Gauge('tuitiontrack_http_requests_in_progress', 'Requests being handled',
+                        multiprocess_mode='livesum')
+    SQL_STATEMENTS = Counter('tuitiontrack_sql_statements_total', 'SQL statements run by requests', ['endpoint'])
+    SQL_SECONDS = Counter('tuitiontrack_sql_seconds_total', 'Time requests spent in SQL', ['endpoint'])
+    WRITE_LOCK_WAIT = Histogram('tuitiontrack_db_write_lock_wait_seconds', 'Time to take the write lock',
+                                buckets=LOCK_BUCKETS)
+    LOCK_RETRIES = Counter('tuitiontrack_db_lock_retries_total', 'BEGIN IMMEDIATE retried while locked')
+    LOCK_FAILURES = Counter('tuitiontrack_db_lock_failures_total', 'Write transactions still locked after every retry')
+    CHECKPOINTS = Counter('tuitiontrack_db_checkpoints_total', 'WAL checkpoints by mode and result', ['mode', 'result'])
+    CHECKPOINT_SECONDS = Histogram('tuitiontrack_db_checkpoint_seconds', 'Time spent in WAL checkpoints',
+                                   buckets=LOCK_BUCKETS)
+    WAL_BYTES = Gauge('tuitiontrack_db_wal_bytes', 'Size of the -wal file', multiprocess_mode='livemostrecent')
+    PUSH_NOTIFICATIONS = Counter('tuitiontrack_push_notifications_total', 'Push notifications by result', ['result'])
+    PUSH_SECONDS = Histogram('tuitiontrack_push_send_seconds', 'Time to hand a notification to the push service',
+                             buckets=LATENCY_BUCKETS)
+    HELP_BOT_RETRIEVALS = Counter('tuitiontrack_help_bot_retrievals_total', 'Knowledge base lookups by result',
+                                  ['result'])
+    HELP_BOT_ANSWERS = Counter('tuitiontrack_help_bot_answers_total', 'Help bot answers by source and generation status',
+                               ['source', 'status'])
+    HELP_BOT_FALLBACKS = Counter('tuitiontrack_help_bot_model_fallbacks_total', 'Rate limited models skipped',
+                                 ['model'])
+
+
+def record_write_lock(seconds):
+    """A write transaction waited ``seconds`` for BEGIN IMMEDIATE (all attempts)"""
+    if ENABLED:
+        WRITE_LOCK_WAIT.observe(seconds)
+
+
+def record_lock_retry(failed=False):
+    """BEGIN IMMEDIATE found the database locked and will be retried, or ``failed`` for good"""
+    if ENABLED:
+        (LOCK_FAILURES if failed else LOCK_RETRIES).inc()
+
+
+def record_checkpoint(mode, wal_bytes, busy=False, seconds=0.0):
+    """The checkpointer measured the -wal file and ran ``mode`` (None: no checkpoint needed)"""
+    if not ENABLED:
+        return
+    WAL_BYTES.set(wal_bytes)
+    if mode:
+        CHECKPOINTS.labels(mode, 'busy' if busy else 'ok').inc()
+        CHECKPOINT_SECONDS.observe(seconds)
+
+
+def record_push(result, seconds):
+    """One push notification: 'sent', 'expired' or 'failed'"""
+    if not ENABLED:
+        return
+    PUSH_NOTIFICATIONS.labels(result).inc()
+    PUSH_SECONDS.observe(seconds)
+
+
+def record_help_bot_retrieval(hit):
+    """A query's best knowledge base match did (or did not) clear the similarity threshold"""
+    if ENABLED:
+        HELP_BOT_RETRIEVALS.labels('hit' if hit else 'miss').inc()
+
+
+def record_help_bot_answer(source, status):
+    """An answer from 'model', 'knowledge_base' or 'default'; status None when Gemini is not configured"""
+    if ENABLED:
+        HELP_BOT_ANSWERS.labels(source, status or 'disabled').inc()
+
+
+def record_help_bot_fallback(model_name):
+    """``model_name`` was rate limited and the next model was tried"""
+    if ENABLED:
+        HELP_BOT_FALLBACKS.labels(model_name).inc()
+
+
+def _start_request():
+    g._metrics_started = time.perf_counter()
+    IN_PROGRESS.inc()
+
+
+def _finish_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return response
+    IN_PROGRESS.dec()
+    endpoint = request.endpoint or 'none'
+    REQUEST_DURATION.labels(endpoint).observe(time.perf_counter() - started)
+    REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+
+    from utils.sql_trace import current_trace
+    trace = current_trace()
+    if trace is not None:
+        SQL_STATEMENTS.labels(endpoint).inc(trace.count)
+        SQL_SECONDS.labels(endpoint).inc(trace.seconds)
+    return response
+
+
+def init_metrics(app):
+    """Time every request; call after init_sql_trace() so its trace is still there when we read it"""
+    if not ENABLED:
+        return
+    app.before_request(_start_request)
+    # after_request handlers run in reverse order: this one before finish_request_trace()
+    app.after_request(_finish_request)
+
+
+def _scrape_allowed():
+    if Config.METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {Config.METRICS_TOKEN}')
+    # Behind a reverse proxy every request arrives from loopback; the proxy's headers give it away
+    return request.remote_addr in LOOPBACK_ADDRESSES and not any(header in request.headers for header in PROXY_HEADERS)
+
+
+def metrics_response():
+    """The /metrics page: every process's metrics from METRICS_DIR in the Prometheus text format"""
+    if not ENABLED:
+        abort(404)
+    if not _scrape_allowed():
+        abort(403)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=Config.METRICS_DIR)
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid):
+    """gunicorn child_exit: drop a dead worker from the in-progress gauge (its counters stay)"""
+    if ENABLED:
+        multiprocess.mark_process_dead(pid, Config.METRICS_DIR)
+
+
+def remove_stale_files():
+    """Delete the metric files of processes no longer running (a previous run's workers)
+
+    Called when a gunicorn pool starts. Files of running processes, such as
+    the other pool's workers, are kept.
+    """
+    if not ENABLED:
+        return
+    for name in os.listdir(Config.METRICS_DIR):
+        match = re.search(r'_(\d+)\.db$', name)
+        if not match:
+            continue
+        try:
+            os.kill(int(match.group(1)), 0)
+        except ProcessLookupError:
+            os.remove(os.path.join(Config.METRICS_DIR, name))
+        except PermissionError:
+            pass  # Running, as another user
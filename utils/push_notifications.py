@@ -3,7 +3,9 @@ from pywebpush import webpush, WebPushException
 import json
 from database import get_db_connection
 from config import Config
+from utils.metrics import record_push
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +25,7 @@ def send_push_notification(subscription_info, title, body, url=None, notificatio
     Returns:
         bool: True if sent successfully, False otherwise
     """
+    start = time.perf_counter()
     try:
         payload = {
             'title': title,
@@ -49,6 +52,7 @@ def send_push_notification(subscription_info, title, body, url=None, notificatio
         )
         
         logger.info(f"Push notification sent successfully: {title}")
+        record_push('sent', time.perf_counter() - start)
         return True
         
     except WebPushException as e:
@@ -56,9 +60,13 @@ def send_push_notification(subscription_info, title, body, url=None, notificatio
         # If subscription is invalid, we might want to remove it
         if e.response and e.response.status_code == 410:  # Gone
             logger.warning("Subscription expired (410), should be removed from database")
+            record_push('expired', time.perf_counter() - start)
+        else:
+            record_push('failed', time.perf_counter() - start)
         return False
     except Exception as e:
         logger.error(f"Error sending push notification: {e}")
+        record_push('failed', time.perf_counter() - start)
         return False
 
 def get_user_subscriptions(user_id):
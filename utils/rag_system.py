@@ -1,15 +1,21 @@
 """RAG (Retrieval-Augmented Generation) system for Niya Help Bot using TF-IDF"""
 import os
 import json
-import pickle
+import shutil
+import threading
+import time
 import numpy as np
+from contextlib import contextmanager
 from typing import List, Dict, Tuple, Optional
 
 try:
-    import faiss
+    import fcntl
 except ImportError:
-    faiss = None
-    print("Warning: faiss-cpu not installed. RAG system will not work.")
+    fcntl = None  # Windows: writers are only serialized within a process
+
+from config import Config
+from utils.help_bot_limits import LimitedGeneration
+from utils.metrics import record_help_bot_answer, record_help_bot_fallback, record_help_bot_retrieval
 
 try:
     from sklearn.feature_extraction.text import TfidfVectorizer
@@ -25,23 +31,156 @@ except ImportError:
     genai = None
     print("Warning: google-generativeai not installed. RAG system will not work.")
 
+
+# Reply used when neither Gemini nor the knowledge base has an answer
+DEFAULT_RESPONSE = "I'm here to help! Could you please rephrase your question? 😊"
+
+# Version of the on-disk index layout written by NiyaRAGSystem._publish(); bump it
+# whenever the files or their meaning change so old generations are rebuilt, not misread
+INDEX_FORMAT_VERSION = 1
+
+# TF-IDF settings that decide how text becomes a vector. They are stored in every
+# generation's manifest so queries are always encoded the way that index was built.
+VECTORIZER_PARAMS = {
+    'lowercase': True,
+    'stop_words': 'english',
+    'token_pattern': r'(?u)\b\w\w+\b',
+    'ngram_range': (1, 2),  # Unigrams and bigrams
+    'norm': 'l2',
+    'use_idf': True,
+    'smooth_idf': True,
+    'sublinear_tf': False,
+}
+
+
+def _atomic_write_text(path: str, text: str):
+    """Write a file so readers see either the old or the new content, never a partial one"""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class FlatIndex:
+    """Exact inner-product search over an embedding matrix, keyed by stable Q&A ids
+
+    Mirrors the faiss ``search`` contract (scores and ids, padded with -1) but
+    works directly on a read-only numpy memmap, so every worker process shares
+    the same physical pages through the OS page cache instead of holding its
+    own copy of the index.
+    """
+
+    def __init__(self, embeddings: np.ndarray, ids: np.ndarray):
+        self.embeddings = embeddings
+        self.ids = ids
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.ids)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = self.ntotal
+        scores = np.full((len(queries), k), -np.inf, dtype='float32')
+        ids = np.full((len(queries), k), -1, dtype='int64')
+        if n == 0 or k <= 0:
+            return scores, ids
+
+        similarities = queries @ self.embeddings.T
+        top_k = min(k, n)
+        top = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        scores[:, :top_k] = np.take_along_axis(top_scores, order, axis=1)
+        ids[:, :top_k] = self.ids[np.take_along_axis(top, order, axis=1)]
+        return scores, ids
+
+
+class StubGenerativeModel:
+    """Stand-in for genai.GenerativeModel that sleeps instead of calling Gemini
+
+    Enabled with NIYA_STUB_MODEL_DELAY=<seconds> to reproduce slow generation
+    locally, e.g. to check that a burst of help bot questions cannot starve
+    the rest of the app.
+    """
+
+    class _Chunk:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, model_name: str, delay: float):
+        self.model_name = model_name
+        self.delay = delay
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        words = f"(Stub reply after {self.delay:g}s from {self.model_name}) I'm Niya, running without Gemini.".split(' ')
+        if not stream:
+            time.sleep(self.delay)
+            return self._Chunk(' '.join(words))
+        return self._stream(words)
+
+    def _stream(self, words):
+        for i, word in enumerate(words):
+            time.sleep(self.delay / len(words))
+            yield self._Chunk(word if i == 0 else ' ' + word)
+
+
+class IndexGeneration:
+    """One immutable version of the help bot index (vectorizer + flat index + Q&A pairs)
+
+    Generations are never modified after they are published; updates build a new
+    generation and swap it in, so in-flight searches keep a consistent view.
+    """
+
+    def __init__(self, vectorizer, index, qa_pairs: List[Dict], embeddings: np.ndarray,
+                 embedding_ids: np.ndarray, stats: Optional[Dict] = None, name: Optional[str] = None,
+                 next_id: int = 1):
+        self.name = name
+        self.vectorizer = vectorizer
+        self.index = index
+        self.qa_pairs = qa_pairs
+        self.embeddings = embeddings
+        self.embedding_ids = embedding_ids
+        # Vocabulary drift since the vectorizer was last fitted
+        self.stats = stats or {'tokens_since_fit': 0, 'oov_tokens_since_fit': 0}
+        self.by_id = {qa['id']: qa for qa in qa_pairs}
+        # Id the next new pair gets; only ever grows, so a removed pair's id is never reused
+        self.next_id = max([next_id] + [qa['id'] + 1 for qa in qa_pairs])
+
+
 class NiyaRAGSystem:
-    """RAG system for Niya help bot using TF-IDF, FAISS and Gemini"""
+    """RAG system for Niya help bot using TF-IDF, a memory-mapped flat index and Gemini"""
     
     def __init__(self):
-        self.vectorizer = None
-        self.index = None
-        self.qa_pairs = []
-        self.embeddings = None
+        self.generation = None
         self.similarity_threshold = 0.75
-        self.faiss_index_path = 'data/niya_faiss.index'
         self.qa_data_path = 'data/niya_qa_pairs.json'
-        self.embeddings_path = 'data/niya_embeddings.pkl'
-        self.vectorizer_path = 'data/niya_vectorizer.pkl'
+        self.index_dir = 'data/niya_index'
+        self.current_pointer_path = os.path.join(self.index_dir, 'CURRENT')
+        
+        # Refit the vectorizer in the background once this share of the tokens
+        # added since the last fit is out-of-vocabulary
+        self.drift_threshold = 0.2
+        self.drift_min_tokens = 20
+        # How often live workers check whether a newer index generation was published
+        self.reload_check_interval = 2.0
+        
+        self._write_lock = threading.Lock()  # Threads of this process; _index_lock() adds the other processes
+        self._reload_lock = threading.Lock()
+        self._model_lock = threading.Lock()  # Guards current_model_index across request threads
+        self._refit_thread = None
+        self._last_reload_check = 0.0
         
         # Initialize Gemini with fallback models
         api_key = os.environ.get('GEMINI_API_KEY', '')
-        if api_key and genai is not None:
+        self.stub_delay = float(Config.NIYA_STUB_MODEL_DELAY) if Config.NIYA_STUB_MODEL_DELAY else None
+        if self.stub_delay is not None:
+            self.models = ['stub']
+            self.current_model_index = 0
+            self.gemini_model = self._model('stub')
+            print(f"Using stub generative model ({self.stub_delay:g}s per answer)")
+        elif api_key and genai is not None:
             try:
                 genai.configure(api_key=api_key)
                 # Model priority: gemini-2.5-flash (primary) -> gemini-2.5-flash-lite -> gemma-3-1b -> gemma-3-2b -> gemma-3-4b
@@ -68,27 +207,46 @@ class NiyaRAGSystem:
         # Create data directory if it doesn't exist
         os.makedirs('data', exist_ok=True)
     
-    def load_vectorizer(self):
-        """Load or create TF-IDF vectorizer"""
+    # Read-only views of the current generation (kept for existing callers)
+    @property
+    def vectorizer(self):
+        return self.generation.vectorizer if self.generation else None
+    
+    @property
+    def index(self):
+        return self.generation.index if self.generation else None
+    
+    @property
+    def qa_pairs(self) -> List[Dict]:
+        return self.generation.qa_pairs if self.generation else []
+    
+    @property
+    def embeddings(self):
+        return self.generation.embeddings if self.generation else None
+    
+    def new_vectorizer(self):
+        """Create an unfitted TF-IDF vectorizer"""
         if TfidfVectorizer is None:
             raise ImportError("scikit-learn is not installed. Install it with: pip install scikit-learn")
         
-        if self.vectorizer is None:
-            # Try to load existing vectorizer
-            if os.path.exists(self.vectorizer_path):
-                with open(self.vectorizer_path, 'rb') as f:
-                    self.vectorizer = pickle.load(f)
-                print("Loaded existing TF-IDF vectorizer")
-            else:
-                # Create new vectorizer
-                self.vectorizer = TfidfVectorizer(
-                    max_features=5000,  # Limit features for memory efficiency
-                    stop_words='english',
-                    ngram_range=(1, 2),  # Unigrams and bigrams
-                    min_df=1,  # Minimum document frequency
-                    max_df=0.95  # Maximum document frequency
-                )
-        return self.vectorizer
+        return TfidfVectorizer(
+            max_features=5000,  # Limit features for memory efficiency
+            min_df=1,  # Minimum document frequency
+            max_df=0.95,  # Maximum document frequency
+            **VECTORIZER_PARAMS
+        )
+    
+    @staticmethod
+    def vectorizer_from_arrays(terms: np.ndarray, idf: np.ndarray, params: Dict):
+        """Rebuild a fitted vectorizer from its vocabulary and idf arrays (no pickle involved)"""
+        if TfidfVectorizer is None:
+            raise ImportError("scikit-learn is not installed. Install it with: pip install scikit-learn")
+        
+        params = dict(params)
+        params['ngram_range'] = tuple(params['ngram_range'])
+        vectorizer = TfidfVectorizer(vocabulary={str(term): i for i, term in enumerate(terms)}, **params)
+        vectorizer.idf_ = np.asarray(idf)
+        return vectorizer
     
     def load_qa_pairs_from_json(self) -> List[Dict]:
         """Load Q&A pairs from JSON file"""
@@ -97,42 +255,213 @@ class NiyaRAGSystem:
                 return json.load(f)
         return []
     
-    def create_embeddings(self, texts: List[str]) -> np.ndarray:
-        """Create TF-IDF embeddings for a list of texts"""
-        vectorizer = self.load_vectorizer()
-        
-        # Fit and transform (or just transform if already fitted)
-        if not hasattr(vectorizer, 'vocabulary_') or len(vectorizer.vocabulary_) == 0:
-            # First time - fit the vectorizer
-            embeddings = vectorizer.fit_transform(texts)
-        else:
-            # Already fitted - just transform
-            embeddings = vectorizer.transform(texts)
-        
-        # Convert to dense numpy array and normalize for cosine similarity
+    def save_qa_pairs_to_json(self, qa_pairs: List[Dict]):
+        """Write Q&A pairs (including their stable ids) back to the source JSON file"""
+        _atomic_write_text(self.qa_data_path, json.dumps(qa_pairs, indent=2, ensure_ascii=False))
+    
+    @staticmethod
+    def assign_ids(qa_pairs: List[Dict], next_id: int = 1) -> List[Dict]:
+        """Give every Q&A pair without an id a new integer id (existing ids never change)
+
+        New ids start at ``next_id`` (a generation's next_id) or above the highest
+        id in the list, whichever is larger.
+        """
+        next_id = max([next_id] + [qa['id'] + 1 for qa in qa_pairs if qa.get('id') is not None])
+        for qa in qa_pairs:
+            if qa.get('id') is None:
+                qa['id'] = next_id
+                next_id += 1
+        return qa_pairs
+    
+    @staticmethod
+    def normalize(embeddings) -> np.ndarray:
+        """Convert sparse TF-IDF rows to dense float32 and L2-normalize for cosine similarity"""
         embeddings_dense = embeddings.toarray().astype('float32')
-        
-        # Normalize for cosine similarity (L2 normalization)
         norms = np.linalg.norm(embeddings_dense, axis=1, keepdims=True)
         norms[norms == 0] = 1  # Avoid division by zero
-        embeddings_dense = embeddings_dense / norms
+        return embeddings_dense / norms
+    
+    def create_embeddings(self, texts: List[str], vectorizer=None) -> np.ndarray:
+        """Create TF-IDF embeddings for a list of texts with an already fitted vectorizer"""
+        vectorizer = vectorizer or self.vectorizer
+        return self.normalize(vectorizer.transform(texts))
+    
+    @staticmethod
+    def count_oov_tokens(vectorizer, texts: List[str]) -> Tuple[int, int]:
+        """Return (total tokens, out-of-vocabulary tokens) for texts under a fitted vectorizer"""
+        analyzer = vectorizer.build_analyzer()
+        total = oov = 0
+        for text in texts:
+            for token in analyzer(text):
+                total += 1
+                if token not in vectorizer.vocabulary_:
+                    oov += 1
+        return total, oov
+    
+    def vocabulary_drift(self, generation: Optional[IndexGeneration] = None) -> float:
+        """Share of tokens added since the last fit that the vectorizer does not know"""
+        generation = generation or self.generation
+        if generation is None:
+            return 0.0
+        total = generation.stats.get('tokens_since_fit', 0)
+        if total < self.drift_min_tokens:
+            return 0.0
+        return generation.stats.get('oov_tokens_since_fit', 0) / total
+    
+    def _fit_generation(self, qa_pairs: List[Dict], next_id: int = 1) -> IndexGeneration:
+        """Fit a fresh vectorizer on all questions and build a new generation from scratch"""
+        vectorizer = self.new_vectorizer()
+        questions = [qa['question'] for qa in qa_pairs]
+        print(f"Creating TF-IDF embeddings for {len(questions)} questions...")
+        embeddings = self.normalize(vectorizer.fit_transform(questions))
+        embedding_ids = np.array([qa['id'] for qa in qa_pairs], dtype='int64')
         
-        return embeddings_dense
+        # Inner product on normalized vectors = cosine similarity
+        index = FlatIndex(embeddings, embedding_ids)
+        return IndexGeneration(vectorizer, index, qa_pairs, embeddings, embedding_ids, next_id=next_id)
     
-    def build_faiss_index(self, qa_pairs: Optional[List[Dict]] = None, force_rebuild: bool = False):
-        """Build or load FAISS index from Q&A pairs"""
-        # Check if index already exists
-        if not force_rebuild and os.path.exists(self.faiss_index_path) and os.path.exists(self.qa_data_path):
-            print("Loading existing FAISS index...")
-            self.index = faiss.read_index(self.faiss_index_path)
-            with open(self.qa_data_path, 'r', encoding='utf-8') as f:
-                self.qa_pairs = json.load(f)
-            if os.path.exists(self.embeddings_path):
-                with open(self.embeddings_path, 'rb') as f:
-                    self.embeddings = pickle.load(f)
-            if os.path.exists(self.vectorizer_path):
-                with open(self.vectorizer_path, 'rb') as f:
-                    self.vectorizer = pickle.load(f)
+    # ------------------------------------------------------------------
+    # Publishing and loading generations
+    # ------------------------------------------------------------------
+    
+    def _read_current_pointer(self) -> Optional[str]:
+        try:
+            with open(self.current_pointer_path, 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+    
+    def _list_generations(self) -> List[str]:
+        if not os.path.isdir(self.index_dir):
+            return []
+        return sorted(name for name in os.listdir(self.index_dir) if name.startswith('gen-'))
+    
+    @contextmanager
+    def _index_lock(self):
+        """Serialize index writers across threads and processes
+
+        Both gunicorn pools and build_rag_index.py publish into the same
+        index_dir. Holding an flock() on its .write.lock while reading the
+        current generation, choosing the next gen-NNNNNN and swapping CURRENT
+        means no two writers share a generation number or build on a stale one.
+        """
+        with self._write_lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.index_dir, exist_ok=True)
+            fd = os.open(os.path.join(self.index_dir, '.write.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)  # Releases the flock
+    
+    def _publish(self, generation: IndexGeneration):
+        """Write a generation to its own directory, then atomically repoint CURRENT at it
+
+        Must be called inside _index_lock().
+
+        Layout (format version 1), all arrays in .npy format:
+            manifest.json   format version, vectorizer params, counts, next id, drift stats
+            vocabulary.npy  terms ordered by TF-IDF column (fixed-width unicode)
+            idf.npy         inverse document frequencies (float64)
+            embeddings.npy  L2-normalized question vectors (float32, rows x terms)
+            ids.npy         Q&A id of each embeddings row (int64)
+            qa_pairs.json   Q&A pairs served by this generation
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        existing = self._list_generations()
+        number = int(existing[-1].split('-')[1]) + 1 if existing else 1
+        name = f"gen-{number:06d}"
+        
+        tmp_dir = os.path.join(self.index_dir, f".{name}.tmp{os.getpid()}")
+        os.makedirs(tmp_dir)
+        vectorizer = generation.vectorizer
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        np.save(os.path.join(tmp_dir, 'vocabulary.npy'), np.array(terms, dtype=str))
+        np.save(os.path.join(tmp_dir, 'idf.npy'), np.asarray(vectorizer.idf_, dtype='float64'))
+        np.save(os.path.join(tmp_dir, 'embeddings.npy'), np.ascontiguousarray(generation.embeddings, dtype='float32'))
+        np.save(os.path.join(tmp_dir, 'ids.npy'), np.asarray(generation.embedding_ids, dtype='int64'))
+        with open(os.path.join(tmp_dir, 'qa_pairs.json'), 'w', encoding='utf-8') as f:
+            json.dump(generation.qa_pairs, f, indent=2, ensure_ascii=False)
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump({'format_version': INDEX_FORMAT_VERSION, 'name': name,
+                       'count': len(generation.qa_pairs), 'next_id': generation.next_id, 'dimension': len(terms),
+                       'vectorizer': VECTORIZER_PARAMS, 'stats': generation.stats,
+                       'created_at': time.time()}, f, indent=2)
+        os.rename(tmp_dir, os.path.join(self.index_dir, name))
+        _atomic_write_text(self.current_pointer_path, name)
+        
+        generation.name = name
+        self.generation = generation
+        self._prune_generations(keep=3)
+        print(f"Published index generation {name} with {len(generation.qa_pairs)} Q&A pairs")
+    
+    def _prune_generations(self, keep: int):
+        """Remove old generations, keeping a few so workers mid-reload can still read them"""
+        for name in self._list_generations()[:-keep]:
+            shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+    
+    def _load_generation(self, name: str) -> IndexGeneration:
+        """Open a published generation; arrays are memory-mapped, nothing is unpickled"""
+        path = os.path.join(self.index_dir, name)
+        with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format {manifest.get('format_version')!r} in {name}; "
+                             "run build_rag_index.py --full")
+        
+        def load_array(filename):
+            return np.load(os.path.join(path, filename), mmap_mode='r', allow_pickle=False)
+        
+        vectorizer = self.vectorizer_from_arrays(load_array('vocabulary.npy'), load_array('idf.npy'),
+                                                 manifest['vectorizer'])
+        embeddings = load_array('embeddings.npy')
+        embedding_ids = load_array('ids.npy')
+        with open(os.path.join(path, 'qa_pairs.json'), 'r', encoding='utf-8') as f:
+            qa_pairs = json.load(f)
+        # Generations written before next_id was stored start above their highest id
+        return IndexGeneration(vectorizer, FlatIndex(embeddings, embedding_ids), qa_pairs,
+                               embeddings, embedding_ids, stats=manifest.get('stats'), name=name,
+                               next_id=manifest.get('next_id', 1))
+    
+    def maybe_reload(self, force: bool = False) -> bool:
+        """Pick up a generation published by another process (cheap: one small file read)
+
+        Returns True if a generation is loaded afterwards.
+        """
+        now = time.monotonic()
+        if not force and self.generation is not None and now - self._last_reload_check < self.reload_check_interval:
+            return True
+        self._last_reload_check = now
+        
+        name = self._read_current_pointer()
+        if name and (self.generation is None or self.generation.name != name):
+            with self._reload_lock:
+                if self.generation is None or self.generation.name != name:
+                    try:
+                        self.generation = self._load_generation(name)
+                        print(f"Loaded index generation {name} ({len(self.generation.qa_pairs)} Q&A pairs)")
+                    except (OSError, ValueError, KeyError) as e:
+                        # Generation was pruned or is mid-publish; keep serving the old one
+                        print(f"Warning: Could not load index generation {name}: {e}")
+        return self.generation is not None
+    
+    def ensure_index_loaded(self) -> bool:
+        """Load the current index generation if needed; False if none has been built yet"""
+        return self.maybe_reload()
+    
+    def index_status(self) -> Dict:
+        """Names of the generation loaded in this process and the published one, without loading it"""
+        return {
+            'loaded': self.generation.name if self.generation is not None else None,
+            'published': self._read_current_pointer()
+        }
+    
+    def build_index(self, qa_pairs: Optional[List[Dict]] = None, force_rebuild: bool = False):
+        """Build or load the index from Q&A pairs"""
+        if self.maybe_reload(force=True) and not force_rebuild:
             print(f"Loaded {len(self.qa_pairs)} Q&A pairs from existing index")
             return
         
@@ -143,67 +472,261 @@ class NiyaRAGSystem:
         if not qa_pairs:
             raise ValueError("No Q&A pairs found. Please create data/niya_qa_pairs.json first.")
         
-        print("Building new FAISS index with TF-IDF...")
-        self.qa_pairs = qa_pairs
+        print("Building new index with TF-IDF...")
+        with self._index_lock():
+            # A full rebuild carries on the published generation's ids
+            self.maybe_reload(force=True)
+            next_id = self.generation.next_id if self.generation is not None else 1
+            qa_pairs = self.assign_ids([dict(qa) for qa in qa_pairs], next_id)
+            self._publish(self._fit_generation(qa_pairs, next_id))
+            self.save_qa_pairs_to_json(qa_pairs)
         
-        # Create TF-IDF embeddings for all questions
-        questions = [qa['question'] for qa in qa_pairs]
-        print(f"Creating TF-IDF embeddings for {len(questions)} questions...")
-        self.embeddings = self.create_embeddings(questions)
+        print(f"Index built and saved with {len(qa_pairs)} Q&A pairs")
+    
+    # Older name, kept for scripts written against the FAISS-backed index
+    build_faiss_index = build_index
+    
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+    
+    def _require_generation(self) -> IndexGeneration:
+        if not self.maybe_reload(force=True):
+            raise ValueError("RAG index not initialized. Please run build_rag_index.py first.")
+        return self.generation
+    
+    def _apply_changes(self, added: List[Dict] = (), updated: List[Dict] = (), removed: List[int] = ()):
+        """Publish a new generation with pairs added/updated/removed, re-embedding only what changed
+
+        Must be called inside _index_lock().
+        """
+        generation = self._require_generation()
+        vectorizer = generation.vectorizer
+        updated_by_id = {qa['id']: qa for qa in updated}
+        for qa_id in list(updated_by_id) + list(removed):
+            if qa_id not in generation.by_id:
+                raise KeyError(f"No Q&A pair with id {qa_id}")
+        
+        # Only question text feeds the index; answer/category edits are metadata only
+        reembed = [qa for qa in updated if qa['question'] != generation.by_id[qa['id']]['question']]
+        reembed += list(added)
+        stale_ids = set(removed) | {qa['id'] for qa in reembed}
         
-        # Save vectorizer
-        with open(self.vectorizer_path, 'wb') as f:
-            pickle.dump(self.vectorizer, f)
+        embeddings = generation.embeddings
+        embedding_ids = generation.embedding_ids
+        if stale_ids:
+            keep = ~np.isin(embedding_ids, np.array(sorted(stale_ids), dtype='int64'))
+            embeddings, embedding_ids = embeddings[keep], embedding_ids[keep]
         
-        # Create FAISS index
-        if faiss is None:
-            raise ImportError("faiss-cpu is not installed. Install it with: pip install faiss-cpu")
-        dimension = self.embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity (already normalized)
+        stats = dict(generation.stats)
+        if reembed:
+            questions = [qa['question'] for qa in reembed]
+            new_ids = np.array([qa['id'] for qa in reembed], dtype='int64')
+            new_embeddings = self.create_embeddings(questions, vectorizer)
+            embeddings = np.vstack([embeddings, new_embeddings])
+            embedding_ids = np.concatenate([embedding_ids, new_ids])
+            
+            total, oov = self.count_oov_tokens(vectorizer, questions)
+            stats['tokens_since_fit'] = stats.get('tokens_since_fit', 0) + total
+            stats['oov_tokens_since_fit'] = stats.get('oov_tokens_since_fit', 0) + oov
         
-        # Add embeddings to index
-        self.index.add(self.embeddings)
+        removed_ids = set(removed)
+        qa_pairs = [updated_by_id.get(qa['id'], qa) for qa in generation.qa_pairs if qa['id'] not in removed_ids]
+        qa_pairs += list(added)
         
-        # Save index and data
-        faiss.write_index(self.index, self.faiss_index_path)
-        with open(self.qa_data_path, 'w', encoding='utf-8') as f:
-            json.dump(qa_pairs, f, indent=2, ensure_ascii=False)
-        with open(self.embeddings_path, 'wb') as f:
-            pickle.dump(self.embeddings, f)
+        index = FlatIndex(embeddings, embedding_ids)
+        new_generation = IndexGeneration(vectorizer, index, qa_pairs, embeddings, embedding_ids, stats,
+                                         next_id=generation.next_id)
+        self._publish(new_generation)
+        self.save_qa_pairs_to_json(qa_pairs)
         
-        print(f"FAISS index built and saved with {len(qa_pairs)} Q&A pairs")
+        drift = self.vocabulary_drift(new_generation)
+        if drift > self.drift_threshold:
+            print(f"Vocabulary drift {drift:.0%} exceeds {self.drift_threshold:.0%}, scheduling refit")
+            self.schedule_refit()
+        return new_generation
+    
+    def add_qa_pair(self, question: str, answer: str, category: Optional[str] = None) -> Dict:
+        """Append a Q&A pair to the live index without refitting the vectorizer"""
+        with self._index_lock():
+            generation = self._require_generation()
+            qa = {'question': question, 'answer': answer, 'category': category}
+            self.assign_ids([qa], generation.next_id)
+            self._apply_changes(added=[qa])
+        return qa
+    
+    def update_qa_pair(self, qa_id: int, question: Optional[str] = None, answer: Optional[str] = None,
+                       category: Optional[str] = None) -> Dict:
+        """Edit a Q&A pair by id; only a changed question is re-embedded"""
+        with self._index_lock():
+            generation = self._require_generation()
+            if qa_id not in generation.by_id:
+                raise KeyError(f"No Q&A pair with id {qa_id}")
+            qa = dict(generation.by_id[qa_id])
+            if question is not None:
+                qa['question'] = question
+            if answer is not None:
+                qa['answer'] = answer
+            if category is not None:
+                qa['category'] = category
+            self._apply_changes(updated=[qa])
+        return qa
+    
+    def remove_qa_pair(self, qa_id: int):
+        """Remove a Q&A pair by id from the live index"""
+        with self._index_lock():
+            self._apply_changes(removed=[qa_id])
+    
+    def sync_qa_pairs(self, qa_pairs: List[Dict]) -> Dict[str, int]:
+        """Bring the index in line with an edited Q&A list, touching only the pairs that changed
+
+        Pairs without an id are treated as new; ids missing from the list are removed.
+        """
+        with self._index_lock():
+            generation = self._require_generation()
+            qa_pairs = self.assign_ids([dict(qa) for qa in qa_pairs], generation.next_id)
+            incoming = {qa['id']: qa for qa in qa_pairs}
+            
+            added = [qa for qa in qa_pairs if qa['id'] not in generation.by_id]
+            updated = [qa for qa in qa_pairs if qa['id'] in generation.by_id and qa != generation.by_id[qa['id']]]
+            removed = [qa_id for qa_id in generation.by_id if qa_id not in incoming]
+            
+            if added or updated or removed:
+                self._apply_changes(added=added, updated=updated, removed=removed)
+        return {'added': len(added), 'updated': len(updated), 'removed': len(removed)}
+    
+    def refit(self):
+        """Refit the vectorizer on all current questions and publish a fresh generation"""
+        with self._index_lock():
+            generation = self._require_generation()
+            print(f"Refitting TF-IDF vectorizer on {len(generation.qa_pairs)} Q&A pairs...")
+            self._publish(self._fit_generation(list(generation.qa_pairs), generation.next_id))
+    
+    def schedule_refit(self):
+        """Run refit() on a background thread (at most one at a time)"""
+        if self._refit_thread is not None and self._refit_thread.is_alive():
+            return
+        
+        def run():
+            try:
+                self.refit()
+            except Exception as e:
+                print(f"Error refitting RAG index: {e}")
+        
+        self._refit_thread = threading.Thread(target=run, name='niya-index-refit', daemon=True)
+        self._refit_thread.start()
+    
+    def wait_for_refit(self, timeout: Optional[float] = None):
+        """Block until a scheduled background refit has finished"""
+        if self._refit_thread is not None:
+            self._refit_thread.join(timeout)
     
     def search_similar(self, query: str, top_k: int = 3) -> List[Tuple[Dict, float]]:
         """Search for similar Q&A pairs using TF-IDF and cosine similarity"""
-        if faiss is None:
-            raise ImportError("faiss-cpu is not installed. Install it with: pip install faiss-cpu")
-        if self.index is None or len(self.qa_pairs) == 0:
+        return self.search_similar_batch([query], top_k=top_k)[0]
+    
+    def search_similar_batch(self, queries: List[str], top_k: int = 3) -> List[List[Tuple[Dict, float]]]:
+        """Search for many queries at once: one sparse transform and one index search
+
+        Returns one result list per query, in the same order as ``queries``.
+        """
+        self.maybe_reload()
+        generation = self.generation
+        if not queries:
             return []
+        if generation is None or len(generation.qa_pairs) == 0:
+            return [[] for _ in queries]
         
-        # Create TF-IDF embedding for query
-        vectorizer = self.load_vectorizer()
-        query_embedding = vectorizer.transform([query])
-        query_embedding_dense = query_embedding.toarray().astype('float32')
-        
-        # Normalize for cosine similarity
-        norm = np.linalg.norm(query_embedding_dense)
-        if norm > 0:
-            query_embedding_dense = query_embedding_dense / norm
+        # Create TF-IDF embeddings for all queries in a single transform
+        query_embeddings = self.create_embeddings(list(queries), generation.vectorizer)
         
-        # Search in FAISS index
-        scores, indices = self.index.search(query_embedding_dense, top_k)
+        # Search the flat index
+        scores, ids = generation.index.search(query_embeddings, top_k)
         
         # Get results with similarity scores
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.qa_pairs) and idx >= 0:
-                similarity = float(score)  # Cosine similarity (0-1)
-                results.append((self.qa_pairs[idx], similarity))
+        batch_results = []
+        for row_scores, row_ids in zip(scores, ids):
+            results = []
+            for score, qa_id in zip(row_scores, row_ids):
+                if qa_id >= 0 and qa_id in generation.by_id:
+                    similarity = float(score)  # Cosine similarity (0-1)
+                    results.append((generation.by_id[qa_id], similarity))
+            batch_results.append(results)
         
-        return results
+        return batch_results
     
-    def get_rag_response(self, user_query: str, user_role: str = 'tutor', context: str = '') -> Dict:
-        """Get response using RAG system with Gemini API"""
+    @staticmethod
+    def is_rate_limit_error(error: Exception) -> bool:
+        """True when a Gemini error means the model's quota is used up and the next one should be tried"""
+        error_str = str(error).lower()
+        return any(keyword in error_str for keyword in [
+            'rate limit', 'quota', '429', 'resource exhausted', 
+            'too many requests', 'per minute', 'per day'
+        ])
+    
+    def _model(self, model_name: str):
+        if self.stub_delay is not None:
+            return StubGenerativeModel(model_name, self.stub_delay)
+        return genai.GenerativeModel(model_name)
+    
+    def _generate_with_fallback(self, prompt: str, stream: bool = False):
+        """Yield (model_name, text) pieces from the first model that answers
+
+        Models are tried in priority order, moving on when one is rate limited.
+        With ``stream=True`` text is yielded chunk by chunk as Gemini produces it;
+        once a model has produced text its errors are no longer retried on another
+        model, since the caller may already have sent that text to the client.
+        Yields nothing when Gemini is unavailable or every model fails.
+        """
+        if not (self.gemini_model and self.models):
+            return
+        
+        # Try current model and fallbacks, from a snapshot so concurrent requests
+        # each walk the whole list once
+        start_index = self.current_model_index
+        for attempt in range(len(self.models)):
+            index = (start_index + attempt) % len(self.models)
+            model_name = self.models[index]
+            produced = False
+            try:
+                model = self._model(model_name)
+                response = model.generate_content(prompt, stream=stream)
+                for chunk in (response if stream else [response]):
+                    if chunk.text:
+                        produced = True
+                        yield model_name, chunk.text
+                return  # Success
+            except Exception as e:
+                if not produced and self.is_rate_limit_error(e) and attempt < len(self.models) - 1:
+                    # Try next model
+                    record_help_bot_fallback(model_name)
+                    self._skip_model(index)
+                    continue
+                # Non-rate-limit error, partial output or last model
+                print(f"Error calling Gemini API ({model_name}): {e}")
+                return
+    
+    def _skip_model(self, index: int):
+        """Make the model after ``index`` the first choice, unless another request already moved on"""
+        with self._model_lock:
+            if self.current_model_index == index:
+                self.current_model_index = (index + 1) % len(self.models)
+                print(f"Rate limit hit on {self.models[index]}, switching to {self.models[self.current_model_index]}")
+    
+    def _generate(self, prompt: str, stream: bool = False) -> LimitedGeneration:
+        """_generate_with_fallback under the shared concurrency limit and timeout
+
+        Iterate the result for (model_name, text) pieces; its ``status`` then says
+        whether generation finished, found no free slot or timed out.
+        """
+        return LimitedGeneration(lambda: self._generate_with_fallback(prompt, stream=stream))
+    
+    def _prepare_response(self, user_query: str, user_role: str, context: str):
+        """Retrieve matches for a query and build the Gemini prompt
+
+        Returns (response_data, top_results, prompt); ``top_results`` is empty when
+        nothing clears the similarity threshold.
+        """
         # Search for similar Q&A pairs
         similar_results = self.search_similar(user_query, top_k=3)
         
@@ -216,88 +739,32 @@ class NiyaRAGSystem:
             'used_rag': len(high_similarity_results) > 0,
             'response': ''
         }
+        record_help_bot_retrieval(response_data['used_rag'])
         
         if high_similarity_results:
             # Use top 3 results for RAG
             top_results = high_similarity_results[:3]
+            response_data['rag_context'] = [qa['question'] for qa, _ in top_results]
             
             # Build context for Gemini
-            context_text = "You are Niya, a cheerful and helpful assistant for TuitionTrack.\n\n"
-            context_text += f"User role: {user_role}\n"
+            prompt = "You are Niya, a cheerful and helpful assistant for TuitionTrack.\n\n"
+            prompt += f"User role: {user_role}\n"
             if context:
-                context_text += f"Context: {context}\n"
-            context_text += "\nRelevant information from knowledge base:\n\n"
+                prompt += f"Context: {context}\n"
+            prompt += "\nRelevant information from knowledge base:\n\n"
             
             for i, (qa, score) in enumerate(top_results, 1):
-                context_text += f"{i}. Question: {qa['question']}\n"
-                context_text += f"   Answer: {qa['answer']}\n\n"
-            
-            context_text += f"\nUser question: {user_query}\n\n"
-            context_text += "Provide a helpful, cheerful response based on the information above. "
-            context_text += "If the information doesn't fully answer the question, provide a general helpful response. "
-            context_text += "Keep the response concise (2-4 sentences) and friendly."
+                prompt += f"{i}. Question: {qa['question']}\n"
+                prompt += f"   Answer: {qa['answer']}\n\n"
             
-            # Get response from Gemini with fallback
-            if self.gemini_model and self.models:
-                response_text = None
-                last_error = None
-                
-                # Try current model and fallbacks
-                for attempt in range(len(self.models)):
-                    try:
-                        model_name = self.models[self.current_model_index]
-                        model = genai.GenerativeModel(model_name)
-                        response = model.generate_content(context_text)
-                        response_text = response.text
-                        response_data['rag_context'] = [qa['question'] for qa, _ in top_results]
-                        response_data['model_used'] = model_name
-                        break  # Success, exit loop
-                    except Exception as e:
-                        last_error = e
-                        error_str = str(e).lower()
-                        
-                        # Check if it's a rate limit error
-                        is_rate_limit = any(keyword in error_str for keyword in [
-                            'rate limit', 'quota', '429', 'resource exhausted', 
-                            'too many requests', 'per minute', 'per day'
-                        ])
-                        
-                        if is_rate_limit and attempt < len(self.models) - 1:
-                            # Try next model
-                            self.current_model_index = (self.current_model_index + 1) % len(self.models)
-                            print(f"Rate limit hit on {self.models[(self.current_model_index - 1) % len(self.models)]}, "
-                                  f"switching to {self.models[self.current_model_index]}")
-                            continue
-                        else:
-                            # Non-rate-limit error or last model, break
-                            print(f"Error calling Gemini API ({self.models[self.current_model_index]}): {e}")
-                            break
-                
-                if response_text:
-                    response_data['response'] = response_text
-                else:
-                    # All models failed, use fallback answer
-                    if top_results:
-                        response_data['response'] = top_results[0][0]['answer']
-                    else:
-                        response_data['response'] = "I'm here to help! Could you please rephrase your question? 😊"
-            else:
-                # No Gemini API, use best match
-                if top_results:
-                    response_data['response'] = top_results[0][0]['answer']
-                else:
-                    response_data['response'] = "I'm here to help! Could you please rephrase your question? 😊"
+            prompt += f"\nUser question: {user_query}\n\n"
+            prompt += "Provide a helpful, cheerful response based on the information above. "
+            prompt += "If the information doesn't fully answer the question, provide a general helpful response. "
+            prompt += "Keep the response concise (2-4 sentences) and friendly."
         else:
             # Low similarity - ask for clarification or provide general response
-            if self.gemini_model and self.models:
-                response_text = None
-                
-                # Try current model and fallbacks
-                for attempt in range(len(self.models)):
-                    try:
-                        model_name = self.models[self.current_model_index]
-                        model = genai.GenerativeModel(model_name)
-                        prompt = f"""You are Niya, a cheerful and helpful assistant for TuitionTrack.
+            top_results = []
+            prompt = f"""You are Niya, a cheerful and helpful assistant for TuitionTrack.
 User role: {user_role}
 Context: {context}
 User question: {user_query}
@@ -308,46 +775,80 @@ The user's question doesn't match any specific help topics. Provide a friendly,
 3. Suggests they browse the help options
 
 Keep it cheerful and helpful!"""
-                        
-                        response = model.generate_content(prompt)
-                        response_text = response.text
-                        response_data['model_used'] = model_name
-                        break  # Success, exit loop
-                    except Exception as e:
-                        error_str = str(e).lower()
-                        
-                        # Check if it's a rate limit error
-                        is_rate_limit = any(keyword in error_str for keyword in [
-                            'rate limit', 'quota', '429', 'resource exhausted', 
-                            'too many requests', 'per minute', 'per day'
-                        ])
-                        
-                        if is_rate_limit and attempt < len(self.models) - 1:
-                            # Try next model
-                            self.current_model_index = (self.current_model_index + 1) % len(self.models)
-                            print(f"Rate limit hit on {self.models[(self.current_model_index - 1) % len(self.models)]}, "
-                                  f"switching to {self.models[self.current_model_index]}")
-                            continue
-                        else:
-                            # Non-rate-limit error or last model
-                            print(f"Error calling Gemini API ({self.models[self.current_model_index]}): {e}")
-                            break
-                
-                if response_text:
-                    response_data['response'] = response_text
-                else:
-                    response_data['response'] = "I'm here to help! Could you please rephrase your question? 😊"
-            else:
-                response_data['response'] = "I'm here to help! Could you please rephrase your question? 😊"
+        
+        return response_data, top_results, prompt
+    
+    def get_rag_response(self, user_query: str, user_role: str = 'tutor', context: str = '') -> Dict:
+        """Get response using RAG system with Gemini API"""
+        response_data, top_results, prompt = self._prepare_response(user_query, user_role, context)
+        
+        if self.gemini_model and self.models:
+            generation = self._generate(prompt)
+            pieces = list(generation)
+            response_data['generation_status'] = generation.status
+            if pieces:
+                response_data['response'] = ''.join(text for _, text in pieces)
+                response_data['model_used'] = pieces[0][0]
+        
+        if response_data['response']:
+            source = 'model'
+        else:
+            # No Gemini API, all models failed, busy or timed out: use best match
+            response_data['response'] = top_results[0][0]['answer'] if top_results else DEFAULT_RESPONSE
+            source = 'knowledge_base' if top_results else 'default'
+        record_help_bot_answer(source, response_data.get('generation_status'))
         
         return response_data
+    
+    def stream_rag_response(self, user_query: str, user_role: str = 'tutor', context: str = ''):
+        """Yield (event, data) pairs for a streamed response
+
+        ``context`` comes first, straight from retrieval, with the best matching
+        knowledge base answer (None below the similarity threshold) so the client
+        can show something before Gemini starts. Then one ``token`` per generated
+        chunk, then ``done`` with the final text. When Gemini produced nothing,
+        ``done`` carries the best match (or the default reply) and ``streamed`` is
+        False.
+        """
+        response_data, top_results, prompt = self._prepare_response(user_query, user_role, context)
+        best_answer = top_results[0][0]['answer'] if top_results else None
+        
+        yield 'context', {
+            'used_rag': response_data['used_rag'],
+            'similarity_scores': response_data['similarity_scores'],
+            'rag_context': response_data.get('rag_context', []),
+            'answer': best_answer
+        }
+        
+        parts = []
+        model_used = None
+        status = None
+        if self.gemini_model and self.models:
+            generation = self._generate(prompt, stream=True)
+            for model_name, text in generation:
+                model_used = model_name
+                parts.append(text)
+                yield 'token', {'text': text}
+            status = generation.status
+        
+        record_help_bot_answer('model' if parts else 'knowledge_base' if best_answer else 'default', status)
+        yield 'done', {
+            'response': ''.join(parts) or best_answer or DEFAULT_RESPONSE,
+            'model_used': model_used,
+            'streamed': bool(parts),
+            'generation_status': status
+        }
 
 # Global RAG system instance
 _rag_system = None
+_rag_system_lock = threading.Lock()
 
 def get_rag_system() -> NiyaRAGSystem:
     """Get or create the global RAG system instance"""
     global _rag_system
     if _rag_system is None:
-        _rag_system = NiyaRAGSystem()
+        # Threaded workers: only the first request loads the index
+        with _rag_system_lock:
+            if _rag_system is None:
+                _rag_system = NiyaRAGSystem()
     return _rag_system
@@ -0,0 +1,191 @@
+"""Per-request SQL instrumentation
+
+Connections that get_db_connection() opens inside a request are
+TracedConnections: every statement a route runs through them is recorded
+with the time spent executing it and fetching its rows. sqlite3's trace
+callback only fires when a statement starts, so the time is measured in the
+cursor methods instead (execute, executemany, executescript, fetch* and
+iteration). When the response goes out:
+
+- a Server-Timing header gives the statement count and SQL time
+  (`db;dur=12.4;desc="9 queries"`) next to the whole request time, so browser
+  dev tools show them for every page
+- statements slower than SQL_SLOW_QUERY_MS are written to the slow-query log
+  as one JSON object per line (logger 'tuitiontrack.sql', or SQL_SLOW_QUERY_LOG)
+- the statement count is checked against the route's query budget:
+  @query_budget(n) on the view, or SQL_QUERY_BUDGET for every route. Going
+  over logs a warning, or raises QueryBudgetExceeded when
+  SQL_QUERY_BUDGET_STRICT is set or the app is testing, failing the request
+
+Statements are logged with their ? placeholders, never their parameters.
+"""
+import json
+import logging
+import sqlite3
+import time
+from collections import defaultdict
+from functools import wraps
+
+from flask import current_app, g, request
+
+from config import Config
+from utils.write_coordinator import CoordinatedConnection, CoordinatedCursor
+
+logger = logging.getLogger('tuitiontrack.sql')
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """A request ran more SQL statements than its route's query budget"""
+
+
+class RequestTrace:
+    """SQL statements run during one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.executions = []  # [sql, seconds] per statement run
+
+    def record(self, sql):
+        entry = [sql, 0.0]
+        self.executions.append(entry)
+        return entry
+
+    @property
+    def count(self):
+        return len(self.executions)
+
+    @property
+    def seconds(self):
+        return sum(seconds for _, seconds in self.executions)
+
+    def slowest(self, limit=3):
+        """[(sql, calls, seconds)] of the statements with the most total time"""
+        totals = defaultdict(lambda: [0, 0.0])
+        for sql, seconds in self.executions:
+            totals[sql][0] += 1
+            totals[sql][1] += seconds
+        ranked = sorted(totals.items(), key=lambda item: -item[1][1])[:limit]
+        return [(sql, calls, seconds) for sql, (calls, seconds) in ranked]
+
+
+class TracedCursor(CoordinatedCursor):
+    """Cursor adding its execute and fetch time to the connection's RequestTrace"""
+
+    _entry = None
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            if self._entry is not None:
+                self._entry[1] += time.perf_counter() - start
+
+    def _start(self, sql):
+        trace = self.connection.trace
+        self._entry = trace.record(sql) if trace is not None else None
+
+    def execute(self, sql, parameters=()):
+        self._start(sql)
+        return self._timed(CoordinatedCursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql)
+        return self._timed(CoordinatedCursor.executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self._start(sql_script)
+        return self._timed(sqlite3.Cursor.executescript, sql_script)
+
+    def fetchone(self):
+        return self._timed(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed(sqlite3.Cursor.fetchall)
+
+    def __next__(self):
+        return self._timed(sqlite3.Cursor.__next__)
+
+
+class TracedConnection(CoordinatedConnection):
+    """Connection whose cursors (including conn.execute()) record into ``trace``"""
+
+    trace = None  # Set by get_db_connection() once the connection is configured
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+
+def current_trace():
+    """The RequestTrace of the current request, or None (outside requests, tracing off)"""
+    return g.get('_sql_trace')
+
+
+def query_budget(statements):
+    """Fail or warn (see module docstring) when a request to this view runs more statements"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            return f(*args, **kwargs)
+        decorated_function.query_budget = statements
+        return decorated_function
+    return decorator
+
+
+def _budget():
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'query_budget', None) or Config.SQL_QUERY_BUDGET
+
+
+def _log(event, trace, **fields):
+    return json.dumps({'event': event, 'method': request.method, 'path': request.path,
+                       'endpoint': request.endpoint, 'queries': trace.count,
+                       'sql_ms': round(trace.seconds * 1000, 2), **fields})
+
+
+def start_request_trace():
+    """before_request: start recording this request's statements"""
+    g._sql_trace = RequestTrace()
+
+
+def finish_request_trace(response):
+    """after_request: Server-Timing header, slow-query log and query budget"""
+    trace = g.pop('_sql_trace', None)
+    if trace is None:
+        return response
+
+    if Config.SQL_SERVER_TIMING:
+        total_ms = (time.perf_counter() - trace.started) * 1000
+        response.headers.add('Server-Timing', f'db;dur={trace.seconds * 1000:.1f};desc="{trace.count} queries"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+
+    threshold = Config.SQL_SLOW_QUERY_MS / 1000
+    for sql, seconds in trace.executions:
+        if seconds >= threshold:
+            logger.warning(_log('slow_query', trace, ms=round(seconds * 1000, 2), sql=' '.join(sql.split())))
+
+    budget = _budget()
+    if budget and trace.count > budget:
+        slowest = [{'sql': ' '.join(sql.split()), 'calls': calls, 'ms': round(seconds * 1000, 2)}
+                   for sql, calls, seconds in trace.slowest()]
+        message = _log('query_budget_exceeded', trace, budget=budget, slowest=slowest)
+        if Config.SQL_QUERY_BUDGET_STRICT or current_app.testing:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return response
+
+
+def init_sql_trace(app):
+    """Trace the SQL of every request (SQL_TRACE_ENABLED) and set up the slow-query log"""
+    if not Config.SQL_TRACE_ENABLED:
+        return
+    if Config.SQL_SLOW_QUERY_LOG:
+        handler = logging.FileHandler(Config.SQL_SLOW_QUERY_LOG)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    app.before_request(start_request_trace)
+    app.after_request(finish_request_trace)
@@ -0,0 +1,184 @@
+"""Resized copies of uploaded homework images
+
+Phone-camera photos are often 3-5 MB at 4000px, while students look at them on
+a phone over mobile data. For every JPEG/PNG in the blob store a background
+thread writes two JPEG copies next to the original:
+
+    <blob path>.display.jpg - longest side UPLOAD_DISPLAY_MAX_SIDE, served by
+                              /uploads/ by default
+    <blob path>.thumb.jpg   - longest side UPLOAD_THUMB_MAX_SIDE, shown in the
+                              homework lists
+
+The original stays available with ?variant=original. A copy that would not be
+smaller than the original is not kept, and the original is served instead.
+
+Work is tracked in upload_blobs.derivative_status, so a file queued in a worker
+that restarts before finishing is picked up by the next worker that starts.
+Requires Pillow; without it every image is served at full size.
+"""
+import os
+import queue
+import tempfile
+import threading
+
+from config import Config
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+    print("Warning: Pillow not installed. Homework images will be served at full size.")
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png'}  # GIFs are left alone so animations keep working
+VARIANTS = ('display', 'thumb')
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def wants_derivatives(path):
+    """Whether resized copies should be made for a blob path"""
+    extension = path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+    return Image is not None and extension in IMAGE_EXTENSIONS
+
+
+def variant_max_side(variant):
+    return Config.UPLOAD_DISPLAY_MAX_SIDE if variant == 'display' else Config.UPLOAD_THUMB_MAX_SIDE
+
+
+def variant_path(cursor, path, variant):
+    """Return (path of the display/thumb copy to serve or None for the original, settled)
+
+    ``settled`` is False while the copies are still being made: the original is
+    served for now, but the same URL will serve the copy later, so it must not
+    be cached as immutable.
+    """
+    if variant not in VARIANTS:
+        return None, True
+    cursor.execute(f'''
+        SELECT derivative_status, {variant}_path AS variant_path FROM upload_blobs WHERE path = ?
+    ''', (path,))
+    row = cursor.fetchone()
+    if not row:
+        return None, True
+    if row['derivative_status'] in ('pending', 'processing'):
+        return None, False
+    return (row['variant_path'] if row['derivative_status'] == 'done' else None), True
+
+
+def _save_jpeg(image, full_path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), prefix='.derivative-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            image.save(out, format='JPEG', quality=Config.UPLOAD_JPEG_QUALITY, optimize=True, progressive=True)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, full_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def generate_derivatives(path):
+    """Write the display and thumbnail copies of a blob; return {variant: path or None}"""
+    source = os.path.join(Config.UPLOAD_FOLDER, path)
+    source_size = os.path.getsize(source)
+    results = {}
+
+    with Image.open(source) as original:
+        # Let the JPEG decoder scale down while decoding instead of at full size
+        display_side = variant_max_side('display')
+        original.draft('RGB', (display_side, display_side))
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # Transparent PNGs get a white background rather than black
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        for variant in VARIANTS:
+            max_side = variant_max_side(variant)
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            variant_rel = f'{path}.{variant}.jpg'
+            full_path = os.path.join(Config.UPLOAD_FOLDER, variant_rel)
+            _save_jpeg(image, full_path)
+            if os.path.getsize(full_path) >= source_size:
+                os.remove(full_path)
+                variant_rel = None
+            results[variant] = variant_rel
+
+    return results
+
+
+def process_blob(conn, path, claim_statuses=('pending',)):
+    """Generate the copies for one blob if it can be claimed; return True if processed"""
+    placeholders = ','.join('?' * len(claim_statuses))
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        UPDATE upload_blobs SET derivative_status = 'processing'
+        WHERE path = ? AND derivative_status IN ({placeholders})
+    ''', (path, *claim_statuses))
+    conn.commit()
+    if not cursor.rowcount:
+        return False  # Another worker has it, or it is already done
+
+    try:
+        results = generate_derivatives(path)
+    except Exception as e:
+        print(f"Error creating resized copies of {path}: {e}")
+        cursor.execute("UPDATE upload_blobs SET derivative_status = 'failed' WHERE path = ?", (path,))
+        conn.commit()
+        return True
+
+    cursor.execute('''
+        UPDATE upload_blobs SET derivative_status = 'done', display_path = ?, thumb_path = ?
+        WHERE path = ?
+    ''', (results['display'], results['thumb'], path))
+    conn.commit()
+    return True
+
+
+def process_pending(conn):
+    """Process every blob still waiting for copies, including ones a dead worker left 'processing'
+
+    Two workers sweeping at once may both redo a left-over blob; the files are
+    replaced atomically, so that only costs time.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT path FROM upload_blobs WHERE derivative_status IN ('pending', 'processing')")
+    paths = [row['path'] for row in cursor.fetchall()]
+    return sum(process_blob(conn, path, ('pending', 'processing')) for path in paths)
+
+
+def _run():
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        process_pending(conn)
+        while True:
+            path = _queue.get()
+            try:
+                process_blob(conn, path)
+            except Exception as e:
+                print(f"Error in upload derivative worker for {path}: {e}")
+            finally:
+                _queue.task_done()
+    finally:
+        conn.close()
+
+
+def enqueue(path):
+    """Queue a blob for resized copies in this process's background worker"""
+    global _worker
+    if Image is None:
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='upload-derivatives', daemon=True)
+            _worker.start()
+    _queue.put(path)
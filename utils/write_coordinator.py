@@ -0,0 +1,200 @@
+"""Write transactions and WAL checkpoints for the SQLite database
+
+Write transactions: connections from database.get_db_connection() use
+CoordinatedCursor. When a statement that writes (INSERT, UPDATE, DELETE or
+REPLACE, the statements sqlite3 opens a transaction for) runs outside a
+transaction, the cursor first issues BEGIN IMMEDIATE, so every write
+transaction holds the write lock from its first statement and the time spent
+waiting for it is measured on its own. BEGIN IMMEDIATE waits up to
+DB_BUSY_TIMEOUT for the lock. If the database is still locked it is retried
+up to DB_WRITE_RETRIES times, sleeping a random time between 0 and
+DB_WRITE_RETRY_DELAY * 2^attempt (capped at DB_WRITE_RETRY_MAX_DELAY) so
+waiting writers do not retry in step. Nothing has run when BEGIN fails, so
+retrying it is always safe. Every route's writes get this without asking.
+
+WAL checkpoints: with many commits and readers always active, SQLite's own
+checkpoints (run by whichever request commits past wal_autocheckpoint pages)
+cannot finish and the -wal file keeps growing, which slows every read. One
+thread per host instead (the first worker to take an flock() on
+<DATABASE>-checkpoint.lock) checks the -wal size every DB_CHECKPOINT_INTERVAL
+seconds and runs
+
+    PASSIVE   over DB_WAL_PASSIVE_MB: copies what it can without waiting on
+              anyone
+    TRUNCATE  over DB_WAL_TRUNCATE_MB: waits (up to DB_CHECKPOINT_BUSY_TIMEOUT)
+              for readers and writers to finish, copies everything and
+              empties the file
+
+Request connections keep SQLite's automatic checkpoint only as a backstop at
+DB_WAL_TRUNCATE_MB, and journal_size_limit shrinks the file back to
+DB_WAL_PASSIVE_MB whenever the log restarts. Lock waits, retries and
+checkpoints are reported by /metrics (utils/metrics.py).
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: every worker checkpoints
+
+from config import Config
+from utils.metrics import record_checkpoint, record_lock_retry, record_write_lock
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def is_locked_error(error):
+    return 'database is locked' in str(error).lower()
+
+
+def backoff_delay(attempt):
+    """Seconds to sleep before retry ``attempt`` (0-based): full jitter on exponential backoff"""
+    return random.uniform(0, min(Config.DB_WRITE_RETRY_MAX_DELAY, Config.DB_WRITE_RETRY_DELAY * 2 ** attempt))
+
+
+def begin_immediate(conn):
+    """Start a write transaction on ``conn``, retrying with backoff while the database is locked"""
+    start = time.perf_counter()
+    for attempt in range(Config.DB_WRITE_RETRIES + 1):
+        try:
+            conn.cursor(sqlite3.Cursor).execute('BEGIN IMMEDIATE')  # Plain cursor: not traced or coordinated
+            break
+        except sqlite3.OperationalError as e:
+            if not is_locked_error(e):
+                raise
+            if attempt == Config.DB_WRITE_RETRIES:
+                record_write_lock(time.perf_counter() - start)
+                record_lock_retry(failed=True)
+                raise
+            record_lock_retry()
+            time.sleep(backoff_delay(attempt))
+    record_write_lock(time.perf_counter() - start)
+
+
+def _starts_write(cursor, sql):
+    return not cursor.connection.in_transaction and sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+
+
+class CoordinatedCursor(sqlite3.Cursor):
+    """Cursor that opens write transactions with begin_immediate()"""
+
+    def execute(self, sql, parameters=()):
+        if _starts_write(self, sql):
+            begin_immediate(self.connection)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if _starts_write(self, sql):
+            begin_immediate(self.connection)
+        return super().executemany(sql, seq_of_parameters)
+
+
+class CoordinatedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute()) are CoordinatedCursors"""
+
+    def cursor(self, factory=CoordinatedCursor):
+        return super().cursor(factory)
+
+    # sqlite3's own shortcuts create a plain cursor without calling cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def configure_wal(conn):
+    """Per-connection WAL settings; SQLite's own checkpoints only as a backstop while the checkpointer runs"""
+    if not Config.DB_CHECKPOINT_ENABLED:
+        return
+    # Pages of the default 4096-byte page size
+    conn.execute(f'PRAGMA wal_autocheckpoint={int(Config.DB_WAL_TRUNCATE_MB * 256)}')
+    conn.execute(f'PRAGMA journal_size_limit={int(Config.DB_WAL_PASSIVE_MB * 1024 * 1024)}')
+
+
+def wal_size(database=None):
+    try:
+        return os.path.getsize((database or Config.DATABASE) + '-wal')
+    except OSError:
+        return 0
+
+
+def checkpoint(conn, database=None):
+    """Checkpoint if the -wal file has reached a threshold; returns the mode run, or None"""
+    size = wal_size(database)
+    if size > Config.DB_WAL_TRUNCATE_MB * 1024 * 1024:
+        mode = 'TRUNCATE'
+    elif size > Config.DB_WAL_PASSIVE_MB * 1024 * 1024:  # journal_size_limit leaves it at most this big
+        mode = 'PASSIVE'
+    else:
+        record_checkpoint(None, size)  # WAL size only
+        return None
+    start = time.perf_counter()
+    try:
+        busy = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()[0]
+    except sqlite3.OperationalError as e:
+        if not is_locked_error(e):
+            raise
+        busy = 1
+    record_checkpoint(mode, wal_size(database), busy=bool(busy), seconds=time.perf_counter() - start)
+    return mode
+
+
+def _hold_checkpoint_lock():
+    """Take the host-wide checkpointer lock without waiting; returns its fd, or None if another worker has it"""
+    if fcntl is None:
+        return -1
+    fd = os.open(Config.DATABASE + '-checkpoint.lock', os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd  # Held until this process exits
+
+
+def _run():
+    # Until this worker holds the lock it only checks whether the holder has exited
+    while _hold_checkpoint_lock() is None:
+        time.sleep(Config.DB_CHECKPOINT_INTERVAL)
+    conn = sqlite3.connect(Config.DATABASE, timeout=Config.DB_CHECKPOINT_BUSY_TIMEOUT)
+    try:
+        while True:
+            try:
+                checkpoint(conn)
+            except sqlite3.Error as e:
+                print(f"Error in WAL checkpointer: {e}")
+            time.sleep(Config.DB_CHECKPOINT_INTERVAL)
+    finally:
+        conn.close()
+
+
+def start_checkpointer():
+    """Start this process's checkpointer thread unless it is running (before_request)"""
+    global _checkpointer
+    if _checkpointer is not None and _checkpointer.is_alive():
+        return
+    with _checkpointer_lock:
+        if _checkpointer is None or not _checkpointer.is_alive():
+            _checkpointer = threading.Thread(target=_run, name='wal-checkpointer', daemon=True)
+            _checkpointer.start()
+
+
+def init_write_coordinator(app):
+    """Start the WAL checkpointer with the first request of each worker (DB_CHECKPOINT_ENABLED)
+
+    Not at import: with GUNICORN_PRELOAD gunicorn imports the app in the
+    master, and threads must only start in the forked workers.
+    """
+    if Config.DB_CHECKPOINT_ENABLED:
+        app.before_request(start_checkpointer)